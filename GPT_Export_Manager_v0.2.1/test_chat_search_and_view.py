@@ -0,0 +1,322 @@
+"""
+Unit tests for chat_search_and_view.py
+"""
+
+import csv
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import chat_search_and_view as viewer
+
+
+ROWS = [
+    ["conv-a", "Urlaub in Österreich", "2024-03-01T10:00:00", "user", "Hallo,\n\"Welt\""],
+    ["conv-a", "Urlaub in Österreich", "2024-03-01T10:00:05", "assistant", "Grüß Gott!\r\nZweite Zeile"],
+    ["conv-b", "Steuern 2024", "2024-04-02T09:00:00", "user", "Frage zur Steuer"],
+    ["conv-a", "Urlaub in Österreich", "2024-03-01T10:01:00", "user", "Nachtrag"],
+]
+
+
+def write_messages_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(["conversation_id", "title", "time", "role", "text"])
+        w.writerows(rows)
+
+
+@pytest.fixture
+def messages_csv():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "messages.csv")
+        write_messages_csv(path, ROWS)
+        yield path
+
+
+def test_index_matches_full_scan(messages_csv):
+    """
+    --find and --export answer from the sidecar index with the same results
+    as the full CSV scan (quoted newlines, non-contiguous rows).
+    """
+    for query in ("österreich", "conv-b", "2024", "nichts"):
+        assert viewer.find_conversations(messages_csv, query) == \
+            viewer.find_conversations(messages_csv, query, use_index=False)
+    for conv_id in ("conv-a", "conv-b", "conv-x"):
+        assert viewer.collect_conversation(messages_csv, conv_id) == \
+            viewer.collect_conversation(messages_csv, conv_id, use_index=False)
+    assert os.path.exists(viewer.index_path_for(messages_csv))
+    assert [m["text"] for m in viewer.collect_conversation(messages_csv, "conv-a")][:2] == \
+        ["Hallo,\n\"Welt\"", "Grüß Gott!\r\nZweite Zeile"]
+
+
+def test_index_invalidated_when_csv_changes(messages_csv):
+    """
+    The index is rebuilt once size or mtime of messages.csv change.
+    """
+    assert viewer.find_conversations(messages_csv, "neu") == []
+    write_messages_csv(messages_csv, ROWS + [["conv-c", "Neues Thema", "", "user", "x"]])
+    assert viewer.find_conversations(messages_csv, "neu") == [("conv-c", "Neues Thema")]
+
+
+def test_fulltext_search(messages_csv):
+    """
+    Full-text search: AND terms, phrases, role filter, case folding and
+    German spelling variants (ß/ss, ü/ue).
+    """
+    def ids(query, **kw):
+        return [(hit[0], hit[3]) for hit in viewer.search_messages(messages_csv, query, **kw)]
+
+    assert ids("GRÜSS gott") == [("conv-a", "assistant")]
+    assert ids("gruess") == [("conv-a", "assistant")]
+    assert ids("\"zweite zeile\"") == [("conv-a", "assistant")]
+    assert ids("\"zeile zweite\"") == []
+    assert ids("frage steuer") == [("conv-b", "user")]
+    assert ids("frage steuer", role="assistant") == []
+    assert ids("nacht*") == [("conv-a", "user")]
+    snippet = viewer.search_messages(messages_csv, "welt")[0][4]
+    assert "[Welt]" in snippet
+
+    # Words with many ß/ss, ä/ae, ö/oe, ü/ue sites: the typed form is never cut off
+    word = "ßssäaeöoeüue"
+    variants = viewer._term_variants(word)
+    assert variants[0] == word and len(variants) == 16 and len(set(variants)) == 16
+    assert viewer._fts_quote(word) in viewer.build_fts_query(word)
+
+
+def test_fulltext_index_appends_incrementally(messages_csv):
+    """
+    Appended rows are indexed without rebuilding; rewriting the file rebuilds.
+    """
+    viewer.update_fulltext_index(messages_csv)
+    with open(messages_csv, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(["conv-c", "Neu", "", "user", "Neuer Eintrag über Bücher"])
+    assert [hit[0] for hit in viewer.search_messages(messages_csv, "buecher")] == ["conv-c"]
+    assert len(viewer.search_messages(messages_csv, "hallo")) == 1  # no duplicates
+
+    write_messages_csv(messages_csv, ROWS[2:])
+    assert viewer.search_messages(messages_csv, "hallo") == []
+
+
+def test_branch_rows_hidden_by_default():
+    """
+    Rows of alternate branches are only returned with branches=True; the CSV
+    order is kept.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "messages.csv")
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            w = csv.writer(f)
+            w.writerow(["conversation_id", "title", "time", "role", "text", "branch"])
+            w.writerow(["c", "T", "2024-01-01T10:00:00", "user", "Frage", ""])
+            w.writerow(["c", "T", "2024-01-01T10:05:00", "assistant", "Neu", ""])
+            w.writerow(["c", "T", "2024-01-01T10:01:00", "assistant", "Alt", "n1"])
+        for use_index in (True, False):
+            assert [m["text"] for m in viewer.collect_conversation(path, "c", use_index)] == ["Frage", "Neu"]
+            assert [m["branch"] for m in viewer.collect_conversation(path, "c", use_index, branches=True)] == \
+                ["", "", "n1"]
+        html_text = viewer.render_html(viewer.collect_conversation(path, "c", branches=True), "T", "c")
+        assert "Zweig n1" in html_text
+
+
+def test_serve_api_pagination_and_etag(messages_csv):
+    """
+    --serve: paginated JSON API for lists and conversations, full-text
+    search, viewer page and ETag revalidation (304).
+    """
+    import json
+    import threading
+    import urllib.error
+    import urllib.request
+
+    server = viewer.make_server(messages_csv, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def get(path, **headers):
+        with urllib.request.urlopen(urllib.request.Request(base + path, headers=headers)) as r:
+            return r.status, r.headers, r.read()
+
+    try:
+        status, headers, body = get("/")
+        assert status == 200 and b"api/conversations" in body
+
+        page = json.loads(get("/api/conversations?limit=1")[2])
+        assert page == {"items": [{"id": "conv-a", "title": "Urlaub in Österreich"}], "offset": 0, "next": 1}
+        page = json.loads(get("/api/conversations?offset=1&limit=1")[2])
+        assert [i["id"] for i in page["items"]] == ["conv-b"] and page["next"] is None
+
+        status, headers, body = get("/api/conversations/conv-a?offset=1&limit=1")
+        page = json.loads(body)
+        assert (page["total"], page["next"]) == (3, 2)
+        assert [m["text"] for m in page["messages"]] == ["Grüß Gott!\r\nZweite Zeile"]
+
+        with pytest.raises(urllib.error.HTTPError) as err:
+            get("/api/conversations/conv-a?offset=1", **{"If-None-Match": headers["ETag"]})
+        assert err.value.code == 304
+        with pytest.raises(urllib.error.HTTPError) as err:
+            get("/api/conversations/conv-x")
+        assert err.value.code == 404
+
+        hits = json.loads(get("/api/search?q=steuer")[2])["items"]
+        assert [(h["id"], h["role"]) for h in hits] == [("conv-b", "user")]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_bulk_export_single_pass(messages_csv):
+    """
+    --bulk-export writes one HTML file per conversation (same content as
+    --export) plus an index page, with and without sidecar index/workers.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, kw in (("serial", {}), ("no_index", {"use_index": False}), ("pool", {"workers": 2})):
+            out = os.path.join(tmpdir, name)
+            entries = viewer.export_conversations(messages_csv, out, **kw)
+            assert sorted((e[0], e[2]) for e in entries) == [("conv-a", 3), ("conv-b", 1)]
+            for conv_id, title, _, filename in entries:
+                with open(os.path.join(out, filename), encoding="utf-8", newline="") as f:
+                    expected = viewer.render_html(viewer.collect_conversation(messages_csv, conv_id), title, conv_id)
+                    assert f.read() == expected
+            with open(os.path.join(out, "index.html"), encoding="utf-8") as f:
+                index_html = f.read()
+            assert "Urlaub in Österreich" in index_html and viewer.export_filename("conv-b") in index_html
+
+        out = os.path.join(tmpdir, "selected")
+        assert [e[0] for e in viewer.export_conversations(messages_csv, out, ids={"conv-b"})] == ["conv-b"]
+        assert sorted(os.listdir(out)) == ["conv-b.html", "index.html"]
+        assert viewer.export_filename("a/b c") != viewer.export_filename("a_b_c")
+
+
+def test_write_html_streams_and_compresses(messages_csv):
+    """
+    write_html produces the same document as render_html, optionally gzip
+    compressed, and keeps only one message in memory at a time.
+    """
+    import gzip
+    import tracemalloc
+
+    conv = viewer.collect_conversation(messages_csv, "conv-a")
+    expected = viewer.render_html(conv, "Urlaub", "conv-a")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        plain, packed = os.path.join(tmpdir, "a.html"), os.path.join(tmpdir, "a.html.gz")
+        assert viewer.write_html(plain, iter(conv), "Urlaub", "conv-a") == 3
+        viewer.write_html(packed, conv, "Urlaub", "conv-a", compress=True)
+        with open(plain, encoding="utf-8", newline="") as f:
+            assert f.read() == expected
+        with gzip.open(packed, "rt", encoding="utf-8", newline="") as f:
+            assert f.read() == expected
+
+        big = ({"role": "user", "time": "", "text": "<ü>" * 300_000} for _ in range(30))
+        tracemalloc.start()
+        try:
+            viewer.write_html(os.path.join(tmpdir, "big.html"), big, "Groß", "big")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert os.path.getsize(os.path.join(tmpdir, "big.html")) > 30 * 300_000 * 8
+        assert peak < 30 * 1024 * 1024  # a few copies of one ~2 MB message, not the whole document
+
+
+def test_partition_pruning_since_until():
+    """
+    --since/--until open only the partitions of a --partition-by split whose
+    time range overlaps; find filters conversations, search filters messages.
+    """
+    import json
+
+    assert viewer.in_period("2024-03-01T10:00:00", "2024-04-02T09:00:00", "2024-04", "2024-04")
+    assert not viewer.in_period("2024-03-01T10:00:00", "2024-03-31T23:00:00", since="2024-04")
+    assert viewer.in_period("2024-03-01T10:00:00", "2024-03-31T23:00:00", until="2024-03")
+    assert not viewer.in_period("", "", since="2024")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        partitions = []
+        for name, rows in (("2024-03", ROWS[:2] + ROWS[3:]), ("2024-04", ROWS[2:3])):
+            os.makedirs(os.path.join(tmpdir, name))
+            write_messages_csv(os.path.join(tmpdir, name, "messages.csv"), rows)
+            times = sorted(row[2] for row in rows)
+            partitions.append({"name": name, "path": name, "conversations": 1,
+                               "first_time": times[0], "last_time": times[-1]})
+        with open(os.path.join(tmpdir, "partitions.json"), "w", encoding="utf-8") as f:
+            json.dump({"partition_by": "month", "partitions": partitions}, f)
+
+        assert len(viewer.select_sources(tmpdir)) == 2
+        assert viewer.select_sources(tmpdir, since="2024-04") == [os.path.join(tmpdir, "2024-04", "messages.csv")]
+        assert viewer.select_sources(tmpdir, until="2024-02") == []
+        assert not os.path.exists(os.path.join(tmpdir, "2024-03", "messages.csv.idx.sqlite"))
+
+        march = os.path.join(tmpdir, "2024-03", "messages.csv")
+        assert viewer.find_conversations(march, "", since="2024-03-01T10:00:30") == [("conv-a", "Urlaub in Österreich")]
+        assert viewer.find_conversations(march, "", since="2024-03-02") == []
+        assert len(viewer.search_messages(march, "nachtrag", since="2024-03-01T10:00:30")) == 1
+        assert viewer.search_messages(march, "hallo", since="2024-03-01T10:00:30") == []
+        assert len(viewer.search_messages(march, "hallo", until="2024-03-01")) == 1
+
+
+def test_grep_parallel_ranges(messages_csv):
+    """
+    --grep scans record-aligned byte ranges (in a process pool) and returns
+    the same hits as a plain scan; literals with quotes, regexes with
+    anchors, case folding and role filter; also over part files.
+    """
+    import json
+    import re
+
+    def expected(rx, role=None):
+        return [(m["conversation_id"], m["title"], m["time"], m["role"]) for m in viewer.read_messages_csv(messages_csv)
+                if rx.search(m["text"]) and (role is None or m["role"] == role)]
+
+    def grep(pattern, workers=1, **kw):
+        matcher = viewer.GrepMatcher(pattern, **kw)
+        return [hit[:4] for hit in viewer.grep_messages(messages_csv, matcher, workers)]
+
+    for workers in (1, 2):
+        assert grep('"Welt"', workers, fixed=True) == expected(re.compile('"Welt"'))
+        assert grep("grüß gott", workers, fixed=True, ignore_case=True) == expected(re.compile("grüß gott", re.I))
+        assert grep(r"^(Hallo|Frage)", workers) == expected(re.compile(r"^(Hallo|Frage)"))
+        assert grep(r"l.,", workers) == expected(re.compile(r"l.,"))
+        assert grep("e", workers, role="user") == expected(re.compile("e"), "user")
+    hit = viewer.grep_messages(messages_csv, viewer.GrepMatcher("Zweite", fixed=True))[0]
+    assert hit[4] == "Grüß Gott!\r\n[Zweite] Zeile"
+    assert len(viewer.grep_messages(messages_csv, viewer.GrepMatcher("e"), limit=2, workers=2)) == 2
+
+    # Without the sidecar index the ranges are cut while reading forward
+    ranges = list(viewer._csv_record_ranges(messages_csv, 64))
+    assert len(ranges) > 1 and all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert ranges[-1][1] == os.path.getsize(messages_csv)
+    run_grep, task_counts = viewer._run_grep, []
+
+    def counting_run_grep(tasks, workers, limit):
+        tasks = list(tasks)
+        task_counts.append(len(tasks))
+        return run_grep(tasks, workers, limit)
+
+    for pattern, kw in (("e", {}), ('"Welt"', {"fixed": True}), (r"^(Hallo|Frage)", {})):
+        indexed = viewer.grep_messages(messages_csv, viewer.GrepMatcher(pattern, **kw), workers=2)
+        viewer._run_grep = counting_run_grep
+        try:
+            unindexed = viewer.grep_messages(messages_csv, viewer.GrepMatcher(pattern, **kw), workers=2,
+                                             use_index=False, range_bytes=64)
+        finally:
+            viewer._run_grep = run_grep
+        assert unindexed == indexed
+    assert min(task_counts) == len(ranges) > 1
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        conversations = [{"id": "c%d" % i, "title": "T%d" % i, "mapping": {"n": {"id": "n", "message": {
+            "author": {"role": "user"}, "create_time": 1700000000 + i,
+            "content": {"parts": ["Größe \"%d\"" % i if i % 3 == 0 else "nichts"]}}}}} for i in range(20)]
+        with open(os.path.join(tmpdir, "conversations_part_001.json"), "w", encoding="utf-8") as f:
+            json.dump(conversations[:10], f)  # ASCII-escaped, without offsets.csv
+        with open(os.path.join(tmpdir, "conversations_part_002.json"), "w", encoding="utf-8") as f:
+            json.dump(conversations[10:], f, ensure_ascii=False)
+        for pattern, kw in (('Größe "1', {"fixed": True}), ('Größe "1', {}),
+                            ('größe "1', {"fixed": True, "ignore_case": True})):
+            matcher = viewer.GrepMatcher(pattern, fmt="json", **kw)
+            assert [hit[0] for hit in viewer.grep_parts(tmpdir, matcher, workers=2)] == ["c12", "c15", "c18"]
+
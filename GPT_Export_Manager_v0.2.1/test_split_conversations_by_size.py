@@ -13,6 +13,7 @@ import sys
 # Import the script's main function
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from split_conversations_by_size import main as split_main
+import split_conversations_by_size as splitter
 
 
 def test_index_boundary_case():
@@ -240,6 +241,779 @@ def test_unicode_line_separator():
             assert "\u2028" in data[0]["title"] or data[0]["title"] == "Test\u2028with\u2029separators"
 
 
+def test_chunked_scanner_matches_json_load():
+    """
+    The chunked scanner must yield the same objects as json.load, also when
+    strings, escapes and braces straddle chunk boundaries.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        conversations = [
+            {"id": "c1", "title": 'Quote " and brace { in title', "mapping": {}},
+            {"id": "c2", "title": "Backslash \\ at end \\", "nested": {"a": [{"b": "}"}]}},
+            {"id": "c3", "title": "Umlaute äöü ß \u2028", "mapping": {"n": {"message": None}}},
+        ]
+        text = json.dumps(conversations, ensure_ascii=False, indent=1)
+        input_file.write_text(text, encoding="utf-8")
+
+        for chunk_size in (1, 2, 5, 64, 1 << 20):
+            assert list(splitter.iter_top_level_objects(str(input_file), chunk_size)) == conversations
+
+        # Offsets point at the raw bytes of each object
+        data = text.encode("utf-8")
+        for offset, raw in splitter.iter_raw_objects(str(input_file), 3):
+            assert data[offset:offset + len(raw)] == raw
+
+
+def test_chunked_scanner_truncated_object():
+    """
+    A truncated object keeps the old error message format.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text('[{"id": "ok"}, {"id": "cut', encoding="utf-8")
+        it = splitter.iter_top_level_objects(str(input_file), 4)
+        assert next(it) == {"id": "ok"}
+        with pytest.raises(RuntimeError, match="JSON-Fehler"):
+            next(it)
+
+
+def test_mmap_scanner_matches_streaming():
+    """
+    --mmap decodes the same objects as the streaming scanner; an empty file
+    (not mappable) falls back to streaming and keeps the error message.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        conversations = [{"id": f"c{i}", "title": "Ä \" { } \\", "mapping": {}} for i in range(5)]
+        input_file.write_text(json.dumps(conversations, ensure_ascii=False), encoding="utf-8")
+        assert list(splitter.iter_top_level_objects(str(input_file), use_mmap=True)) == conversations
+        assert list(splitter.iter_raw_objects(str(input_file), use_mmap=True)) == \
+            list(splitter.iter_raw_objects(str(input_file), 7))
+
+        empty_file = Path(tmpdir) / "empty.json"
+        empty_file.write_bytes(b"")
+        with pytest.raises(ValueError, match="kein JSON-Array"):
+            list(splitter.iter_top_level_objects(str(empty_file), use_mmap=True))
+
+
+def run_split(*args):
+    """Run main() with the given command line arguments."""
+    original_argv = sys.argv
+    try:
+        sys.argv = ["split_conversations_by_size.py", *args]
+        split_main()
+    finally:
+        sys.argv = original_argv
+
+
+def make_conversations(n):
+    return [
+        {
+            "id": f"conv-{i}",
+            "title": f"Unterhaltung {i} – Größe\u2028",
+            "mapping": {
+                f"n{i}-{k}": {
+                    "id": f"n{i}-{k}",
+                    "message": {
+                        "author": {"role": "user" if k % 2 == 0 else "assistant"},
+                        "create_time": 1700000000 + i * 10 + k,
+                        "content": {"parts": ["Text " * (i + k)]},
+                    },
+                }
+                for k in range(3)
+            },
+        }
+        for i in range(n)
+    ]
+
+
+def read_tree(path):
+    return {p.name: p.read_bytes() for p in sorted(Path(path).iterdir())}
+
+
+def test_workers_output_identical(monkeypatch):
+    """
+    --workers N must produce byte-identical output to the serial run.
+    """
+    monkeypatch.setattr(splitter, "PARALLEL_BATCH_BYTES", 500)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(make_conversations(30), ensure_ascii=False), encoding="utf-8")
+        serial, parallel = Path(tmpdir) / "serial", Path(tmpdir) / "parallel"
+        run_split("-i", str(input_file), "-o", str(serial), "--csv", "--max-bytes", "2KB")
+        run_split("-i", str(input_file), "-o", str(parallel), "--csv", "--max-bytes", "2KB", "--workers", "2")
+        assert len(read_tree(serial)) > 3
+        assert read_tree(serial) == read_tree(parallel)
+
+
+def test_part_writer_streams_same_bytes_as_json_dumps():
+    """
+    PartWriter/write_part serialize each conversation once and stream it;
+    the part file must equal the former json.dumps(list) output.
+    """
+    conversations = make_conversations(4)
+    expected = json.dumps(conversations, ensure_ascii=False)
+    expected = expected.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode("utf-8")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fn = splitter.write_part(7, conversations, tmpdir)
+        assert Path(fn).name == "conversations_part_007.json"
+        assert Path(fn).read_bytes() == expected
+
+        writer = splitter.PartWriter(tmpdir, max_convs=3, max_bytes=10**9)
+        names = [writer.add(splitter.encode_conversation(c)) for c in conversations]
+        writer.close()
+        assert names == ["conversations_part_001.json"] * 3 + ["conversations_part_002.json"]
+        part_1 = json.loads((Path(tmpdir) / names[0]).read_text(encoding="utf-8"))
+        assert part_1 == conversations[:3]
+
+
+def test_raw_mode_copies_original_bytes():
+    """
+    --raw writes each object's original bytes and yields the same index.csv
+    as the decoding path.
+    """
+    conversations = make_conversations(5)
+    conversations[1]["mapping"]["n1-0"]["message"]["content"]["parts"] = ['"parts": [ ] \\', {"text": "]["}]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(conversations, ensure_ascii=False, indent=2), encoding="utf-8")
+        raw_dir, std_dir = Path(tmpdir) / "raw", Path(tmpdir) / "std"
+        run_split("-i", str(input_file), "-o", str(raw_dir), "--raw", "--max-convs", "2")
+        run_split("-i", str(input_file), "-o", str(std_dir), "--max-convs", "2")
+
+        assert (raw_dir / "index.csv").read_bytes() == (std_dir / "index.csv").read_bytes()
+        part = (raw_dir / "conversations_part_001.json").read_text(encoding="utf-8")
+        assert json.loads(part) == conversations[:2]
+        assert '\n    "title"' in part  # original indentation kept
+
+        raw = json.dumps(conversations[1]).encode("utf-8")
+        stripped = json.loads(splitter.strip_message_parts(raw))
+        assert stripped["mapping"]["n1-0"]["message"]["content"]["parts"] == []
+        assert splitter.summarize_conversation(stripped) == splitter.summarize_conversation(conversations[1])
+
+
+def test_incremental_resplit():
+    """
+    --incremental appends new/changed conversations, compacts only the parts
+    that held outdated ones and keeps index.csv/messages.csv consistent.
+    """
+    import csv as csv_module
+
+    v1 = make_conversations(6)
+    v2 = [c for c in v1 if c["id"] != "conv-3"] + make_conversations(7)[6:]
+    v2[1] = dict(v2[1], title="Geänderter Titel")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        out = Path(tmpdir) / "out"
+        args = ("-i", str(input_file), "-o", str(out), "--csv", "--max-convs", "2", "--incremental")
+
+        input_file.write_text(json.dumps(v1, ensure_ascii=False), encoding="utf-8")
+        run_split(*args)
+        before = read_tree(out)
+        assert json.loads(before["manifest.json"])["added"] == [c["id"] for c in v1]
+
+        input_file.write_text(json.dumps(v2, ensure_ascii=False), encoding="utf-8")
+        run_split(*args)
+        after = read_tree(out)
+        manifest = json.loads(after["manifest.json"])
+        assert manifest["added"] == ["conv-6"]
+        assert manifest["changed"] == ["conv-1"]
+        assert manifest["removed"] == ["conv-3"]
+        assert manifest["unchanged"] == 4
+        assert manifest["parts_written"] == ["conversations_part_004.json"]
+        assert sorted(manifest["parts_rewritten"]) == ["conversations_part_001.json", "conversations_part_002.json"]
+        assert after["conversations_part_003.json"] == before["conversations_part_003.json"]
+
+        stored = []
+        for name in sorted(after):
+            if name.startswith("conversations_part_"):
+                stored += json.loads(after[name].decode("utf-8"))
+        assert sorted(stored, key=lambda c: c["id"]) == sorted(v2, key=lambda c: c["id"])
+
+        with open(out / "index.csv", newline="", encoding="utf-8-sig") as f:
+            index = {row["conversation_id"]: row for row in csv_module.DictReader(f)}
+        assert set(index) == {c["id"] for c in v2}
+        assert index["conv-1"]["title"] == "Geänderter Titel"
+        assert index["conv-1"]["part_file"] == "conversations_part_004.json"
+
+        with open(out / "messages.csv", newline="", encoding="utf-8-sig") as f:
+            titles = {(row["conversation_id"], row["title"]) for row in csv_module.DictReader(f)}
+        assert titles == {(c["id"], c["title"]) for c in v2}
+
+        # A split made without --incremental has no fingerprints: the first
+        # --incremental run replaces it completely
+        big, plain = make_conversations(30), Path(tmpdir) / "plain"
+        input_file.write_text(json.dumps(big, ensure_ascii=False), encoding="utf-8")
+        run_split("-i", str(input_file), "-o", str(plain), "--csv", "--max-convs", "3", "--partition-by", "month")
+        run_split("-i", str(input_file), "-o", str(plain), "--csv", "--max-convs", "3")
+        splitter.get_conversation(str(plain), "conv-29")  # leaves the offsets sidecar behind
+        input_file.write_text(json.dumps(big[:5], ensure_ascii=False), encoding="utf-8")
+        run_split("-i", str(input_file), "-o", str(plain), "--max-convs", "3", "--incremental")
+        tree = read_tree(plain)
+        assert sorted(tree) == ["conversations_part_001.json", "conversations_part_002.json", "fingerprints.csv",
+                                "index.csv", "manifest.json", "offsets.csv"]
+        assert json.loads(tree["conversations_part_002.json"]) == big[3:5]
+        assert tree["index.csv"].count(b"\n") == 6
+        assert splitter.get_conversation(str(plain), "conv-4") == big[4]
+        assert splitter.get_conversation(str(plain), "conv-29") is None
+
+
+def test_incremental_rebuild_keeps_unrelated_files():
+    """
+    The rebuild fallback of --incremental removes only what the splitter
+    wrote; look-alike files and folders of the user stay, and a folder
+    without an earlier split is not touched at all.
+    """
+    unrelated = {"index.html": b"<html>", "index.js": b"//", "messages.txt": b"notes",
+                 "conversations_part_notes.txt": b"x", "offsets.csv.bak": b"y",
+                 "2023-01/readme.txt": b"z", "messages.columnar.d/keep.bin": b"w"}
+    conversations = make_conversations(6)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(conversations, ensure_ascii=False), encoding="utf-8")
+        for name, with_split in (("fresh", False), ("split", True)):
+            out = Path(tmpdir) / name
+            if with_split:
+                run_split("-i", str(input_file), "-o", str(out), "--csv", "--max-convs", "2", "--columnar",
+                          "--columnar-format", "builtin")
+            for rel, data in unrelated.items():
+                (out / rel).parent.mkdir(parents=True, exist_ok=True)
+                (out / rel).write_bytes(data)
+            run_split("-i", str(input_file), "-o", str(out), "--max-convs", "4", "--incremental")
+            for rel, data in unrelated.items():
+                assert (out / rel).read_bytes() == data
+            assert sorted(p.name for p in out.glob("conversations_part_*.json")) == \
+                ["conversations_part_001.json", "conversations_part_002.json"]
+            assert not (out / "messages.csv").exists() and not (out / "messages.columnar").exists()
+
+
+def test_compressed_input_and_output():
+    """
+    .gz/.xz input is decompressed transparently (also with --mmap); --compress
+    writes compressed parts and CSVs with the same content.
+    """
+    import gzip
+    import lzma
+
+    conversations = make_conversations(8)
+    data = json.dumps(conversations, ensure_ascii=False).encode("utf-8")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        (tmp / "conversations.json").write_bytes(data)
+        (tmp / "conversations.json.gz").write_bytes(gzip.compress(data))
+        (tmp / "conversations.json.xz").write_bytes(lzma.compress(data))
+        for name in ("conversations.json.gz", "conversations.json.xz"):
+            assert list(splitter.iter_top_level_objects(str(tmp / name), 16, use_mmap=True)) == conversations
+
+        run_split("-i", str(tmp / "conversations.json"), "-o", str(tmp / "plain"), "--csv", "--max-convs", "3")
+        run_split("-i", str(tmp / "conversations.json.gz"), "-o", str(tmp / "gz"), "--csv", "--max-convs", "3",
+                  "--compress", "gzip")
+        plain, compressed = read_tree(tmp / "plain"), read_tree(tmp / "gz")
+        assert sorted(compressed) == sorted(name + ".gz" for name in plain)
+        for name, content in plain.items():
+            unpacked = gzip.decompress(compressed[name + ".gz"])
+            if name == "index.csv":
+                unpacked = unpacked.replace(b".json.gz", b".json")
+            assert unpacked == content
+
+
+def test_columnar_builtin_roundtrip():
+    """
+    --columnar-format builtin stores typed columns that match messages.csv
+    and index.csv; filters skip row groups via their time/role statistics.
+    """
+    import csv as csv_module
+
+    conversations = make_conversations(6)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(conversations, ensure_ascii=False), encoding="utf-8")
+        out = Path(tmpdir) / "out"
+        run_split("-i", str(input_file), "-o", str(out), "--csv", "--columnar", "--columnar-format", "builtin")
+
+        messages = splitter.read_columnar(str(out / "messages.columnar"))
+        with open(out / "messages.csv", newline="", encoding="utf-8-sig") as f:
+            rows = list(csv_module.DictReader(f))
+        assert messages["conversation_id"] == [r["conversation_id"] for r in rows]
+        assert messages["role"] == [r["role"] for r in rows]
+        assert messages["text"] == [r["text"] for r in rows]
+        assert [splitter.iso_from_ts(t) for t in messages["time"]] == [r["time"] for r in rows]
+
+        index = splitter.read_columnar(str(out / "index.columnar"), columns=["conversation_id", "messages"])
+        assert index["conversation_id"] == [c["id"] for c in conversations]
+        assert list(index["messages"]) == [3] * 6
+
+        table = Path(tmpdir) / "small.columnar"
+        writer = splitter._BuiltinColumnarTable(str(table), splitter.COLUMNAR_SCHEMAS["messages"], 2)
+        for i in range(6):
+            writer.add((f"c{i}", 100.0 * i, "user" if i < 4 else "assistant", f"Text {i} ✓", ""))
+        writer.add(("c6", None, "tool", "", ""))
+        writer.close()
+        groups = list(splitter.iter_columnar_groups(str(table), ["conversation_id"], since=150, until=350))
+        assert [g["conversation_id"] for g in groups] == [["c2", "c3"]]  # first and last group pruned
+        assert splitter.read_columnar(str(table), ["text"], roles=["assistant"])["text"] == ["Text 4 ✓", "Text 5 ✓"]
+        assert splitter.read_columnar(str(table), ["conversation_id"], roles=["tool"])["conversation_id"] == ["c6"]
+
+
+def test_active_branch_linearization():
+    """
+    Only the thread ending in current_node is counted and exported, in
+    conversation order; --branches appends alternate branches tagged with
+    the id of their first node.
+    """
+    import csv as csv_module
+
+    def node(node_id, parent, children, role, text, ts):
+        message = {"author": {"role": role}, "create_time": ts, "content": {"parts": [text]}}
+        return {"id": node_id, "parent": parent, "children": children, "message": message}
+
+    # dict order deliberately differs from the thread order
+    mapping = {
+        "u2": node("u2", "a1b", [], "user", "Danke", 50),
+        "a1a": node("a1a", "u1", ["u1x"], "assistant", "Erste Antwort", 20),
+        "root": {"id": "root", "parent": None, "children": ["u1"], "message": None},
+        "u1x": node("u1x", "a1a", [], "user", "Nachfrage", 30),
+        "u1": node("u1", "root", ["a1a", "a1b"], "user", "Frage", 10),
+        "a1b": node("a1b", "u1", ["u2"], "assistant", "Neu generiert", 40),
+    }
+    conv = {"id": "conv-t", "title": "Baum", "mapping": mapping, "current_node": "u2"}
+    assert [n["id"] for _, n in splitter.iter_thread(conv)] == ["root", "u1", "a1b", "u2"]
+    assert splitter.summarize_conversation(conv) == (3, 10, 50)
+    assert [(b, n["id"]) for b, n in splitter.iter_thread(conv, branches=True)][4:] == [("a1a", "a1a"), ("a1a", "u1x")]
+
+    # without children lists the tree is derived from the parent links
+    bare = {**conv, "mapping": {k: {kk: vv for kk, vv in v.items() if kk != "children"} for k, v in mapping.items()}}
+    def ids(c):
+        return [(b, n["id"]) for b, n in splitter.iter_thread(c, branches=True)]
+    assert ids(bare) == ids(conv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps([conv], ensure_ascii=False), encoding="utf-8")
+        run_split("-i", str(input_file), "-o", str(Path(tmpdir) / "active"), "--csv")
+        run_split("-i", str(input_file), "-o", str(Path(tmpdir) / "all"), "--csv", "--branches")
+        with open(Path(tmpdir) / "active" / "messages.csv", newline="", encoding="utf-8-sig") as f:
+            assert [r["text"] for r in csv_module.DictReader(f)] == ["Frage", "Neu generiert", "Danke"]
+        with open(Path(tmpdir) / "all" / "messages.csv", newline="", encoding="utf-8-sig") as f:
+            rows = [(r["text"], r["branch"]) for r in csv_module.DictReader(f)]
+        assert rows == [("Frage", ""), ("Neu generiert", ""), ("Danke", ""), ("Erste Antwort", "a1a"),
+                        ("Nachfrage", "a1a")]
+
+
+def test_profile_out_and_progress(capsys):
+    """
+    --progress/--profile-out report stage timings and throughput without
+    changing the output.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(make_conversations(12), ensure_ascii=False), encoding="utf-8")
+        stats_file = Path(tmpdir) / "stats.json"
+        run_split("-i", str(input_file), "-o", str(Path(tmpdir) / "plain"), "--csv", "--max-convs", "5")
+        run_split("-i", str(input_file), "-o", str(Path(tmpdir) / "profiled"), "--csv", "--max-convs", "5",
+                  "--progress", "--profile-out", str(stats_file))
+        assert read_tree(Path(tmpdir) / "plain") == read_tree(Path(tmpdir) / "profiled")
+
+        stats = json.loads(stats_file.read_text(encoding="utf-8"))
+        assert stats["conversations"] == 12
+        assert stats["bytes_scanned"] == stats["input_bytes"] - 1  # everything up to the closing ']'
+        assert set(stats["stages_s"]) == set(splitter.Telemetry.STAGES)
+        assert all(seconds >= 0 for seconds in stats["stages_s"].values())
+        assert "100.0 %" in capsys.readouterr().err
+
+
+def test_clean_text_dispatch_by_content_type():
+    """
+    Text is extracted per content_type; extras adds tool output, placeholders,
+    attachments and citations. Plain text behaves as before.
+    """
+    clean = splitter.clean_text_from_message_content
+    assert clean({"content_type": "text", "parts": ["Hallo"]}) == "Hallo"
+    assert clean({"parts": ["a", {"text": "b"}, {"x": 1}, 3]}) == "a\nb"
+    assert clean(["a", {"text": "b"}]) == "a\nb" and clean("s") == "s" and clean(None) == ""
+    assert clean({"content_type": "code", "language": "python", "text": "print(1)"}) == "print(1)"
+
+    image = {"content_type": "image_asset_pointer", "asset_pointer": "file-service://file-1"}
+    multimodal = {"content_type": "multimodal_text", "parts": [image, "Was ist das?"]}
+    assert clean(multimodal) == "Was ist das?"
+    assert clean(multimodal, extras=True) == "[Bild: file-service://file-1]\nWas ist das?"
+    output = {"content_type": "execution_output", "text": "42"}
+    assert clean(output) == "" and clean(output, extras=True) == "42"
+    quote = {"content_type": "tether_quote", "title": "Doku", "url": "https://example.org", "text": "Zitat"}
+    assert clean(quote) == "Zitat"
+    assert clean(quote, extras=True) == "[Doku https://example.org]\nZitat"
+
+    msg = {"content": {"content_type": "text", "parts": ["Siehe Datei"]},
+           "metadata": {"attachments": [{"name": "bericht.pdf"}],
+                        "citations": [{"metadata": {"title": "Quelle", "url": "https://example.org/q"}}]}}
+    assert splitter.message_text(msg) == "Siehe Datei"
+    assert splitter.message_text(msg, extras=True) == \
+        "Siehe Datei\n[Anhang: bericht.pdf]\n[Quelle: Quelle https://example.org/q]"
+
+    conv = make_conversations(1)[0]
+    conv["mapping"]["tool"] = {"id": "tool", "message": {"author": {"role": "tool"}, "create_time": 1700000009,
+                                                         "content": output}}
+    assert [m[1] for m in splitter.extract_messages(conv)] == ["user", "assistant", "user"]
+    assert [m[1:3] for m in splitter.extract_messages(conv, extras=True)][-1] == ("tool", "42")
+
+
+def test_pipeline_output_identical_and_bounded():
+    """
+    --pipeline writes the same files as the sequential run, re-raises parse
+    errors in order and never queues more than its byte budget.
+    """
+    import threading
+    import time
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(make_conversations(20), ensure_ascii=False), encoding="utf-8")
+        serial, piped = Path(tmpdir) / "serial", Path(tmpdir) / "piped"
+        run_split("-i", str(input_file), "-o", str(serial), "--csv", "--max-bytes", "2KB")
+        run_split("-i", str(input_file), "-o", str(piped), "--csv", "--max-bytes", "2KB",
+                  "--pipeline", "--pipeline-buffer", "1KB")
+        assert read_tree(serial) == read_tree(piped)
+
+        input_file.write_text('[{"id": "ok"}, {"id": broken}]', encoding="utf-8")
+        seen = []
+        with pytest.raises(RuntimeError, match="JSON-Fehler"):
+            for record in splitter.iter_prepared(str(input_file), False, pipeline_bytes=1024):
+                seen.append(record[0])
+        assert seen == ["ok"]
+
+    produced = []
+    lock = threading.Lock()
+
+    def items():
+        for i in range(50):
+            with lock:
+                produced.append(i)
+            yield b"x" * 100
+
+    consumed = 0
+    for _ in splitter._BackgroundIterator(items(), 300, len, "test"):
+        consumed += 1
+        time.sleep(0.002)
+        with lock:
+            assert len(produced) <= consumed + 3 + 1  # 3 queued items plus the one being produced
+    assert consumed == 50
+
+
+def test_memory_budget():
+    """
+    --memory-budget sizes read chunks, worker batches and pipeline queues so
+    that their sum stays within the budget; the output does not change.
+    """
+    mb = 1024 * 1024
+    for budget, workers, pipeline in ((4 * mb, 1, False), (64 * mb, 4, True), (1024 * mb, 8, False)):
+        plan = splitter.plan_memory(budget, workers, pipeline)
+        in_flight = 6 * plan.chunk_size + 2 * workers * 3 * plan.batch_bytes + plan.pipeline_bytes
+        assert in_flight <= budget
+        assert plan.chunk_size <= splitter.CHUNK_SIZE and plan.batch_bytes <= splitter.PARALLEL_BATCH_BYTES
+        assert (plan.pipeline_bytes > 0) == pipeline
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(make_conversations(20), ensure_ascii=False), encoding="utf-8")
+        plain, budgeted = Path(tmpdir) / "plain", Path(tmpdir) / "budgeted"
+        run_split("-i", str(input_file), "-o", str(plain), "--csv", "--max-bytes", "2KB")
+        run_split("-i", str(input_file), "-o", str(budgeted), "--csv", "--max-bytes", "2KB",
+                  "--memory-budget", "4MB", "--workers", "2", "--mmap")
+        assert read_tree(plain) == read_tree(budgeted)
+        with pytest.raises(SystemExit):
+            run_split("-i", str(input_file), "-o", str(budgeted), "--memory-budget", "1MB")
+
+
+def test_offsets_random_access(capsys):
+    """
+    offsets.csv locates every conversation in its part: get_conversation
+    reads just that span (also from compressed parts and after --incremental
+    compacted a part), --get prints the original bytes. Lookups go through an
+    SQLite table next to offsets.csv that is rebuilt when the CSV changes.
+    """
+    import gzip
+
+    conversations = make_conversations(7)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(conversations, ensure_ascii=False, indent=1), encoding="utf-8")
+        out, packed, inc = Path(tmpdir) / "out", Path(tmpdir) / "gz", Path(tmpdir) / "inc"
+        run_split("-i", str(input_file), "-o", str(out), "--max-convs", "3", "--raw")
+        run_split("-i", str(input_file), "-o", str(packed), "--max-convs", "3", "--compress", "gzip")
+        for conv in conversations:
+            assert splitter.get_conversation(str(out), conv["id"]) == conv
+            assert splitter.get_conversation(str(packed), conv["id"]) == conv
+        assert splitter.get_conversation(str(out), "conv-x") is None
+        assert (out / "offsets.csv.idx.sqlite").exists() and (packed / "offsets.csv.gz.idx.sqlite").exists()
+        assert splitter.lookup_offsets(str(out / "offsets.csv"), "conv-4")[0] == 2
+        assert (out / "offsets.csv").read_bytes() != b""
+        assert gzip.decompress((packed / "offsets.csv.gz").read_bytes()).count(b"\n") == 8
+
+        capsys.readouterr()
+        run_split("-o", str(out), "--get", "conv-4")
+        printed = capsys.readouterr().out
+        assert json.loads(printed) == conversations[4]
+        assert printed[:-1].encode("utf-8") in (out / "conversations_part_002.json").read_bytes()
+        with pytest.raises(SystemExit):
+            run_split("-o", str(out), "--get", "conv-x")
+
+        (out / "offsets.csv").unlink()  # split of an older version: scans the part
+        assert splitter.get_conversation(str(out), "conv-5") == conversations[5]
+
+        args = ("-i", str(input_file), "-o", str(inc), "--max-convs", "3", "--incremental")
+        run_split(*args)
+        assert splitter.get_conversation(str(inc), "conv-1") == conversations[1]
+        changed = [c for c in conversations if c["id"] != "conv-1"]
+        input_file.write_text(json.dumps(changed, ensure_ascii=False), encoding="utf-8")
+        run_split(*args)
+        for conv in changed:
+            assert splitter.get_conversation(str(inc), conv["id"]) == conv
+        assert splitter.get_conversation(str(inc), "conv-1") is None
+
+
+def test_resume_after_crash(monkeypatch):
+    """
+    A run that dies mid-way leaves checkpoint.json behind; --resume rolls the
+    outputs back to the last finished part, continues from its input offset
+    (without re-reading earlier conversations) and ends with the same files
+    as an uninterrupted run.
+    """
+    conversations = make_conversations(11)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(conversations, ensure_ascii=False, indent=1), encoding="utf-8")
+        plain, crashed = Path(tmpdir) / "plain", Path(tmpdir) / "crashed"
+        args = ("-i", str(input_file), "--csv", "--max-convs", "3")
+        run_split(*args, "-o", str(plain))
+        assert not (plain / "checkpoint.json").exists()
+
+        prepare, seen = splitter.prepare_conversation, []
+
+        def crash_at_conv_8(conv, *a, **kw):
+            seen.append(conv["id"])
+            if conv["id"] == "conv-8":
+                raise RuntimeError("crash")
+            return prepare(conv, *a, **kw)
+
+        monkeypatch.setattr(splitter, "prepare_conversation", crash_at_conv_8)
+        with pytest.raises(RuntimeError):
+            run_split(*args, "-o", str(crashed))
+        state = json.loads((crashed / "checkpoint.json").read_text(encoding="utf-8"))
+        assert (state["part_idx"], state["conversations"]) == (3, 6)
+
+        monkeypatch.setattr(splitter, "prepare_conversation", prepare)
+        (crashed / "conversations_part_003.json").write_bytes(b"[garbage")
+        run_split(*args, "-o", str(crashed), "--resume", "--workers", "2")
+        assert read_tree(crashed) == read_tree(plain)
+
+        monkeypatch.setattr(splitter, "prepare_conversation", crash_at_conv_8)
+        seen.clear()
+        with pytest.raises(RuntimeError):
+            run_split(*args, "-o", str(crashed))
+        monkeypatch.setattr(splitter, "prepare_conversation", prepare)
+        with pytest.raises(SystemExit):
+            run_split(*args, "-o", str(crashed), "--resume", "--max-convs", "4")
+        seen.clear()
+        monkeypatch.setattr(splitter, "prepare_conversation",
+                            lambda conv, *a, **kw: seen.append(conv["id"]) or prepare(conv, *a, **kw))
+        decode, decoded = splitter.decode_object, []
+        monkeypatch.setattr(splitter, "decode_object", lambda raw: decoded.append(type(raw)) or decode(raw))
+        run_split(*args, "-o", str(crashed), "--resume", "--mmap")
+        monkeypatch.setattr(splitter, "decode_object", decode)
+        assert seen == ["conv-%d" % i for i in range(6, 11)]
+        assert set(decoded) == {memoryview}  # --mmap still decodes from the map with checkpoints on
+        assert read_tree(crashed) == read_tree(plain)
+
+        import gzip
+        packed = Path(tmpdir) / "conversations.json.gz"
+        packed.write_bytes(gzip.compress(input_file.read_bytes()))
+        tail = [raw for _, raw in splitter.iter_raw_objects(str(input_file), start=state["input_offset"])]
+        assert [raw for _, raw in splitter.iter_raw_objects(str(packed), 16, start=state["input_offset"])] == tail
+
+
+def test_partition_by_month():
+    """
+    --partition-by month writes a self-contained split (parts, index.csv,
+    offsets.csv, messages.csv) per month of the first message, an "undatiert"
+    partition for conversations without times, and partitions.json.
+    """
+    import csv as csv_module
+    import datetime as dt
+
+    conversations = make_conversations(6)
+    for i, conv in enumerate(conversations):
+        for node in conv["mapping"].values():
+            node["message"]["create_time"] = None if i == 5 else node["message"]["create_time"] + i * 40 * 86400
+    months = [dt.datetime.fromtimestamp(1700000000 + i * 40 * 86400).strftime("%Y-%m") for i in range(5)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(conversations, ensure_ascii=False), encoding="utf-8")
+        out = Path(tmpdir) / "out"
+        run_split("-i", str(input_file), "-o", str(out), "--csv", "--partition-by", "month")
+
+        partitions = splitter.read_partitions(str(out))
+        assert [p["name"] for p in partitions] == sorted(set(months)) + ["undatiert"]
+        assert sum(p["conversations"] for p in partitions) == 6
+        for i, conv in enumerate(conversations):
+            name = months[i] if i < 5 else "undatiert"
+            with open(out / name / "index.csv", newline="", encoding="utf-8-sig") as f:
+                assert conv["id"] in {row["conversation_id"] for row in csv_module.DictReader(f)}
+            with open(out / name / "messages.csv", newline="", encoding="utf-8-sig") as f:
+                assert conv["id"] in {row["conversation_id"] for row in csv_module.DictReader(f)}
+            assert splitter.get_conversation(str(out), conv["id"]) == conv
+        assert not (out / "index.csv").exists()
+        with pytest.raises(SystemExit):
+            run_split("-i", str(input_file), "-o", str(out), "--partition-by", "year", "--resume")
+
+
+def test_jsonl_parts_and_input():
+    """
+    --format jsonl writes one conversation per line (also for indented input
+    in --raw mode) with line offsets in offsets.csv; JSON Lines input is read
+    directly, chunked, memory-mapped and compressed.
+    """
+    import csv as csv_module
+    import gzip
+
+    conversations = make_conversations(7)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        (tmp / "conversations.json").write_text(json.dumps(conversations, ensure_ascii=False, indent=2),
+                                                encoding="utf-8")
+        for mode in ((), ("--raw",)):
+            out = tmp / ("jsonl" + "".join(mode))
+            run_split("-i", str(tmp / "conversations.json"), "-o", str(out), "--max-convs", "3",
+                      "--format", "jsonl", *mode)
+            part = (out / "conversations_part_001.jsonl").read_bytes()
+            assert [json.loads(line) for line in part.splitlines()] == conversations[:3]
+            with open(out / "offsets.csv", newline="", encoding="utf-8-sig") as f:
+                for row in csv_module.DictReader(f):
+                    data = (out / f"conversations_part_{int(row['part']):03d}.jsonl").read_bytes()
+                    start, end = int(row["offset"]), int(row["offset"]) + int(row["length"])
+                    assert data[start - 1:start] in (b"", b"\n") and data[end:end + 1] == b"\n"
+                    assert json.loads(data[start:end])["id"] == row["conversation_id"]
+            assert splitter.get_conversation(str(out), "conv-5") == conversations[5]
+
+        lines = "\ufeff" + "".join(json.dumps(c, ensure_ascii=False) + "\r\n\n" for c in conversations)
+        (tmp / "input.jsonl").write_text(lines, encoding="utf-8")
+        (tmp / "input.jsonl.gz").write_bytes(gzip.compress(lines.encode("utf-8")))
+        for name, chunk_size, use_mmap in (("input.jsonl", 64, False), ("input.jsonl", 64, True),
+                                           ("input.jsonl.gz", 64, False)):
+            assert list(splitter.iter_top_level_objects(str(tmp / name), chunk_size, use_mmap)) == conversations
+        # The BOM is not part of the first object, whichever reader is used
+        spans = list(splitter.iter_raw_objects(str(tmp / "input.jsonl"), 64, use_mmap=True))
+        assert spans[0][0] == 3 and bytes(spans[0][1]).startswith(b"{")
+        assert [(o, bytes(r)) for o, r in splitter.iter_raw_objects(str(tmp / "input.jsonl"), 64)] == \
+            [(o, bytes(r)) for o, r in spans]
+        for mode in ((), ("--mmap",)):
+            out = tmp / ("bom" + "".join(mode))
+            run_split("-i", str(tmp / "input.jsonl"), "-o", str(out), "--raw", *mode)
+            assert json.loads((out / "conversations_part_001.json").read_bytes()) == conversations
+        assert (tmp / "bom" / "offsets.csv").read_bytes() == (tmp / "bom--mmap" / "offsets.csv").read_bytes()
+
+        run_split("-i", str(tmp / "jsonl" / "conversations_part_002.jsonl"), "-o", str(tmp / "resplit"),
+                  "--format", "jsonl")
+        assert (tmp / "resplit" / "conversations_part_001.jsonl").read_bytes() == \
+            (tmp / "jsonl" / "conversations_part_002.jsonl").read_bytes()
+
+
+def test_stats_report():
+    """
+    --stats writes messages per month/role, characters per model, the length
+    distribution and the longest conversations; --stats-only over the split
+    directory and the pure-array backend (small blocks) give the same result.
+    The messages counted are those of messages.csv (tool rows only with --extras).
+    """
+    import csv as csv_module
+
+    conversations = make_conversations(8)
+    for i, conv in enumerate(conversations):
+        for node in conv["mapping"].values():
+            msg = node["message"]
+            msg["metadata"] = {"model_slug": "gpt-4o" if i % 2 == 0 else "o1"} if msg["author"]["role"] == "assistant" else {}
+            if i == 7:
+                msg["create_time"] = None
+    conversations[3]["mapping"]["n3-3"] = {"id": "n3-3", "message": {
+        "author": {"role": "tool"}, "create_time": 1700000100, "content": {"parts": ["42"]}}}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = Path(tmpdir) / "conversations.json"
+        input_file.write_text(json.dumps(conversations, ensure_ascii=False), encoding="utf-8")
+        out = Path(tmpdir) / "out"
+        run_split("-i", str(input_file), "-o", str(out), "--csv", "--max-convs", "3", "--stats")
+        stats = json.loads((out / "stats.json").read_text(encoding="utf-8"))
+
+        assert (stats["conversations"], stats["messages"]) == (8, 24)
+        assert stats["by_month_role"] == [
+            {"month": "2023-11", "role": "assistant", "messages": 7, "characters": 5 * sum(i + 1 for i in range(7))},
+            {"month": "2023-11", "role": "user", "messages": 14, "characters": 5 * sum(2 * i + 2 for i in range(7))},
+            {"month": "undatiert", "role": "assistant", "messages": 1, "characters": 40},
+            {"month": "undatiert", "role": "user", "messages": 2, "characters": 80},
+        ]
+        assert stats["by_model"] == [{"model": "o1", "messages": 4, "characters": 100, "conversations": 4},
+                                     {"model": "gpt-4o", "messages": 4, "characters": 80, "conversations": 4}]
+        lengths = stats["conversation_lengths"]
+        assert [b["conversations"] for b in lengths["buckets"] if b["messages"] == "2-4"] == [8]
+        assert (lengths["p50"], lengths["max"]) == (3, 3)
+        assert [c["conversation_id"] for c in stats["longest"][:3]] == ["conv-7", "conv-6", "conv-5"]
+        with open(out / "stats_models.csv", newline="", encoding="utf-8-sig") as f:
+            assert [row["model"] for row in csv_module.DictReader(f)] == ["o1", "gpt-4o"]
+        with open(out / "index.csv", newline="", encoding="utf-8-sig") as f:
+            index_counts = sorted(int(row["messages"]) for row in csv_module.DictReader(f))
+        assert sum(index_counts) == stats["messages"] and lengths["max"] == index_counts[-1]
+
+        run_split("-i", str(input_file), "-o", str(Path(tmpdir) / "extras"), "--stats-only", "--extras")
+        extras = json.loads((Path(tmpdir) / "extras" / "stats.json").read_text(encoding="utf-8"))
+        assert {"month": "2023-11", "role": "tool", "messages": 1, "characters": 2} in extras["by_month_role"]
+        assert extras["longest"][0]["conversation_id"] == "conv-3"
+
+        run_split("-i", str(out), "-o", str(Path(tmpdir) / "again"), "--stats-only")
+        assert json.loads((Path(tmpdir) / "again" / "stats.json").read_text(encoding="utf-8")) == stats
+
+        collector = splitter.StatsCollector("array", block=4)
+        for conv in conversations:
+            collector.add(conv["id"], conv["title"], splitter.message_stats(conv))
+        result = collector.result()
+        assert result.pop("backend") == "array"
+        stats.pop("backend")
+        assert result == stats
+        with pytest.raises(SystemExit):
+            run_split("-i", str(input_file), "-o", str(out), "--stats", "--incremental")
+
+
+def test_stats_backends_agree_on_mixed_models():
+    """
+    Conversations using different subsets of the models, in any order and
+    across block boundaries, give the same totals with NumPy and plain arrays.
+    """
+    pytest.importorskip("numpy")
+    import random
+
+    rng = random.Random(7)
+    models = ["gpt-4", "gpt-4o", "o1", ""]
+    conversations = [(f"c{i}", f"T{i}", [(1.7e9 + rng.random() * 1e8 if rng.random() > 0.1 else None,
+                                          rng.choice(["user", "assistant"]), rng.randint(0, 500),
+                                          rng.choice(models[:rng.randint(1, 4)]))
+                                         for _ in range(rng.randint(0, 6))])
+                     for i in range(200)]
+    conversations[:2] = [("a", "A", [(1.7e9, "assistant", 5, "gpt-4"), (1.7e9, "assistant", 7, "gpt-4o")]),
+                         ("b", "B", [(1.7e9, "assistant", 3, "gpt-4")])]
+    for block in (1, 3, 64, splitter.STATS_BLOCK):
+        results = []
+        for backend in ("numpy", "array"):
+            collector = splitter.StatsCollector(backend, block=block)
+            for conversation in conversations:
+                collector.add(*conversation)
+            result = collector.result()
+            result.pop("backend")
+            results.append(result)
+        assert results[0] == results[1]
+    two = splitter.StatsCollector("numpy")
+    for conversation in conversations[:2]:
+        two.add(*conversation)
+    assert {m["model"]: m["conversations"] for m in two.result()["by_model"]} == {"gpt-4": 2, "gpt-4o": 1}
+
+
 if __name__ == "__main__":
     # Run tests with pytest
     pytest.main([__file__, "-v"])
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for split_conversations_by_size.py and chat_search_and_view.py.
+
+Stages:
+  scan_chunked, scan_mmap, scan_legacy   iter_top_level_objects (and the former
+                                         char-by-char scanner) over the input
+  summarize, clean_text, messages_csv,   one pass over all conversations, each
+  write_part                             stage timed on its own
+  build_index, find_conversations,       viewer on the messages.csv written above
+  collect_conversation
+  clean_text_plain, clean_text_legacy,   microbenchmark: content_type dispatch vs.
+  clean_text_multipart                   the former extractor on plain-text messages
+
+The synthetic export is deterministic for a given --size/--seed (branching
+mappings, multipart and tool content, non-ASCII text). Results are printed as
+a table and, with --json-out, saved as JSON; --compare prints the ratio to an
+earlier JSON run.
+
+Usage:
+  python benchmark.py                       # synthetic 50MB input
+  python benchmark.py -i conversations.json --size 200MB --repeat 3
+  python benchmark.py --size 1GB --json-out after.json --compare before.json
+  python benchmark.py --generate-only conversations_10GB.json --size 10GB
+  python benchmark.py --only micro
+"""
+import argparse, csv, io, json, os, platform, random, sys, tempfile, time
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import chat_search_and_view as viewer
+from split_conversations_by_size import (
+    CHUNK_SIZE, MESSAGES_HEADER, clean_text_from_message_content, csv_rows, extract_messages,
+    iter_top_level_objects, parse_size, summarize_conversation, write_part,
+)
+
+
+def legacy_iter_top_level_objects(path: str) -> Iterator[Dict[str, Any]]:
+    """The original f.read(1) scanner, kept as benchmark baseline."""
+    with open(path, "r", encoding="utf-8") as f:
+        ch = f.read(1)
+        while ch and ch != '[':
+            ch = f.read(1)
+        if ch != '[':
+            raise ValueError("Datei ist kein JSON-Array.")
+        while True:
+            ch = f.read(1)
+            if not ch:
+                return
+            if ch.isspace():
+                continue
+            if ch == ']':
+                return
+            break
+        while True:
+            buf = io.StringIO()
+            depth = 0
+            in_str = False
+            esc = False
+            while True:
+                if not ch:
+                    break
+                buf.write(ch)
+                if in_str:
+                    if esc:
+                        esc = False
+                    elif ch == "\\":
+                        esc = True
+                    elif ch == '"':
+                        in_str = False
+                else:
+                    if ch == '"':
+                        in_str = True
+                    elif ch == '{':
+                        depth += 1
+                    elif ch == '}':
+                        depth -= 1
+                        if depth == 0:
+                            break
+                ch = f.read(1)
+            obj_text = buf.getvalue()
+            if obj_text.strip():
+                yield json.loads(obj_text)
+            while True:
+                ch = f.read(1)
+                if not ch:
+                    return
+                if ch.isspace():
+                    continue
+                if ch == ',':
+                    while True:
+                        ch = f.read(1)
+                        if not ch:
+                            return
+                        if ch.isspace():
+                            continue
+                        break
+                    if ch == ']':
+                        return
+                    break
+                elif ch == ']':
+                    return
+                else:
+                    break
+
+
+# Vocabulary for the synthetic texts: umlauts, quotes, escapes, braces and
+# non-BMP characters exercise the scanner's string handling.
+WORDS = ["Hallo", "Größe", "Übersicht", "straße", "export", "\"quoted\"", "a\\b", "{json}", "[liste]", "✓",
+         "data", "Ärger", "naïve", "東京", "😀", "Résumé", "Ωmega", "tab\there", "zeile\numbruch", "ok"]
+
+
+def _text(rnd: random.Random, lo: int, hi: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(lo, hi)))
+
+
+def _content(rnd: random.Random, role: str) -> Dict[str, Any]:
+    if role == "tool":
+        return {"content_type": "execution_output", "text": _text(rnd, 5, 80)}
+    kind = rnd.random()
+    if role == "assistant" and kind < 0.1:
+        return {"content_type": "code", "language": "python", "text": _text(rnd, 10, 120)}
+    if role == "user" and kind < 0.1:
+        image = {"content_type": "image_asset_pointer", "asset_pointer": f"file-service://file-{rnd.getrandbits(64):x}",
+                 "size_bytes": rnd.randint(10_000, 2_000_000), "width": 1024, "height": 768}
+        return {"content_type": "multimodal_text", "parts": [image, _text(rnd, 5, 60)]}
+    if kind < 0.2:
+        return {"content_type": "text", "parts": [_text(rnd, 5, 150), {"text": _text(rnd, 5, 50)}]}
+    return {"content_type": "text", "parts": [_text(rnd, 5, 400)]}
+
+
+def synthetic_conversation(rnd: random.Random, n: int) -> Dict[str, Any]:
+    """One conversation with a system root, user/assistant turns, tool calls
+    and regenerated answers (alternate branches)."""
+    base = 1_700_000_000 + n * 3600
+    mapping: Dict[str, Any] = {}
+
+    def add(node_id, parent, role, ts):
+        mapping[node_id] = {
+            "id": node_id,
+            "parent": parent,
+            "children": [],
+            "message": None if role is None else {
+                "id": node_id,
+                "author": {"role": role, "name": "python" if role == "tool" else None},
+                "create_time": ts,
+                "content": _content(rnd, role),
+                "status": "finished_successfully",
+                "metadata": {},
+            },
+        }
+        if parent is not None:
+            mapping[parent]["children"].append(node_id)
+
+    root = f"c{n}-root"
+    add(root, None, None, None)
+    parent, k = root, 0
+    for turn in range(rnd.randint(1, 20)):
+        ts = base + turn * 60
+        user = f"c{n}-{k}"; k += 1
+        add(user, parent, "user", ts)
+        parent = user
+        if rnd.random() < 0.15:
+            tool = f"c{n}-{k}"; k += 1
+            add(tool, parent, "tool", ts + 5)
+            parent = tool
+        for _ in range(1 + (rnd.random() < 0.2) + (rnd.random() < 0.05)):  # regenerated answers
+            answer = f"c{n}-{k}"; k += 1
+            add(answer, parent, "assistant", ts + 10 + k)
+        parent = answer  # the last regeneration is the active one
+    return {
+        "title": f"Unterhaltung {n}: {_text(rnd, 1, 5)}",
+        "create_time": base,
+        "update_time": base + 3600,
+        "mapping": mapping,
+        "current_node": parent,
+        "id": f"conv-{n:07d}",
+        "conversation_id": f"conv-{n:07d}",
+    }
+
+
+def legacy_clean_text_from_message_content(content: Any) -> str:
+    """The former extractor (before the content_type dispatch table), kept as baseline."""
+    if content is None:
+        return ""
+    if isinstance(content, dict) and "parts" in content:
+        parts = content.get("parts", [])
+        texts = []
+        for p in parts:
+            if isinstance(p, str):
+                texts.append(p)
+            elif isinstance(p, dict):
+                if "text" in p and isinstance(p["text"], str):
+                    texts.append(p["text"])
+        return "\n".join(texts)
+    if isinstance(content, list):
+        texts = []
+        for p in content:
+            if isinstance(p, str):
+                texts.append(p)
+            elif isinstance(p, dict):
+                if "text" in p and isinstance(p["text"], str):
+                    texts.append(p["text"])
+        return "\n".join(texts)
+    if isinstance(content, str):
+        return content
+    return ""
+
+
+def write_synthetic_export(path: str, target_bytes: int, seed: int = 42) -> int:
+    """Write a conversations.json of roughly `target_bytes` (streamed, any size).
+
+    The same size and seed always produce the same file. Returns the number of
+    conversations written.
+    """
+    rnd = random.Random(seed)
+    written = 0
+    n = 0
+    with open(path, "w", encoding="utf-8") as w:
+        w.write("[")
+        while written < target_bytes:
+            text = (", " if n else "") + json.dumps(synthetic_conversation(rnd, n), ensure_ascii=False)
+            w.write(text)
+            written += len(text.encode("utf-8"))
+            n += 1
+        w.write("]")
+    return n
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+def result(name: str, seconds: float, items: int, nbytes: int = 0) -> Dict[str, Any]:
+    rss = peak_rss_mb()
+    entry = {
+        "name": name,
+        "seconds": round(seconds, 4),
+        "items": items,
+        "items_per_s": round(items / seconds, 1) if seconds else None,
+        "bytes": nbytes,
+        "mb_per_s": round(nbytes / 1024 / 1024 / seconds, 2) if seconds and nbytes else None,
+        "peak_rss_mb": None if rss is None else round(rss, 1),
+    }
+    rate = f"{entry['mb_per_s']:8.1f} MB/s" if entry["mb_per_s"] else " " * 13
+    print(f"{name:<22} {items:>9} {seconds:9.3f} s  {rate}  {entry['items_per_s'] or 0:>11.0f}/s")
+    return entry
+
+
+def bench(name: str, fn, path: str, repeat: int) -> Dict[str, Any]:
+    size = os.path.getsize(path)
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        count = sum(1 for _ in fn(path))
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return result(name, best, count, size)
+
+
+def bench_stages(path: str, work_dir: str, part_bytes: int = 10 * 1024 * 1024) -> List[Dict[str, Any]]:
+    """One pass over the export; summarize, clean_text, messages.csv and
+    write_part are timed separately. Parts are deleted after writing."""
+    timings = {"summarize": 0.0, "clean_text": 0.0, "messages_csv": 0.0, "write_part": 0.0}
+    counts = dict.fromkeys(timings, 0)
+    part_size = part_idx = written = 0
+    batch: List[Dict[str, Any]] = []
+    clock = time.perf_counter
+    msg_path = os.path.join(work_dir, "messages.csv")
+
+    def flush():
+        nonlocal part_idx, written, batch, part_size
+        part_idx += 1
+        t0 = clock()
+        fn = write_part(part_idx, batch, work_dir)
+        timings["write_part"] += clock() - t0
+        written += os.path.getsize(fn)
+        counts["write_part"] += len(batch)
+        os.remove(fn)
+        batch, part_size = [], 0
+
+    with open(msg_path, "w", newline="", encoding="utf-8-sig") as msg_f:
+        msg_writer = csv.writer(msg_f)
+        msg_writer.writerow(MESSAGES_HEADER)
+        for conv in iter_top_level_objects(path):
+            t0 = clock()
+            summarize_conversation(conv)
+            t1 = clock()
+            for node in (conv.get("mapping") or {}).values():
+                clean_text_from_message_content(((node or {}).get("message") or {}).get("content"))
+                counts["clean_text"] += 1
+            t2 = clock()
+            msg_writer.writerows(csv_rows(conv.get("id"), conv.get("title"), extract_messages(conv)))
+            t3 = clock()
+            timings["summarize"] += t1 - t0
+            timings["clean_text"] += t2 - t1
+            timings["messages_csv"] += t3 - t2
+            counts["summarize"] += 1
+            counts["messages_csv"] += 1
+            batch.append(conv)
+            part_size += len(conv.get("title") or "") + 1000 * len(conv.get("mapping") or ())
+            if part_size >= part_bytes:
+                flush()
+        if batch:
+            flush()
+    csv_bytes = os.path.getsize(msg_path)
+    return [
+        result("summarize", timings["summarize"], counts["summarize"]),
+        result("clean_text", timings["clean_text"], counts["clean_text"]),
+        result("messages_csv", timings["messages_csv"], counts["messages_csv"], csv_bytes),
+        result("write_part", timings["write_part"], counts["write_part"], written),
+    ]
+
+
+def bench_viewer(messages_csv: str, repeat: int, sample: int = 50) -> List[Dict[str, Any]]:
+    """Sidecar index build, title search and conversation lookup."""
+    size = os.path.getsize(messages_csv)
+    t0 = time.perf_counter()
+    viewer.build_index(messages_csv)
+    results = [result("build_index", time.perf_counter() - t0, 1, size)]
+
+    ids = [cid for cid, _ in viewer.find_conversations(messages_csv, "", limit=sys.maxsize)]
+    step = max(1, len(ids) // sample)
+    picked = ids[::step][:sample]
+    queries = ["unterhaltung 1", "größe", "東京", "nicht-vorhanden"]
+
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for q in queries:
+            viewer.find_conversations(messages_csv, q)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    results.append(result("find_conversations", best, len(queries)))
+
+    best, rows = None, 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = sum(len(viewer.collect_conversation(messages_csv, cid)) for cid in picked)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    results.append(result("collect_conversation", best, len(picked)))
+    results[-1]["rows"] = rows
+    return results
+
+
+def bench_micro(repeat: int, n: int = 200_000, seed: int = 42) -> List[Dict[str, Any]]:
+    """clean_text_from_message_content on plain single-part and on multipart
+    text messages, against the former implementation."""
+    rnd = random.Random(seed)
+    plain = [{"content_type": "text", "parts": [_text(rnd, 1, 30)]} for _ in range(n)]
+    multipart = [{"content_type": "text", "parts": [_text(rnd, 1, 10), {"text": _text(rnd, 1, 10)}]} for _ in range(n)]
+
+    def timed(name, fn, contents):
+        best = None
+        for _ in range(max(repeat, 3)):
+            t0 = time.perf_counter()
+            for c in contents:
+                fn(c)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        return result(name, best, len(contents))
+
+    results = [
+        timed("clean_text_plain", clean_text_from_message_content, plain),
+        timed("clean_text_legacy", legacy_clean_text_from_message_content, plain),
+        timed("clean_text_multipart", clean_text_from_message_content, multipart),
+        timed("clean_text_multi_leg", legacy_clean_text_from_message_content, multipart),
+    ]
+    print(f"clean_text plain: {results[1]['seconds'] / results[0]['seconds']:.2f}x, "
+          f"multipart: {results[3]['seconds'] / results[2]['seconds']:.2f}x gegenüber bisher")
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"\nVergleich mit {baseline_path} (Zeit alt / neu, > 1 = schneller):")
+    for r in results:
+        old = baseline.get(r["name"])
+        if old and old["seconds"] and r["seconds"]:
+            print(f"{r['name']:<22} {old['seconds'] / r['seconds']:6.2f}x")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark-Suite für Splitter und Viewer")
+    ap.add_argument("-i", "--input", help="vorhandene conversations.json (sonst synthetisch)")
+    ap.add_argument("--size", type=parse_size, default=parse_size("50MB"), help="Größe der synthetischen Eingabe (10MB … 10GB)")
+    ap.add_argument("--seed", type=int, default=42, help="Startwert des Generators (gleiche Werte → gleiche Datei)")
+    ap.add_argument("--chunk-size", type=parse_size, default=CHUNK_SIZE, help="Lesegröße des Chunk-Scanners")
+    ap.add_argument("--repeat", type=int, default=1, help="Wiederholungen (bester Lauf zählt)")
+    ap.add_argument("--skip-legacy", action="store_true", help="alten Zeichen-Scanner nicht messen")
+    ap.add_argument("--only", help="nur diese Gruppen: scan,stages,viewer,micro (kommagetrennt)")
+    ap.add_argument("--json-out", help="Ergebnisse als JSON speichern")
+    ap.add_argument("--compare", help="frühere JSON-Ergebnisse zum Vergleich")
+    ap.add_argument("--generate-only", metavar="DATEI", help="nur synthetische Eingabe nach DATEI schreiben")
+    args = ap.parse_args()
+
+    if args.generate_only:
+        n = write_synthetic_export(args.generate_only, args.size, args.seed)
+        print(f"{n} Unterhaltungen geschrieben: {args.generate_only} ({os.path.getsize(args.generate_only)/1024/1024:.1f} MB)")
+        return
+    groups = set((args.only or "scan,stages,viewer,micro").split(","))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = args.input
+        if groups == {"micro"}:
+            path = __file__  # the microbenchmark needs no export
+        elif not path:
+            path = os.path.join(work_dir, "conversations.json")
+            write_synthetic_export(path, args.size, args.seed)
+        print(f"Eingabe: {path} ({os.path.getsize(path)/1024/1024:.1f} MB)")
+        results = []
+        if "scan" in groups:
+            results.append(bench("scan_chunked", lambda p: iter_top_level_objects(p, args.chunk_size), path, args.repeat))
+            results.append(bench("scan_mmap", lambda p: iter_top_level_objects(p, use_mmap=True), path, args.repeat))
+            if not args.skip_legacy:
+                results.append(bench("scan_legacy", legacy_iter_top_level_objects, path, args.repeat))
+                print(f"Speedup: {results[0]['mb_per_s'] / results[-1]['mb_per_s']:.1f}x")
+        if "stages" in groups or "viewer" in groups:
+            stages = bench_stages(path, work_dir)
+            if "stages" in groups:
+                results += stages
+        if "viewer" in groups:
+            results += bench_viewer(os.path.join(work_dir, "messages.csv"), args.repeat)
+        if "micro" in groups:
+            results += bench_micro(args.repeat)
+
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "input": {"path": args.input, "bytes": os.path.getsize(path), "seed": None if args.input else args.seed},
+            "results": results,
+        }
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as w:
+            json.dump(report, w, ensure_ascii=False, indent=2)
+        print(f"Ergebnisse gespeichert: {os.path.abspath(args.json_out)}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
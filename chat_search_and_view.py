@@ -7,14 +7,35 @@ Nutzung (Beispiele):
   1) Suchen nach Titeln/IDs in messages.csv
      python chat_search_and_view.py -m parts_small_utf8/messages.csv --find "mein suchwort"
 
-  2) Eine bestimmte Unterhaltung als HTML anzeigen (nach ID)
+  2) Volltextsuche in allen Nachrichten (Wörter UND-verknüpft, "Phrase", präfix*)
+     python chat_search_and_view.py -m parts_small_utf8/messages.csv --search "steuer \"frist 2024\"" --role user
+
+  3) Eine bestimmte Unterhaltung als HTML anzeigen (nach ID)
      python chat_search_and_view.py -m parts_small_utf8/messages.csv --export <conversation_id> -o chat_view.html
 
+  4) Viele Unterhaltungen auf einmal als HTML (alle, per ID-Liste oder Titel-Suche), mit index.html
+     python chat_search_and_view.py -m parts_small_utf8/messages.csv --bulk-export html_export --find "steuer" --workers 4
+
+  5) Lokaler Viewer im Browser (lädt Nachrichten beim Scrollen nach, auch für sehr lange Chats)
+     python chat_search_and_view.py -m parts_small_utf8/messages.csv --serve --port 8765
+
+  6) Mit --partition-by aufgeteilter Export: nur die Monate/Jahre im Zeitraum werden gelesen
+     python chat_search_and_view.py -m parts_by_month --search "steuer" --since 2024-03 --until 2024-03
+
+  7) Ad-hoc-Suche ohne Index (regulärer Ausdruck oder fester Text), parallel über alle Kerne
+     python chat_search_and_view.py -m parts_small_utf8 --grep "IBAN|BIC" --ignore-case
+
 Hinweise:
 - Die Datei messages.csv entsteht durch dein vorhandenes Skript.
 - Umlaute werden korrekt angezeigt.
+- Beim ersten Aufruf entsteht daneben ein Index (messages.csv.idx.sqlite). Danach
+  antworten --find und --export ohne die ganze CSV zu lesen. Ändert sich die CSV,
+  wird der Index automatisch neu aufgebaut.
+- --search nutzt einen eigenen Volltextindex (messages.csv.fts.sqlite). Angehängte
+  Zeilen werden beim nächsten Aufruf nachindiziert.
 """
-import argparse, csv, html, os, sys
+import argparse, collections, concurrent.futures, contextlib, csv, gzip, hashlib, html, http.server, io, itertools
+import json, os, re, sqlite3, sys, threading, urllib.parse
 
 # Sehr lange Textfelder zulassen (große Antworten). Unter Windows kann sys.maxsize
 # zu groß für das zugrunde liegende C-Long sein. Wir probieren fallend.
@@ -24,51 +45,666 @@ for limit in (2**31 - 1, 10**9, 10**8):
         break
     except Exception:
         continue
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 
 
 def read_messages_csv(messages_csv: str):
     with open(messages_csv, "r", encoding="utf-8-sig", newline="") as f:
         r = csv.DictReader(f)
         for row in r:
-            # Erwartete Spalten: conversation_id,title,time,role,text
+            # Erwartete Spalten: conversation_id,title,time,role,text[,branch]
             yield {
                 "conversation_id": row.get("conversation_id"),
                 "title": row.get("title"),
                 "time": row.get("time"),
                 "role": row.get("role"),
                 "text": row.get("text", ""),
+                "branch": row.get("branch") or "",
             }
 
 
-def find_conversations(messages_csv: str, query: str, limit: int = 50):
+# Version des Index-Schemas; ältere Index-Dateien werden neu aufgebaut.
+INDEX_VERSION = 1
+
+
+def index_path_for(messages_csv: str) -> str:
+    return messages_csv + ".idx.sqlite"
+
+
+def _csv_stamp(messages_csv: str) -> Tuple[int, int]:
+    st = os.stat(messages_csv)
+    return st.st_size, st.st_mtime_ns
+
+
+def iter_csv_records(f, start: int = 0):
+    """Liefert (offset, end, record_bytes) für jeden CSV-Datensatz ab Byte-Position start.
+
+    Ein Datensatz endet an einem Zeilenumbruch, sobald die Anzahl der
+    Anführungszeichen gerade ist (Zeilenumbrüche in Texten stehen in Quotes).
+    """
+    f.seek(start)
+    offset = start
+    pending, quotes = [], 0
+    for line in f:
+        pending.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2:
+            continue
+        record = b"".join(pending) if len(pending) > 1 else line
+        end = offset + len(record)
+        yield offset, end, record
+        offset = end
+        pending, quotes = [], 0
+
+
+def _parse_record(record: bytes) -> List[str]:
+    return next(csv.reader(io.StringIO(record.decode("utf-8"), newline="")), [])
+
+
+def build_index(messages_csv: str, index_path: Optional[str] = None) -> str:
+    """Erzeugt den Sidecar-Index (SQLite) zu messages.csv.
+
+    Gespeichert werden je Unterhaltung Titel und die Byte-Bereiche ihrer
+    Zeilen, damit --find und --export nicht mehr die ganze CSV lesen müssen.
+    """
+    index_path = index_path or index_path_for(messages_csv)
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    size, mtime_ns = _csv_stamp(messages_csv)
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.executescript("""
+            CREATE TABLE meta(key TEXT PRIMARY KEY, value);
+            CREATE TABLE conversations(seq INTEGER PRIMARY KEY, conversation_id TEXT UNIQUE, title TEXT);
+            CREATE TABLE ranges(conversation_id TEXT, start INTEGER, end INTEGER);
+        """)
+        convs, ranges = {}, []
+        cur_id, cur_start, cur_end = None, None, None
+        with open(messages_csv, "rb") as f:
+            records = iter_csv_records(f)
+            header = next(records, None)
+            columns = _parse_record(header[2].removeprefix(b"\xef\xbb\xbf")) if header else []
+            for offset, end, record in records:
+                # Schneller Weg: conversation_id ist die erste, ungequotete Spalte
+                if record[:1] != b'"':
+                    cid = record[:record.find(b",")].decode("utf-8")
+                else:
+                    cid = _parse_record(record)[0]
+                if cid == cur_id and offset == cur_end:
+                    cur_end = end
+                    continue
+                if cur_id is not None:
+                    ranges.append((cur_id, cur_start, cur_end))
+                cur_id, cur_start, cur_end = cid, offset, end
+                if cid not in convs:
+                    row = _parse_record(record)
+                    convs[cid] = row[1] if len(row) > 1 else ""
+            if cur_id is not None:
+                ranges.append((cur_id, cur_start, cur_end))
+        con.executemany("INSERT INTO conversations(conversation_id, title) VALUES (?, ?)", convs.items())
+        con.executemany("INSERT INTO ranges VALUES (?, ?, ?)", ranges)
+        con.execute("CREATE INDEX ranges_cid ON ranges(conversation_id)")
+        con.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("version", INDEX_VERSION), ("csv_size", size), ("csv_mtime_ns", mtime_ns),
+            ("columns", json.dumps(columns)),
+        ])
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def open_index(messages_csv: str) -> Optional[sqlite3.Connection]:
+    """Öffnet den Index zu messages.csv und baut ihn bei Bedarf (neu) auf.
+
+    Der Index gilt als veraltet, sobald sich Größe oder Änderungszeit der CSV
+    ändern. Liefert None, wenn kein Index angelegt werden kann (z. B.
+    schreibgeschützter Ordner) – dann wird die CSV direkt gelesen.
+    """
+    index_path = index_path_for(messages_csv)
+    for attempt in range(2):
+        if os.path.exists(index_path):
+            try:
+                con = sqlite3.connect(index_path)
+                meta = dict(con.execute("SELECT key, value FROM meta"))
+                if (meta.get("version") == INDEX_VERSION
+                        and (meta.get("csv_size"), meta.get("csv_mtime_ns")) == _csv_stamp(messages_csv)):
+                    return con
+                con.close()
+            except sqlite3.Error:
+                pass
+        if attempt == 0:
+            try:
+                build_index(messages_csv, index_path)
+            except (OSError, sqlite3.Error):
+                return None
+    return None
+
+
+def _index_columns(con: sqlite3.Connection) -> List[str]:
+    (columns,) = con.execute("SELECT value FROM meta WHERE key = 'columns'").fetchone()
+    return json.loads(columns)
+
+
+def read_ranges(messages_csv: str, ranges, columns: List[str]):
+    """Liest nur die angegebenen Byte-Bereiche aus messages.csv, Datensatz für Datensatz."""
+    with open(messages_csv, "rb") as f:
+        for start, end in ranges:
+            for offset, _, record in iter_csv_records(f, start):
+                if offset >= end:
+                    break
+                row = dict(zip(columns, _parse_record(record)))
+                yield {
+                    "conversation_id": row.get("conversation_id"),
+                    "title": row.get("title"),
+                    "time": row.get("time"),
+                    "role": row.get("role"),
+                    "text": row.get("text", ""),
+                    "branch": row.get("branch") or "",
+                }
+
+
+def in_period(first: str, last: str, since: Optional[str] = None, until: Optional[str] = None) -> bool:
+    """Berührt der Zeitraum first..last (ISO-Zeiten) den Bereich since..until?
+
+    since/until dürfen gekürzt sein (2024, 2024-03, 2024-03-15) und gelten
+    einschließlich. Ohne Zeitangabe liegt nichts im Bereich.
+    """
+    if since and not (last and last >= since):
+        return False
+    if until and not (first and first[:len(until)] <= until):
+        return False
+    return True
+
+
+def select_sources(path: str, since: Optional[str] = None, until: Optional[str] = None) -> List[str]:
+    """messages.csv-Dateien zu -m: eine Datei, ein Zielordner des Splitters oder
+    ein mit --partition-by aufgeteilter Ordner.
+
+    Bei Partitionen (partitions.json) werden nur die zurückgegeben, deren
+    Zeitraum since..until berührt – die übrigen werden gar nicht geöffnet.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    manifest = os.path.join(path, "partitions.json")
+    if not os.path.exists(manifest):
+        return [os.path.join(path, "messages.csv")]
+    with open(manifest, encoding="utf-8") as f:
+        partitions = json.load(f)["partitions"]
+    sources = []
+    for partition in partitions:
+        if (since or until) and not in_period(partition["first_time"] or "", partition["last_time"] or "", since, until):
+            continue
+        sources.append(os.path.join(path, partition["path"], "messages.csv"))
+    return sources
+
+
+def conversations_in_period(messages_csv: str, since: Optional[str] = None, until: Optional[str] = None) -> set:
+    """IDs der Unterhaltungen in messages.csv, deren Zeitraum since..until berührt.
+
+    Nutzt erste/letzte Zeit aus der index.csv des Splitters im selben Ordner;
+    fehlt sie, werden die Zeiten aus messages.csv bestimmt.
+    """
+    index_csv = os.path.join(os.path.dirname(messages_csv), "index.csv")
+    if os.path.exists(index_csv):
+        with open(index_csv, newline="", encoding="utf-8-sig") as f:
+            return {row["conversation_id"] for row in csv.DictReader(f)
+                    if in_period(row["first_time"], row["last_time"], since, until)}
+    spans: Dict[str, List[str]] = {}
+    for msg in read_messages_csv(messages_csv):
+        t = msg.get("time") or ""
+        span = spans.setdefault(msg["conversation_id"] or "", [t, t])
+        if t and (not span[0] or t < span[0]):
+            span[0] = t
+        if t > span[1]:
+            span[1] = t
+    return {cid for cid, (first, last) in spans.items() if in_period(first, last, since, until)}
+
+
+def find_conversations(messages_csv: str, query: str, limit: int = 50, use_index: bool = True,
+                       offset: int = 0, since: Optional[str] = None, until: Optional[str] = None):
     query_l = (query or "").lower()
+    skip = offset
+    allowed = conversations_in_period(messages_csv, since, until) if since or until else None
+    con = open_index(messages_csv) if use_index else None
+    if con is not None:
+        results = []
+        with contextlib.closing(con):
+            for cid, title in con.execute("SELECT conversation_id, title FROM conversations ORDER BY seq"):
+                cid, title = cid or "", title or ""
+                if allowed is not None and cid not in allowed:
+                    continue
+                if query_l in cid.lower() or query_l in title.lower():
+                    if skip:
+                        skip -= 1
+                        continue
+                    results.append((cid, title))
+                    if len(results) >= limit:
+                        break
+        return results
+
     seen = {}
     results = []
     for msg in read_messages_csv(messages_csv):
         cid = msg["conversation_id"] or ""
-        if cid in seen:
+        if cid in seen or (allowed is not None and cid not in allowed):
             continue
         title = msg["title"] or ""
         if query_l in cid.lower() or query_l in title.lower():
             seen[cid] = True
+            if skip:
+                skip -= 1
+                continue
             results.append((cid, title))
             if len(results) >= limit:
                 break
     return results
 
 
-def collect_conversation(messages_csv: str, conv_id: str) -> List[Dict[str, Any]]:
-    items = []
-    for msg in read_messages_csv(messages_csv):
-        if (msg.get("conversation_id") or "") == conv_id:
-            items.append(msg)
-    # Sortierung: nach Zeit (falls vorhanden), sonst Reihenfolge aus CSV
-    items.sort(key=lambda x: (x.get("time") or ""))
-    return items
+def iter_conversation(messages_csv: str, conv_id: str, use_index: bool = True,
+                      branches: bool = False) -> Iterator[Dict[str, Any]]:
+    """Nachrichten einer Unterhaltung in CSV-Reihenfolge, eine nach der anderen.
+
+    Der Splitter schreibt messages.csv bereits in Gesprächsreihenfolge (aktiver
+    Verlauf zuerst). Zeilen alternativer Zweige (Spalte branch, siehe
+    --branches im Splitter) werden nur mit branches=True geliefert.
+    """
+    con = open_index(messages_csv) if use_index else None
+    if con is not None:
+        with contextlib.closing(con):
+            ranges = con.execute(
+                "SELECT start, end FROM ranges WHERE conversation_id = ? ORDER BY start", (conv_id,)
+            ).fetchall()
+            columns = _index_columns(con)
+        items = read_ranges(messages_csv, ranges, columns)
+    else:
+        items = (msg for msg in read_messages_csv(messages_csv) if (msg.get("conversation_id") or "") == conv_id)
+    for msg in items:
+        if branches or not msg.get("branch"):
+            yield msg
+
+
+def collect_conversation(messages_csv: str, conv_id: str, use_index: bool = True,
+                         branches: bool = False) -> List[Dict[str, Any]]:
+    """Wie iter_conversation, aber als Liste."""
+    return list(iter_conversation(messages_csv, conv_id, use_index, branches))
+
+
+def fts_path_for(messages_csv: str) -> str:
+    return messages_csv + ".fts.sqlite"
+
+
+# Anzahl Bytes vor dem indizierten Ende, die beim Anhängen unverändert sein müssen.
+_FTS_CHECK_BYTES = 4096
+# Datensätze werden blockweise dekodiert und in einer Transaktion eingefügt.
+_FTS_BATCH_BYTES = 8 * 1024 * 1024
+
+
+def _tail_check(f, end: int) -> bytes:
+    start = max(0, end - _FTS_CHECK_BYTES)
+    f.seek(start)
+    return f.read(end - start)
+
+
+def update_fulltext_index(messages_csv: str) -> str:
+    """Erzeugt oder ergänzt den Volltextindex (SQLite FTS5) über die Spalte text.
+
+    Wurden an messages.csv nur Zeilen angehängt, werden ausschließlich die
+    neuen Datensätze indiziert; bei jeder anderen Änderung wird neu aufgebaut.
+    Tokenizer: unicode61 ohne Entfernen diakritischer Zeichen, d. h.
+    Groß-/Kleinschreibung wird gefaltet (Ä = ä), aber „schön“ ≠ „schon“.
+    """
+    fts_path = fts_path_for(messages_csv)
+    size = os.path.getsize(messages_csv)
+    con = sqlite3.connect(fts_path)
+    try:
+        con.execute("CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value)")
+        meta = dict(con.execute("SELECT key, value FROM meta"))
+        start = meta.get("indexed_bytes") or 0
+        with open(messages_csv, "rb") as f:
+            if meta.get("version") != INDEX_VERSION or start > size or \
+                    (start and _tail_check(f, start) != meta.get("tail_check")):
+                con.executescript("DROP TABLE IF EXISTS messages; DELETE FROM meta;")
+                start = 0
+            con.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+                "text, conversation_id UNINDEXED, title UNINDEXED, time UNINDEXED, role UNINDEXED, "
+                "tokenize = 'unicode61 remove_diacritics 0')"
+            )
+            if start == size:
+                return fts_path
+
+            records = iter_csv_records(f)
+            _, header_end, header = next(records, (0, 0, b""))
+            columns = _parse_record(header.removeprefix(b"\xef\xbb\xbf"))
+            start = max(start, header_end)
+
+            def rows():
+                batch, batch_bytes = [], 0
+                for _, _, record in iter_csv_records(f, start):
+                    batch.append(record)
+                    batch_bytes += len(record)
+                    if batch_bytes >= _FTS_BATCH_BYTES:
+                        yield from csv.reader(io.StringIO(b"".join(batch).decode("utf-8"), newline=""))
+                        batch, batch_bytes = [], 0
+                if batch:
+                    yield from csv.reader(io.StringIO(b"".join(batch).decode("utf-8"), newline=""))
+
+            def values():
+                for values in rows():
+                    row = dict(zip(columns, values))
+                    yield (row.get("text", ""), row.get("conversation_id"), row.get("title"),
+                           row.get("time"), row.get("role"))
+
+            con.executemany("INSERT INTO messages(text, conversation_id, title, time, role) VALUES (?, ?, ?, ?, ?)",
+                            values())
+            con.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+                ("version", INDEX_VERSION), ("indexed_bytes", size), ("tail_check", _tail_check(f, size)),
+            ])
+        con.commit()
+    finally:
+        con.close()
+    return fts_path
+
+
+# Deutsche Schreibvarianten, die bei der Suche als gleichwertig gelten.
+_GERMAN_VARIANTS = (("ß", "ss"), ("ä", "ae"), ("ö", "oe"), ("ü", "ue"))
+
+
+def _term_variants(term: str) -> List[str]:
+    """term wie eingegeben, dann höchstens 15 weitere Schreibvarianten."""
+    variants = {term}
+    for a, b in _GERMAN_VARIANTS:
+        for v in list(variants):
+            if a in v:
+                variants.add(v.replace(a, b))
+            if b in v:
+                variants.add(v.replace(b, a))
+    return [term] + sorted(variants - {term})[:15]
+
+
+def _fts_quote(s: str) -> str:
+    return '"' + s.replace('"', '""') + '"'
+
+
+def build_fts_query(query: str) -> str:
+    """Übersetzt eine Nutzereingabe in einen FTS5-MATCH-Ausdruck.
+
+    Wörter werden UND-verknüpft, "in Anführungszeichen" ist eine Phrase,
+    ein * am Wortende sucht nach Präfixen. ß/ss sowie ä/ae, ö/oe, ü/ue
+    werden als gleichwertig behandelt.
+    """
+    parts = []
+    for i, chunk in enumerate((query or "").split('"')):
+        if i % 2:
+            if chunk.strip():
+                parts.append(_fts_quote(chunk.strip().lower()))
+            continue
+        for word in chunk.split():
+            word = word.lower()
+            prefix = word.endswith("*")
+            word = word.rstrip("*")
+            if not word:
+                continue
+            alts = [_fts_quote(v) + ("*" if prefix else "") for v in _term_variants(word)]
+            parts.append(alts[0] if len(alts) == 1 else "(" + " OR ".join(alts) + ")")
+    return " AND ".join(parts)
+
+
+def search_messages(messages_csv: str, query: str, role: Optional[str] = None, limit: int = 20,
+                    since: Optional[str] = None, until: Optional[str] = None):
+    """Volltextsuche in messages.csv, sortiert nach Relevanz (BM25).
+
+    Liefert Tupel (conversation_id, title, time, role, snippet). since/until
+    beschränken auf Nachrichten aus diesem Zeitraum (siehe in_period).
+    """
+    match = build_fts_query(query)
+    if not match:
+        return []
+    con = sqlite3.connect(update_fulltext_index(messages_csv))
+    with contextlib.closing(con):
+        sql = ("SELECT conversation_id, title, time, role, snippet(messages, 0, '[', ']', '…', 12) "
+               "FROM messages WHERE messages MATCH ?")
+        params: list = [match]
+        if role:
+            sql += " AND role = ?"
+            params.append(role)
+        if since:
+            sql += " AND time >= ?"
+            params.append(since)
+        if until:
+            sql += " AND time != '' AND substr(time, 1, ?) <= ?"
+            params += [len(until), until]
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return con.execute(sql, params).fetchall()
+
+
+# --grep: Größe der Byte-Bereiche, die ein Worker am Stück liest und durchsucht.
+GREP_RANGE_BYTES = 4 * 1024 * 1024
+# Anker und Lookarounds beziehen sich auf das Textfeld; im Rohbereich der
+# CSV könnten sie Treffer übersehen, dann entfällt der Vorfilter.
+_GREP_UNSAFE = re.compile(r"[\^$]|\\[AZ]|\(\?<?[=!]")
+
+
+class GrepMatcher:
+    """Vorkompilierte Suche für --grep.
+
+    text prüft das Textfeld einer Nachricht. raw (Bytes) bzw. pre (Text)
+    sortieren vorab ganze Byte-Bereiche aus, ohne Datensätze zu zerlegen:
+    Literale werden direkt in den Rohbytes gesucht (für CSV bzw. JSON
+    maskiert), reguläre Ausdrücke im dekodierten Bereich (verdoppelte
+    Anführungszeichen zurückgeführt). Kann der Vorfilter Treffer übersehen
+    (Anker, Lookarounds, JSON-Escapes), entfällt er.
+    """
+
+    def __init__(self, pattern: str, fixed: bool = False, ignore_case: bool = False, fmt: str = "csv",
+                 role: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None):
+        flags = re.IGNORECASE if ignore_case else 0
+        self.text = re.compile(re.escape(pattern) if fixed else pattern, flags)
+        self.role, self.since, self.until = role, since, until
+        self.raw: Optional[re.Pattern] = None
+        self.pre: Optional[re.Pattern] = None
+        if fixed and (pattern.isascii() or not ignore_case):
+            if fmt == "csv":
+                forms = {pattern.replace('"', '""')}
+            else:
+                forms = {json.dumps(pattern, ensure_ascii=False)[1:-1], json.dumps(pattern)[1:-1]}
+            self.raw = re.compile(b"|".join(re.escape(form.encode("utf-8")) for form in sorted(forms)), flags)
+        elif fmt == "csv" and not _GREP_UNSAFE.search(pattern):
+            self.pre = self.text
+
+    def maybe(self, buf: bytes, start: int, end: int) -> bool:
+        """Kann buf[start:end] einen Treffer enthalten?"""
+        if self.raw is not None:
+            return self.raw.search(buf, start, end) is not None
+        if self.pre is not None:
+            return self.pre.search(buf[start:end].decode("utf-8", "replace").replace('""', '"')) is not None
+        return True
+
+    def hit(self, cid, title, time, role, text) -> Optional[Tuple[str, str, str, str, str]]:
+        """Treffer-Tupel wie bei search_messages, oder None."""
+        if self.role and role != self.role:
+            return None
+        if (self.since or self.until) and not in_period(time or "", time or "", self.since, self.until):
+            return None
+        m = self.text.search(text or "")
+        if m is None:
+            return None
+        a, b = max(m.start() - 60, 0), min(m.end() + 60, len(text))
+        snippet = (("…" if a else "") + text[a:m.start()] + "[" + m.group() + "]" + text[m.end():b]
+                   + ("…" if b < len(text) else ""))
+        return (cid or "", title or "", time or "", role or "", snippet)
 
 
-def render_html(conversation: List[Dict[str, Any]], title: str, conv_id: str) -> str:
+def _grep_csv_range(messages_csv: str, spans: List[Tuple[int, int]], columns: List[str],
+                    matcher: GrepMatcher) -> List[Tuple[str, str, str, str, str]]:
+    """Durchsucht die Datensatz-Bereiche spans von messages.csv (ein Lesezugriff)."""
+    base = spans[0][0]
+    with open(messages_csv, "rb") as f:
+        f.seek(base)
+        buf = f.read(spans[-1][1] - base)
+    hits = []
+    for start, end in spans:
+        if not matcher.maybe(buf, start - base, end - base):
+            continue
+        for _, _, record in iter_csv_records(io.BytesIO(buf[start - base:end - base])):
+            if not matcher.maybe(record, 0, len(record)):
+                continue
+            row = dict(zip(columns, _parse_record(record)))
+            hit = matcher.hit(row.get("conversation_id"), row.get("title"), row.get("time"), row.get("role"),
+                              row.get("text", ""))
+            if hit is not None:
+                hits.append(hit)
+    return hits
+
+
+def _grep_part_range(part_path: str, spans: Optional[List[Tuple[int, int]]],
+                     matcher: GrepMatcher) -> List[Tuple[str, str, str, str, str]]:
+    """Durchsucht Unterhaltungen einer Teil-Datei; spans=None: die ganze Datei."""
+    import split_conversations_by_size as splitter
+
+    if spans is None:
+        objects: Iterable = splitter.iter_raw_objects(part_path)
+    else:
+        base = spans[0][0]
+        with open(part_path, "rb") as f:
+            f.seek(base)
+            buf = f.read(spans[-1][1] - base)
+        objects = ((start, buf[start - base:end - base]) for start, end in spans)
+    hits = []
+    for _, raw in objects:
+        if not matcher.maybe(raw, 0, len(raw)):
+            continue
+        conv = splitter.decode_object(raw)
+        for ts, role, text, _ in splitter.extract_messages(conv):
+            hit = matcher.hit(conv.get("id"), conv.get("title"), splitter.iso_from_ts(ts), role, text)
+            if hit is not None:
+                hits.append(hit)
+    return hits
+
+
+def _group_spans(spans: Iterable[Tuple[int, int]], limit: int = GREP_RANGE_BYTES) -> Iterator[List[Tuple[int, int]]]:
+    """Fasst aufeinanderfolgende Bereiche zu Aufgaben von etwa limit Bytes
+    zusammen (Lücken dazwischen werden mitgelesen)."""
+    group, size = [], 0
+    for start, end in spans:
+        if size >= limit:
+            yield group
+            group, size = [], 0
+        group.append((start, end))
+        size += end - start
+    if group:
+        yield group
+
+
+def _csv_record_ranges(messages_csv: str, limit: int = GREP_RANGE_BYTES) -> Iterator[Tuple[int, int]]:
+    """Bereiche von etwa limit Bytes hinter der Kopfzeile, jeweils an einem
+    Datensatzende geschnitten (für grep ohne Sidecar-Index). Die Datei wird
+    dazu einmal vorwärts gelesen; die Bereiche entstehen nach und nach."""
+    with open(messages_csv, "rb") as f:
+        records = iter_csv_records(f)
+        next(records, None)
+        start = end = None
+        for offset, end, _ in records:
+            if start is None:
+                start = offset
+            if end - start >= limit:
+                yield start, end
+                start = None
+        if start is not None:
+            yield start, end
+
+
+def _run_grep(tasks: Iterable[Tuple], workers: int, limit: Optional[int]):
+    """Führt (Funktion, Argumente...)-Aufgaben aus, Ergebnisse in Aufgabenreihenfolge."""
+    hits: List[Tuple[str, str, str, str, str]] = []
+    if workers <= 1:
+        for fn, *task_args in tasks:
+            hits += fn(*task_args)
+            if limit is not None and len(hits) >= limit:
+                break
+        return hits[:limit]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        try:
+            for fn, *task_args in tasks:
+                pending.append(pool.submit(fn, *task_args))
+                if len(pending) >= 2 * workers:
+                    hits += pending.popleft().result()
+                    if limit is not None and len(hits) >= limit:
+                        return hits[:limit]
+            while pending:
+                hits += pending.popleft().result()
+                if limit is not None and len(hits) >= limit:
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+    return hits[:limit]
+
+
+def grep_messages(messages_csv: str, matcher: GrepMatcher, workers: int = 1, limit: Optional[int] = None,
+                  use_index: bool = True, range_bytes: int = GREP_RANGE_BYTES):
+    """Paralleles grep über messages.csv, ohne Volltextindex.
+
+    Die Datei wird entlang der Datensatz-Bereiche aus dem Sidecar-Index in
+    Aufgaben von etwa range_bytes zerlegt, die ein Prozess-Pool durchsucht;
+    ohne Index (--no-index, schreibgeschützter Ordner) werden die Grenzen
+    beim Vorwärtslesen bestimmt. Nur Datensätze mit (möglichem) Treffer
+    werden als CSV dekodiert. Liefert (conversation_id, title, time, role,
+    snippet) in Dateireihenfolge.
+    """
+    con = open_index(messages_csv) if use_index else None
+    if con is None:
+        with open(messages_csv, "rb") as f:
+            _, _, header = next(iter_csv_records(f), (0, 0, b""))
+        columns = _parse_record(header.removeprefix(b"\xef\xbb\xbf"))
+        spans: Iterable[Tuple[int, int]] = _csv_record_ranges(messages_csv, range_bytes)
+    else:
+        with contextlib.closing(con):
+            columns = _index_columns(con)
+            spans = con.execute("SELECT start, end FROM ranges ORDER BY start").fetchall()
+    tasks = ((_grep_csv_range, messages_csv, group, columns, matcher) for group in _group_spans(spans, range_bytes)
+             if group[0][0] < group[-1][1])
+    return _run_grep(tasks, workers, limit)
+
+
+def grep_parts(split_dir: str, matcher: GrepMatcher, workers: int = 1, limit: Optional[int] = None):
+    """Wie grep_messages, aber über die conversations_part_*-Dateien eines
+    Zielordners (z. B. ohne messages.csv). Die Bereiche stammen aus
+    offsets.csv; ohne sie wird je Teil-Datei eine Aufgabe gebildet.
+    """
+    names = sorted(n for n in os.listdir(split_dir) if re.fullmatch(r"conversations_part_\d+\.jsonl?", n))
+    by_part: Dict[int, List[Tuple[int, int]]] = {}
+    offsets_csv = os.path.join(split_dir, "offsets.csv")
+    if os.path.exists(offsets_csv):
+        with open(offsets_csv, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                start = int(row["offset"])
+                by_part.setdefault(int(row["part"]), []).append((start, start + int(row["length"])))
+
+    def tasks():
+        for name in names:
+            path = os.path.join(split_dir, name)
+            spans = by_part.get(int(re.search(r"\d+", name).group()))
+            if spans is None:
+                yield _grep_part_range, path, None, matcher
+                continue
+            for group in _group_spans(sorted(spans)):
+                yield _grep_part_range, path, group, matcher
+
+    return _run_grep(tasks(), workers, limit)
+
+
+def iter_html(conversation: Iterable[Dict[str, Any]], title: str, conv_id: str) -> Iterator[str]:
+    """Erzeugt die HTML-Ansicht stückweise: Kopf, je Nachricht ein Stück, Fuß.
+
+    conversation darf ein Iterator sein; es wird immer nur eine Nachricht
+    gleichzeitig verarbeitet.
+    """
     def esc(s: str) -> str:
         return html.escape(s or "")
 
@@ -84,6 +720,8 @@ def render_html(conversation: List[Dict[str, Any]], title: str, conv_id: str) ->
     .bubble{flex:1;background:#fff;border:1px solid #e3e6ea;border-radius:8px;padding:10px;white-space:pre-wrap}
     .assistant .bubble{background:#f0f7ff;border-color:#cfe3ff}
     .time{color:#888;font-size:11px;margin-bottom:6px}
+    .branch{opacity:.75}
+    .branch .bubble{border-style:dashed}
     footer{color:#888;font-size:12px;text-align:center;padding:12px}
     """
 
@@ -98,24 +736,398 @@ def render_html(conversation: List[Dict[str, Any]], title: str, conv_id: str) ->
         "</header>",
         "<div class=\"wrap\">",
     ]
+    yield "\n".join(parts)
 
     for m in conversation:
         role = (m.get("role") or "").lower()
         time = m.get("time") or ""
         text = m.get("text") or ""
+        branch = m.get("branch") or ""
         cls = "assistant" if role == "assistant" else "user" if role == "user" else "other"
+        if branch:
+            cls += " branch"
+        parts = [""]
         parts.append(f"  <div class=\"msg {cls}\">")
         parts.append(f"    <div class=\"role\">{esc(role)}</div>")
         parts.append("    <div class=\"bubble\">")
-        if time:
-            parts.append(f"      <div class=\"time\">{esc(time)}</div>")
+        if time or branch:
+            label = f"{time} · Zweig {branch}" if branch else time
+            parts.append(f"      <div class=\"time\">{esc(label.lstrip(' ·'))}</div>")
         parts.append(f"      {esc(text)}")
         parts.append("    </div>")
         parts.append("  </div>")
+        yield "\n".join(parts)
+
+    yield "\n</div>\n<footer>Erstellt aus messages.csv – Umlaute bleiben erhalten (UTF‑8).</footer>"
+
+
+def render_html(conversation: Iterable[Dict[str, Any]], title: str, conv_id: str) -> str:
+    return "".join(iter_html(conversation, title, conv_id))
+
+
+def write_html(path: str, conversation: Iterable[Dict[str, Any]], title: str, conv_id: str,
+               compress: bool = False) -> int:
+    """Schreibt die HTML-Ansicht Nachricht für Nachricht nach path (mit compress
+    gzip-komprimiert). Liefert die Anzahl der Nachrichten."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for m in conversation:
+            count += 1
+            yield m
+
+    opener = gzip.open if compress else open
+    with opener(path, "wt", encoding="utf-8") as w:
+        for chunk in iter_html(counted(), title, conv_id):
+            w.write(chunk)
+    return count
+
+
+def export_filename(conv_id: str) -> str:
+    """Dateiname für eine Unterhaltung im Bulk-Export (nur sichere Zeichen)."""
+    safe = re.sub(r"[^A-Za-z0-9._-]", "_", conv_id)[:80] or "unterhaltung"
+    if safe != conv_id:
+        safe += "-" + hashlib.blake2b(conv_id.encode("utf-8"), digest_size=4).hexdigest()
+    return safe + ".html"
+
+
+def _export_one(conv_id: str, messages: List[Dict[str, Any]], path: str,
+                compress: bool = False) -> Tuple[str, str, int, str]:
+    title = messages[0].get("title") or "Unterhaltung"
+    write_html(path, messages, title, conv_id, compress)
+    return conv_id, title, len(messages), os.path.basename(path)
+
+
+def iter_conversation_groups(messages_csv: str, ids=None, use_index: bool = True, branches: bool = False):
+    """Liest messages.csv in einem Durchgang und liefert (conversation_id, messages)
+    für jede (ausgewählte) Unterhaltung, sobald sie vollständig ist.
+
+    Mit Sidecar-Index ist bekannt, wo die letzte Zeile einer Unterhaltung steht;
+    so bleiben nur die gerade offenen Unterhaltungen im Speicher. Ohne Index
+    werden die Gruppen bis zum Dateiende gesammelt.
+    """
+    last_end = None
+    con = open_index(messages_csv) if use_index else None
+    if con is not None:
+        with contextlib.closing(con):
+            last_end = dict(con.execute("SELECT conversation_id, MAX(end) FROM ranges GROUP BY conversation_id"))
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    with open(messages_csv, "rb") as f:
+        records = iter_csv_records(f)
+        header = next(records, None)
+        columns = _parse_record(header[2].removeprefix(b"\xef\xbb\xbf")) if header else []
+        for offset, end, record in records:
+            if ids is not None and record[:1] != b'"' and record[:record.find(b",")].decode("utf-8") not in ids:
+                continue  # schneller Weg wie in build_index
+            row = dict(zip(columns, _parse_record(record)))
+            cid = row.get("conversation_id") or ""
+            if ids is not None and cid not in ids:
+                continue
+            if branches or not row.get("branch"):
+                groups.setdefault(cid, []).append({
+                    "conversation_id": cid,
+                    "title": row.get("title"),
+                    "time": row.get("time"),
+                    "role": row.get("role"),
+                    "text": row.get("text", ""),
+                    "branch": row.get("branch") or "",
+                })
+            if last_end is not None and last_end.get(cid) == end and cid in groups:
+                yield cid, groups.pop(cid)
+    yield from groups.items()
+
+
+def write_export_index(out_dir: str, entries: List[Tuple[str, str, int, str]]) -> str:
+    """Übersichtsseite (index.html) mit Links auf alle exportierten Unterhaltungen."""
+    def esc(s: str) -> str:
+        return html.escape(s or "")
+
+    path = os.path.join(out_dir, "index.html")
+    with open(path, "w", encoding="utf-8") as w:
+        w.write("<!doctype html>\n<meta charset=\"utf-8\">\n<title>ChatGPT-Export</title>\n")
+        w.write("<style>body{font-family:system-ui,-apple-system,Segoe UI,Roboto,Arial,sans-serif;"
+                "max-width:960px;margin:0 auto;padding:16px;background:#f6f7f9}"
+                "li{margin:6px 0}small{color:#888}</style>\n")
+        w.write(f"<h1>ChatGPT-Export</h1>\n<p>{len(entries)} Unterhaltungen</p>\n<ol>\n")
+        for conv_id, title, count, filename in entries:
+            w.write(f"  <li><a href=\"{esc(urllib.parse.quote(filename))}\">{esc(title)}</a> "
+                    f"<small>{count} Nachrichten · {esc(conv_id)}</small></li>\n")
+        w.write("</ol>\n")
+    return path
 
-    parts.append("</div>")
-    parts.append("<footer>Erstellt aus messages.csv – Umlaute bleiben erhalten (UTF‑8).</footer>")
-    return "\n".join(parts)
+
+def export_conversations(messages_csv: str, out_dir: str, ids=None, workers: int = 1, use_index: bool = True,
+                         branches: bool = False, compress: bool = False) -> List[Tuple[str, str, int, str]]:
+    """Exportiert viele Unterhaltungen in einem Durchgang als HTML-Dateien plus index.html.
+
+    ids: Menge von IDs oder None für alle. Mit workers > 1 wird in einem
+    Prozess-Pool gerendert; es sind höchstens 2 Unterhaltungen je Worker in
+    Arbeit, fertige werden sofort geschrieben.
+    Liefert (conversation_id, title, Nachrichten, Dateiname) in der Reihenfolge,
+    in der die Unterhaltungen vollständig gelesen wurden.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    groups = iter_conversation_groups(messages_csv, ids, use_index, branches)
+    suffix = ".gz" if compress else ""
+    jobs = ((cid, msgs, os.path.join(out_dir, export_filename(cid) + suffix), compress) for cid, msgs in groups)
+    entries = []
+    if workers <= 1:
+        entries = [_export_one(*job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = collections.deque()
+            for job in jobs:
+                pending.append(pool.submit(_export_one, *job))
+                if len(pending) >= 2 * workers:
+                    entries.append(pending.popleft().result())
+            while pending:
+                entries.append(pending.popleft().result())
+    write_export_index(out_dir, entries)
+    return entries
+
+
+VIEWER_PAGE = """<!doctype html>
+<meta charset="utf-8">
+<title>ChatGPT-Export</title>
+<style>
+body{font-family:system-ui,-apple-system,Segoe UI,Roboto,Arial,sans-serif;margin:0;background:#f6f7f9;display:flex;height:100vh}
+nav{width:320px;flex:0 0 320px;border-right:1px solid #e3e6ea;background:#fff;display:flex;flex-direction:column}
+nav form{padding:10px;border-bottom:1px solid #e3e6ea}
+nav input[type=search]{width:100%;box-sizing:border-box;padding:6px}
+nav label{font-size:12px;color:#555}
+#list{overflow:auto;flex:1}
+#list a{display:block;padding:8px 10px;border-bottom:1px solid #f0f0f0;color:#222;text-decoration:none;font-size:14px}
+#list a:hover,#list a.active{background:#f0f7ff}
+#list small{display:block;color:#777;white-space:pre-wrap}
+main{flex:1;overflow:auto}
+header{position:sticky;top:0;background:#fff;border-bottom:1px solid #e3e6ea;padding:12px 16px}
+h1{font-size:18px;margin:0}
+.meta{color:#666;font-size:12px;margin-top:4px}
+.wrap{max-width:960px;margin:0 auto;padding:16px}
+.msg{margin:10px 0;display:flex}
+.role{width:120px;flex:0 0 120px;color:#555;font-weight:600}
+.bubble{flex:1;background:#fff;border:1px solid #e3e6ea;border-radius:8px;padding:10px;white-space:pre-wrap}
+.assistant .bubble{background:#f0f7ff;border-color:#cfe3ff}
+.branch{opacity:.75}
+.branch .bubble{border-style:dashed}
+.time{color:#888;font-size:11px;margin-bottom:6px}
+.more{color:#888;font-size:12px;text-align:center;padding:12px}
+</style>
+<nav>
+  <form id="f"><input type="search" id="q" placeholder="Titel/ID suchen …" autofocus>
+  <label><input type="checkbox" id="fts"> Volltext</label>
+  <label><input type="checkbox" id="branches"> Alternative Zweige</label></form>
+  <div id="list"></div>
+</nav>
+<main><header><h1 id="title">Unterhaltung wählen</h1><div class="meta" id="meta"></div></header>
+<div class="wrap" id="msgs"></div><div class="more" id="more"></div></main>
+<script>
+const $ = id => document.getElementById(id);
+const el = (tag, cls, text) => { const e = document.createElement(tag); if (cls) e.className = cls; if (text != null) e.textContent = text; return e; };
+const api = path => fetch(path).then(r => r.ok ? r.json() : Promise.reject(r.status));
+
+// Endloses Nachladen: ein Wächter-Element am Listenende lädt die nächste Seite.
+function pager(box, sentinel, load, render) {
+  let next = 0, busy = false, token = {};
+  const mine = token;
+  const more = () => {
+    if (busy || next === null || token !== mine) return;
+    busy = true;
+    load(next).then(page => {
+      if (token !== mine) return;
+      page.items.forEach(item => box.insertBefore(render(item), sentinel.parentNode === box ? sentinel : null));
+      next = page.next; busy = false;
+      sentinel.textContent = next === null ? "" : "…";
+      if (next !== null && sentinel.getBoundingClientRect().top < innerHeight * 2) more();
+    }, () => { busy = false; sentinel.textContent = "Fehler beim Laden"; });
+  };
+  const obs = new IntersectionObserver(entries => entries.some(e => e.isIntersecting) && more(), {rootMargin: "800px"});
+  obs.observe(sentinel);
+  more();
+  return () => { token = null; obs.disconnect(); };
+}
+
+let stopList = null, stopMsgs = null;
+function showList() {
+  if (stopList) stopList();
+  const box = $("list"); box.textContent = "";
+  const sentinel = el("div", "more");
+  box.appendChild(sentinel);
+  const q = encodeURIComponent($("q").value.trim());
+  const fts = $("fts").checked && q;
+  stopList = pager(box, sentinel,
+    next => fts ? api(`api/search?q=${q}&limit=100`).then(r => ({items: r.items, next: null}))
+                : api(`api/conversations?q=${q}&offset=${next}&limit=100`),
+    item => {
+      const a = el("a", null, item.title || item.id); a.href = "#" + encodeURIComponent(item.id);
+      if (item.snippet) a.appendChild(el("small", null, item.snippet));
+      return a;
+    });
+}
+function showConversation(id) {
+  if (stopMsgs) stopMsgs();
+  const box = $("msgs"); box.textContent = "";
+  const branches = $("branches").checked ? 1 : 0;
+  const base = `api/conversations/${encodeURIComponent(id)}?branches=${branches}&limit=100`;
+  stopMsgs = pager(box, $("more"),
+    next => api(`${base}&offset=${next}`).then(page => {
+      $("title").textContent = page.title || "Unterhaltung";
+      $("meta").textContent = `ID: ${page.id} · ${page.total} Nachrichten`;
+      return {items: page.messages, next: page.next};
+    }),
+    m => {
+      const role = (m.role || "").toLowerCase();
+      const row = el("div", "msg " + (role === "assistant" || role === "user" ? role : "other") + (m.branch ? " branch" : ""));
+      row.appendChild(el("div", "role", role));
+      const bubble = el("div", "bubble");
+      const label = [m.time, m.branch ? "Zweig " + m.branch : ""].filter(Boolean).join(" · ");
+      if (label) bubble.appendChild(el("div", "time", label));
+      bubble.appendChild(document.createTextNode(m.text || ""));
+      row.appendChild(bubble);
+      return row;
+    });
+}
+const route = () => { const id = decodeURIComponent(location.hash.slice(1)); if (id) showConversation(id); };
+$("f").onsubmit = e => { e.preventDefault(); showList(); };
+$("q").oninput = () => { clearTimeout(window._t); window._t = setTimeout(showList, 200); };
+$("fts").onchange = showList;
+$("branches").onchange = route;
+onhashchange = route;
+showList(); route();
+</script>
+"""
+
+
+class ConversationCache:
+    """Hält die zuletzt geöffneten Unterhaltungen für die seitenweise Auslieferung.
+
+    Ändert sich messages.csv (Größe/mtime), werden alle Einträge verworfen.
+    """
+
+    def __init__(self, messages_csv: str, size: int = 16):
+        self.messages_csv = messages_csv
+        self.size = size
+        self.stamp = None
+        self.items: "collections.OrderedDict[Tuple[str, bool], List[Dict[str, Any]]]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, conv_id: str, branches: bool = False) -> List[Dict[str, Any]]:
+        stamp = _csv_stamp(self.messages_csv)
+        key = (conv_id, branches)
+        with self.lock:
+            if stamp != self.stamp:
+                self.items.clear()
+                self.stamp = stamp
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key]
+        messages = collect_conversation(self.messages_csv, conv_id, branches=branches)
+        with self.lock:
+            self.items[key] = messages
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        return messages
+
+
+def make_handler(messages_csv: str):
+    """Request-Handler für --serve: Viewer-Seite und JSON-API.
+
+    GET /                                  Viewer (lädt Nachrichten beim Scrollen nach)
+    GET /api/conversations?q=&offset=&limit=   Unterhaltungen (Titel/ID-Filter)
+    GET /api/conversations/<id>?offset=&limit=&branches=1   Nachrichten seitenweise
+    GET /api/search?q=&role=&limit=        Volltextsuche
+
+    Antworten tragen ein ETag aus Größe/mtime der CSV; If-None-Match → 304.
+    """
+    cache = ConversationCache(messages_csv)
+    page = VIEWER_PAGE.encode("utf-8")
+    page_etag = '"%s"' % hashlib.blake2b(page, digest_size=8).hexdigest()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        server_version = "ChatExportViewer/1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str, etag: Optional[str] = None):
+            if etag and status == 200 and etag in (self.headers.get("If-None-Match") or ""):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, data, etag: Optional[str] = None):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self._send(status, body, "application/json; charset=utf-8", etag)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            try:
+                offset = max(0, int(params.get("offset", 0)))
+                limit = min(1000, max(1, int(params.get("limit", 100))))
+            except ValueError:
+                return self._json(400, {"error": "offset/limit müssen Zahlen sein"})
+            if url.path in ("/", "/index.html"):
+                return self._send(200, page, "text/html; charset=utf-8", page_etag)
+            if not url.path.startswith("/api/"):
+                return self._json(404, {"error": "Nicht gefunden"})
+
+            size, mtime_ns = _csv_stamp(messages_csv)
+            etag = '"%x-%x-%d"' % (size, mtime_ns, INDEX_VERSION)
+            if etag in (self.headers.get("If-None-Match") or ""):
+                return self._send(200, b"", "", etag)
+
+            if url.path == "/api/conversations":
+                hits = find_conversations(messages_csv, params.get("q", ""), limit=limit + 1, offset=offset)
+                return self._json(200, {
+                    "items": [{"id": cid, "title": title} for cid, title in hits[:limit]],
+                    "offset": offset,
+                    "next": offset + limit if len(hits) > limit else None,
+                }, etag)
+            if url.path.startswith("/api/conversations/"):
+                conv_id = urllib.parse.unquote(url.path[len("/api/conversations/"):])
+                messages = cache.get(conv_id, params.get("branches") in ("1", "true"))
+                if not messages:
+                    return self._json(404, {"error": f"Unbekannte Unterhaltung: {conv_id}"})
+                window = messages[offset:offset + limit]
+                return self._json(200, {
+                    "id": conv_id,
+                    "title": messages[0].get("title") or "",
+                    "total": len(messages),
+                    "offset": offset,
+                    "next": offset + limit if offset + limit < len(messages) else None,
+                    "messages": [{k: m.get(k) for k in ("time", "role", "text", "branch")} for m in window],
+                }, etag)
+            if url.path == "/api/search":
+                hits = search_messages(messages_csv, params.get("q", ""), role=params.get("role") or None,
+                                       limit=limit)
+                return self._json(200, {"items": [
+                    {"id": cid, "title": title, "time": time, "role": role, "snippet": snippet}
+                    for cid, title, time, role, snippet in hits
+                ]}, etag)
+            return self._json(404, {"error": "Nicht gefunden"})
+
+    return Handler
+
+
+def make_server(messages_csv: str, host: str = "127.0.0.1", port: int = 8765) -> http.server.ThreadingHTTPServer:
+    """HTTP-Server für --serve. Indizes werden vorab aufgebaut, damit schon die
+    erste Anfrage schnell beantwortet wird."""
+    con = open_index(messages_csv)
+    if con is not None:
+        con.close()
+    update_fulltext_index(messages_csv)
+    return http.server.ThreadingHTTPServer((host, port), make_handler(messages_csv))
 
 
 def autodetect_messages_csv() -> str:
@@ -133,22 +1145,101 @@ def autodetect_messages_csv() -> str:
 
 def main():
     ap = argparse.ArgumentParser(description="Suche & Anzeige für ChatGPT-Export (nutzt messages.csv)")
-    ap.add_argument("-m", "--messages", required=False, default=None, help="Pfad zu messages.csv")
+    ap.add_argument("-m", "--messages", required=False, default=None, help="Pfad zu messages.csv oder zum Zielordner des Splitters (auch mit --partition-by)")
     ap.add_argument("--find", help="Suchwort für Titel oder ID (gibt Trefferliste aus)")
     ap.add_argument("--export", help="Conversation-ID, die als HTML ausgegeben werden soll")
     ap.add_argument("-o", "--output", default="chat_view.html", help="Ziel-HTML-Datei")
+    ap.add_argument("--search", help="Volltextsuche in den Nachrichten (Wörter UND-verknüpft, \"Phrase\", präfix*)")
+    ap.add_argument("--grep", metavar="MUSTER", help="regulären Ausdruck ohne Index direkt in messages.csv (oder den Teil-Dateien) suchen, parallel über alle Kerne")
+    ap.add_argument("--fixed-strings", action="store_true", help="--grep: MUSTER als festen Text suchen (am schnellsten)")
+    ap.add_argument("--ignore-case", action="store_true", help="--grep: Groß-/Kleinschreibung ignorieren")
+    ap.add_argument("--role", help="nur Nachrichten dieser Rolle durchsuchen (user/assistant)")
+    ap.add_argument("--limit", type=int, default=None, help="max. Anzahl Treffer (--search: Standard 20, --grep: alle)")
+    ap.add_argument("--branches", action="store_true", help="--export: auch alternative Zweige anzeigen (falls messages.csv mit --branches erzeugt wurde)")
+    ap.add_argument("--gzip", action="store_true", help="--export/--bulk-export: HTML gzip-komprimiert schreiben (.html.gz)")
+    ap.add_argument("--bulk-export", metavar="ORDNER", help="viele Unterhaltungen in einem Durchgang als HTML (+ index.html) in ORDNER schreiben: alle, oder Auswahl per --ids/--ids-file/--find")
+    ap.add_argument("--ids", help="--bulk-export: kommagetrennte Conversation-IDs")
+    ap.add_argument("--ids-file", help="--bulk-export: Datei mit einer Conversation-ID pro Zeile")
+    ap.add_argument("--workers", type=int, default=None, help="Anzahl Prozesse für --bulk-export (Standard 1) bzw. --grep (Standard: alle Kerne)")
+    ap.add_argument("--serve", action="store_true", help="lokalen Viewer im Browser starten (http://HOST:PORT)")
+    ap.add_argument("--host", default="127.0.0.1", help="Adresse für --serve")
+    ap.add_argument("--port", type=int, default=8765, help="Port für --serve")
+    ap.add_argument("--no-index", action="store_true", help="keinen Sidecar-Index (messages.csv.idx.sqlite) verwenden")
+    ap.add_argument("--build-index", action="store_true", help="Index zu messages.csv (neu) aufbauen")
+    ap.add_argument("--since", help="--find/--search/--bulk-export: nur Unterhaltungen bzw. Nachrichten ab diesem Zeitpunkt (z. B. 2024, 2024-03, 2024-03-15)")
+    ap.add_argument("--until", help="wie --since, bis einschließlich diesem Zeitpunkt")
     args = ap.parse_args()
 
-    messages_csv = args.messages or autodetect_messages_csv()
-    if not messages_csv:
+    messages_path = args.messages or autodetect_messages_csv()
+    if not messages_path:
         print("Konnte messages.csv nicht finden. Bitte mit -m angeben (z. B. parts_small_utf8/messages.csv).")
         return 2
-    if not os.path.exists(messages_csv):
-        print(f"Datei nicht gefunden: {messages_csv}")
+    if not os.path.exists(messages_path):
+        print(f"Datei nicht gefunden: {messages_path}")
         return 2
+    # Mehrere Dateien nur bei --partition-by; Partitionen außerhalb von
+    # --since/--until werden gar nicht erst geöffnet
+    sources = select_sources(messages_path, args.since, args.until)
+    if not sources:
+        print("Keine Partition im angegebenen Zeitraum.")
+        return
+    for messages_csv in sources:
+        # --grep durchsucht ohne messages.csv die Teil-Dateien daneben
+        if not os.path.exists(messages_csv) and not (args.grep and os.path.isdir(messages_path)):
+            print(f"Datei nicht gefunden: {messages_csv}")
+            return 2
+    messages_csv = sources[0]
+    period = {"since": args.since, "until": args.until}
+
+    use_index = not args.no_index
+
+    if args.build_index:
+        for messages_csv in sources:
+            print(f"Index gespeichert: {os.path.abspath(build_index(messages_csv))}")
+        if not (args.find or args.export):
+            return
+
+    if args.serve:
+        if len(sources) > 1:
+            print("--serve zeigt eine messages.csv an; bitte -m auf die Datei einer Partition setzen.")
+            return 2
+        server = make_server(messages_csv, args.host, args.port)
+        print(f"Viewer läuft auf http://{args.host}:{server.server_address[1]}/ (Strg+C beendet)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    if args.bulk_export:
+        ids = None
+        if args.ids or args.ids_file:
+            ids = {i.strip() for i in (args.ids or "").split(",") if i.strip()}
+            if args.ids_file:
+                with open(args.ids_file, encoding="utf-8-sig") as f:
+                    ids.update(line.strip() for line in f if line.strip())
+        entries = []
+        for messages_csv in sources:
+            selected = ids
+            if args.find or args.since or args.until:
+                found = {cid for cid, _ in find_conversations(messages_csv, args.find or "", limit=sys.maxsize,
+                                                              use_index=use_index, **period)}
+                selected = found if ids is None else ids & found
+            entries += export_conversations(messages_csv, args.bulk_export, selected, workers=args.workers or 1,
+                                            use_index=use_index, branches=args.branches, compress=args.gzip)
+        if len(sources) > 1:
+            write_export_index(args.bulk_export, entries)
+        print(f"Fertig. {len(entries)} Unterhaltungen exportiert: {os.path.abspath(os.path.join(args.bulk_export, 'index.html'))}")
+        return
 
     if args.find:
-        hits = find_conversations(messages_csv, args.find)
+        hits = []
+        for messages_csv in sources:
+            hits += find_conversations(messages_csv, args.find, limit=50 - len(hits), use_index=use_index, **period)
+            if len(hits) >= 50:
+                break
         if not hits:
             print("Keine Treffer.")
             return
@@ -157,16 +1248,44 @@ def main():
             print(f"{cid} — {title}")
         return
 
+    if args.search or args.grep:
+        limit = args.limit or (None if args.grep else 20)
+        hits = []
+        for messages_csv in sources:
+            rest = None if limit is None else limit - len(hits)
+            if not args.grep:
+                hits += search_messages(messages_csv, args.search, role=args.role, limit=rest, **period)
+            else:
+                fmt = "csv" if os.path.exists(messages_csv) else "json"
+                matcher = GrepMatcher(args.grep, args.fixed_strings, args.ignore_case, fmt, args.role, **period)
+                workers = args.workers or os.cpu_count() or 1
+                if fmt == "csv":
+                    hits += grep_messages(messages_csv, matcher, workers, rest, use_index)
+                else:
+                    hits += grep_parts(os.path.dirname(messages_csv), matcher, workers, rest)
+            if limit is not None and len(hits) >= limit:
+                break
+        if not hits:
+            print("Keine Treffer.")
+            return
+        for cid, title, time, role, snippet in hits:
+            print(f"{cid} — {title} [{time or '-'} {role}]")
+            print(f"    {' '.join(snippet.split())}")
+        return
+
     if args.export:
-        conv = collect_conversation(messages_csv, args.export)
-        if not conv:
+        for messages_csv in sources:
+            conv = iter_conversation(messages_csv, args.export, use_index=use_index, branches=args.branches)
+            first = next(conv, None)
+            if first is not None:
+                break
+        if first is None:
             print("Keine Nachrichten für diese ID gefunden.")
             return
-        title = conv[0].get("title") or "Unterhaltung"
-        html_text = render_html(conv, title, args.export)
-        with open(args.output, "w", encoding="utf-8") as w:
-            w.write(html_text)
-        print(f"Fertig. Datei gespeichert: {os.path.abspath(args.output)}")
+        title = first.get("title") or "Unterhaltung"
+        output = args.output + (".gz" if args.gzip and not args.output.endswith(".gz") else "")
+        write_html(output, itertools.chain([first], conv), title, args.export, compress=args.gzip)
+        print(f"Fertig. Datei gespeichert: {os.path.abspath(output)}")
         return
 
     ap.print_help()
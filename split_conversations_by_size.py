@@ -3,15 +3,19 @@
 """
 Split a huge ChatGPT `conversations.json` into manageable parts without loading
 the whole file into memory. Creates:
-- conversations_part_XXX.json  (arrays of conversation objects)
+- conversations_part_XXX.json  (arrays of conversation objects; .jsonl with --format jsonl)
 - index.csv  (conversation_id, title, messages, first_ts, last_ts, part_file)
+- offsets.csv  (conversation_id, part, offset, length)  [random access, see --get]
 - messages.csv  (conversation_id, title, ts, role, text)  [optional with --csv]
+- stats.json + stats_*.csv  (messages per month/role, lengths, models)  [optional with --stats]
 
 Usage:
   python split_conversations_by_size.py -i conversations.json --max-convs 200 --max-bytes 50MB --csv
+  python split_conversations_by_size.py -o parts --get <conversation_id>
+  python split_conversations_by_size.py -i parts -o parts --stats-only
 """
-import argparse, csv, datetime as dt, io, json, os, re, sys
-from typing import Iterator, Dict, Any, Optional, Tuple
+import argparse, array, bisect, bz2, collections, concurrent.futures, contextlib, csv, datetime as dt, functools, gzip, hashlib, heapq, io, json, lzma, math, mmap, os, queue, re, shutil, sqlite3, sys, threading, time
+from typing import Iterable, Iterator, Dict, Any, List, NamedTuple, Optional, Tuple
 
 def parse_size(s: str) -> int:
     m = re.match(r"^\s*(\d+)([kKmMgG][bB]?)?\s*$", s or "")
@@ -25,122 +29,563 @@ def parse_size(s: str) -> int:
     elif suffix.startswith("g"): mult = 1024**3
     return n * mult
 
-def iter_top_level_objects(path: str) -> Iterator[Dict[str, Any]]:
-    """Stream parser for a JSON array of objects without loading entire file."""
-    with open(path, "r", encoding="utf-8") as f:
-        # Seek first '['
-        ch = f.read(1)
-        while ch and ch != '[':
-            ch = f.read(1)
-        if ch != '[':
-            raise ValueError("Datei ist kein JSON-Array.")
-        # Consume until first non-space or closing bracket
-        while True:
-            ch = f.read(1)
-            if not ch:
+# Read size for the chunked scanner. Large binary reads keep the interpreter
+# loop off the per-byte path; 8 MB is a good fit for NVMe and spinning disks.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Consumes plain bytes and complete JSON strings (incl. escapes) up to the next
+# structural brace in one regex call. Stops in front of '{', '}' or an
+# unterminated string at the end of the buffer.
+_SKIP_TO_BRACE = re.compile(rb'[^"{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}]*)*', re.S)
+_SKIP_SEPARATORS = re.compile(rb"[\s,]*")
+# JSON Lines input (e.g. parts written with --format jsonl) starts with an
+# object instead of '['; it is split at newlines instead of scanned
+_SKIP_SPACE = re.compile(rb"\s*")
+_LEADING_SPACE = re.compile(rb"(?:\xef\xbb\xbf)?\s*")
+
+def decode_object(raw) -> Dict[str, Any]:
+    """Decode the raw bytes (bytes or memoryview) of one top-level object."""
+    try:
+        if isinstance(raw, memoryview):
+            # Decode straight from the mapped pages, without a bytes copy
+            raw = str(raw, "utf-8", "surrogatepass")
+        return json.loads(raw)
+    except Exception as e:
+        # Write context to help debugging
+        snippet = raw[:200] if isinstance(raw, str) else bytes(raw[:200]).decode("utf-8", "replace")
+        raise RuntimeError(f"JSON-Fehler: {e}\nAusschnitt: {snippet}...") from e
+
+def _scan_object(buf, pos: int, depth: int) -> Tuple[int, int, bool]:
+    """Advance over one object starting at pos.
+
+    Returns (pos, depth, done). With done=True the object ends right before
+    pos; otherwise the buffer ended (possibly inside a string) and scanning
+    has to resume at pos with the returned depth once more data is available.
+    """
+    n = len(buf)
+    while True:
+        pos = _SKIP_TO_BRACE.match(buf, pos).end()
+        if pos >= n:
+            return pos, depth, False
+        c = buf[pos]
+        if c == 0x7B:  # '{'
+            depth += 1
+        elif c == 0x7D:  # '}'
+            depth -= 1
+            if depth == 0:
+                return pos + 1, 0, True
+        else:
+            # string continues beyond the end of the buffer
+            return pos, depth, False
+        pos += 1
+
+# Compressed input is recognized by its magic bytes, compressed output gets the
+# matching file extension. zstd needs the optional `zstandard` package.
+_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"), (b"\x28\xb5\x2f\xfd", "zstd"))
+COMPRESSION_EXT = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz", "zstd": ".zst"}
+
+def _detect_compression(head: bytes) -> Optional[str]:
+    for magic, kind in _MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Für zstd (.zst) wird das Paket 'zstandard' benötigt: pip install zstandard") from None
+    return zstandard
+
+class _ThreadedReader:
+    """Reads (and decompresses) a stream in a background thread.
+
+    At most `depth` chunks are buffered, so memory stays bounded while
+    decompression overlaps with parsing (zlib, bz2, lzma and zstd release
+    the GIL).
+    """
+
+    def __init__(self, stream, chunk_size: int, depth: int = 4):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(depth)
+        self._closed = threading.Event()
+        self._eof = False
+        self._thread = threading.Thread(target=self._run, name="decompress", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._closed.is_set():
+                chunk = self._stream.read(self._chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
                 return
-            if ch.isspace():
+            except queue.Full:
                 continue
-            if ch == ']':
-                return
-            break
-        # Now ch should be '{' (start of an object)
-        while True:
-            buf = io.StringIO()
-            depth = 0
-            in_str = False
-            esc = False
 
-            # We are at first char of the object ('{')
-            while True:
-                if not ch:
-                    break
-                buf.write(ch)
-                if in_str:
-                    if esc:
-                        esc = False
-                    elif ch == "\\":
-                        esc = True
-                    elif ch == '"':
-                        in_str = False
-                else:
-                    if ch == '"':
-                        in_str = True
-                    elif ch == '{':
-                        depth += 1
-                    elif ch == '}':
-                        depth -= 1
-                        if depth == 0:
-                            break
-                ch = f.read(1)
-
-            obj_text = buf.getvalue()
-            if obj_text.strip():
-                try:
-                    yield json.loads(obj_text)
-                except Exception as e:
-                    # Write context to help debugging
-                    raise RuntimeError(f"JSON-Fehler: {e}\nAusschnitt: {obj_text[:200]}...") from e
+    def read(self, n: int = -1) -> bytes:
+        """Next decompressed chunk (size may differ from n); b"" at EOF."""
+        if self._eof:
+            return b""
+        item = self._queue.get()
+        if isinstance(item, BaseException):
+            self._eof = True
+            raise item
+        if not item:
+            self._eof = True
+        return item
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _decompressing_stream(f, kind: str):
+    if kind == "gzip":
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if kind == "bz2":
+        return bz2.BZ2File(f)
+    if kind == "xz":
+        return lzma.LZMAFile(f)
+    return _zstandard().ZstdDecompressor().stream_reader(f, read_across_frames=True)
+
+@contextlib.contextmanager
+def _open_input(path: str, chunk_size: int = CHUNK_SIZE):
+    """Binary input stream; compressed files are decompressed transparently
+    in a background thread."""
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        kind = _detect_compression(f.peek(6)[:6])
+        if kind is None:
+            yield f
+        else:
+            with _ThreadedReader(_decompressing_stream(f, kind), chunk_size) as reader:
+                yield reader
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+def _open_mmap(path: str) -> Optional[mmap.mmap]:
+    """Map the input read-only; None for stdin, pipes, empty and compressed files."""
+    if path == "-":
+        return None
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if _detect_compression(mm[:6]):
+        mm.close()
+        return None
+    return mm
+
+class _CompressedOutput(io.BufferedIOBase):
+    """Binary writer that compresses into `path` (closes the compressor and the file)."""
+
+    def __init__(self, path: str, compression: str, level: Optional[int] = None):
+        super().__init__()
+        self._raw = open(path, "wb")
+        if compression == "gzip":
+            self._f = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6 if level is None else level)
+        elif compression == "bz2":
+            self._f = bz2.BZ2File(self._raw, "wb", compresslevel=9 if level is None else level)
+        elif compression == "xz":
+            self._f = lzma.LZMAFile(self._raw, "wb", preset=level)
+        else:
+            self._f = _zstandard().ZstdCompressor(level=3 if level is None else level).stream_writer(
+                self._raw, closefd=False)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        return self._f.write(data)
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+            self._raw.close()
+        super().close()
 
+def open_output(path: str, compression: Optional[str] = None, level: Optional[int] = None):
+    """Binary output file, optionally compressed (path gets no extra extension here)."""
+    if compression is None:
+        return open(path, "wb")
+    return _CompressedOutput(path, compression, level)
+
+def open_text_output(path: str, compression: Optional[str] = None, level: Optional[int] = None):
+    """Text output for the CSV writers: UTF-8 with BOM, newline untranslated."""
+    if compression is None:
+        return open(path, "w", newline="", encoding="utf-8-sig")
+    return io.TextIOWrapper(open_output(path, compression, level), encoding="utf-8-sig", newline="")
+
+def _strip_span(buf, start: int, end: int) -> Tuple[int, int]:
+    start = _SKIP_SPACE.match(buf, start, end).end()
+    while end > start and buf[end - 1] in b" \t\r":
+        end -= 1
+    return start, end
+
+def _iter_line_spans(buf, pos: int) -> Iterator[Tuple[int, int]]:
+    """(start, end) of every non-blank line from pos on (JSON Lines)."""
+    n = len(buf)
+    while pos < n:
+        nl = buf.find(b"\n", pos)
+        end = n if nl < 0 else nl
+        start, end = _strip_span(buf, pos, end)
+        if start < end:
+            yield start, end
+        pos = (n if nl < 0 else nl) + 1
+
+def _iter_raw_lines(f, buf: bytes, base: int, chunk_size: int) -> Iterator[Tuple[int, bytes]]:
+    """(offset, raw) of every non-blank line of a JSON Lines stream; buf is
+    what was already read, starting at offset base."""
+    buf, pos, eof = bytearray(buf), 0, False
+    while True:
+        nl = buf.find(b"\n", pos)
+        if nl < 0 and not eof:
+            del buf[:pos]
+            base += pos
+            pos = 0
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf += chunk
+            continue
+        start, end = _strip_span(buf, pos, len(buf) if nl < 0 else nl)
+        if start < end:
+            yield base + start, memoryview(buf)[start:end].tobytes()
+        if nl < 0:
+            return
+        pos = nl + 1
+
+def iter_object_spans(buf, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) byte offsets of all objects in a complete buffer
+    (bytes or mmap) holding a top-level JSON array or JSON Lines. A non-zero
+    start is the offset of an object inside the input (see --resume)."""
+    if start:
+        pos = start
+    else:
+        first = _LEADING_SPACE.match(buf).end()
+        if buf[first:first + 1] == b"{":
+            yield from _iter_line_spans(buf, first)
+            return
+        pos = buf.find(b"[")
+        if pos < 0:
+            raise ValueError("Datei ist kein JSON-Array.")
+        pos += 1
+    n = len(buf)
+    while True:
+        # Move to the start of the next object (or end ']')
+        pos = _SKIP_SEPARATORS.match(buf, pos).end()
+        if pos >= n or buf[pos] == 0x5D:  # ']'
+            return
+        start = pos
+        pos, _, done = _scan_object(buf, pos, 0)
+        if not done:
+            # Truncated object: let the decoder report it
+            raw = buf[start:]
+            if raw.strip():
+                decode_object(raw)
+            return
+        yield start, pos
+
+def _skip_input(f, n: int, chunk_size: int) -> bytes:
+    """Advance a fresh binary input stream to offset n (seek where possible).
+
+    Returns what was read beyond n: decompressing readers hand out whole
+    chunks.
+    """
+    if getattr(f, "seekable", lambda: False)():
+        f.seek(n)
+        return b""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise ValueError("Eingabe ist kürzer als der Checkpoint (andere Datei?).")
+        if len(chunk) >= n:
+            return chunk[n:]
+        n -= len(chunk)
+
+def iter_raw_objects(path: str, chunk_size: int = CHUNK_SIZE, use_mmap: bool = False,
+                     start: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Yield (byte_offset, raw_bytes) for every object of a top-level JSON array.
+
+    The file is read in binary chunks; object boundaries are found with bulk
+    regex searches over quotes, escapes and braces, and each object is cut out
+    as a single slice. JSON Lines input (one object per line) is split at
+    newlines without scanning the objects. With use_mmap the file is memory-mapped instead (falls
+    back to chunked reads where mapping is not possible, e.g. stdin). start
+    continues at the object beginning at that (decompressed) offset.
+    """
+    mm = _open_mmap(path) if use_mmap else None
+    if mm is not None:
+        with mm:
+            for begin, end in iter_object_spans(mm, start):
+                yield begin, mm[begin:end]
+        return
+
+    with _open_input(path, chunk_size) as f:
+        buf = bytearray()
+        base = 0  # file offset of buf[0]
+        if start:
+            buf += _skip_input(f, start, chunk_size)
+            base = start
+        # Seek first '[' (or the first line of JSON Lines)
+        while not start:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError("Datei ist kein JSON-Array.")
+            first = _LEADING_SPACE.match(chunk).end()
+            if first == len(chunk):
+                base += len(chunk)
+                continue
+            if chunk[first] == 0x7B:  # '{'
+                yield from _iter_raw_lines(f, chunk[first:], base + first, chunk_size)
+                return
+            i = chunk.find(b"[")
+            if i >= 0:
+                buf += chunk[i + 1:]
+                base += i + 1
+                break
+            base += len(chunk)
+
+        pos, eof = 0, False
+        while True:
             # Move to the start of the next object (or end ']')
-            while True:
-                ch = f.read(1)
-                if not ch:
+            pos = _SKIP_SEPARATORS.match(buf, pos).end()
+            if pos == len(buf):
+                if eof:
                     return
-                if ch.isspace():
-                    continue
-                if ch == ',':
-                    # move to next non-space
-                    while True:
-                        ch = f.read(1)
-                        if not ch:
-                            return
-                        if ch.isspace():
-                            continue
-                        break
-                    # ch is next object's first char or ']'
-                    if ch == ']':
-                        return
+                del buf[:pos]
+                base += pos
+                pos = 0
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf += chunk
+                continue
+            if buf[pos] == 0x5D:  # ']'
+                return
+
+            start, depth = pos, 0
+            while True:
+                pos, depth, done = _scan_object(buf, pos, depth)
+                if done:
                     break
-                elif ch == ']':
+                if eof:
+                    # Truncated object: let the decoder report it
+                    raw = bytes(buf[start:])
+                    if raw.strip():
+                        decode_object(raw)
                     return
-                else:
-                    # ch is next object's first char
-                    break
+                # Drop everything before the current object, then refill
+                del buf[:start]
+                base += start
+                pos -= start
+                start = 0
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf += chunk
+
+            yield base + start, memoryview(buf)[start:pos].tobytes()
+
+def iter_top_level_objects(path: str, chunk_size: int = CHUNK_SIZE, use_mmap: bool = False,
+                           start: int = 0, offsets: Optional[collections.deque] = None) -> Iterator[Dict[str, Any]]:
+    """Stream parser for a JSON array of objects without loading entire file.
+
+    use_mmap maps the file and decodes every object directly from a
+    memoryview over the map (zero-copy); stdin and pipes fall back to
+    chunked reads. start and offsets as for iter_prepared (--resume).
+    """
+    mm = _open_mmap(path) if use_mmap else None
+    if mm is None:
+        for offset, raw in iter_raw_objects(path, chunk_size, start=start):
+            if offsets is not None:
+                offsets.append(offset)
+            yield decode_object(raw)
+        return
+    with mm:
+        view = memoryview(mm)
+        try:
+            for begin, end in iter_object_spans(mm, start):
+                if offsets is not None:
+                    offsets.append(begin)
+                with view[begin:end] as span:
+                    obj = decode_object(span)
+                yield obj
+        finally:
+            view.release()
+
+def _join_parts(parts: Any, extras: bool = False) -> str:
+    if parts.__class__ is not list:
+        return ""
+    if len(parts) == 1 and parts[0].__class__ is str:
+        return parts[0]  # fast path: plain single-part message
+    texts = []
+    for p in parts:
+        if isinstance(p, str):
+            texts.append(p)
+        elif isinstance(p, dict):
+            # OpenAI often uses {"text": "..."} for structured content
+            if "text" in p and isinstance(p["text"], str):
+                texts.append(p["text"])
+            elif extras:
+                placeholder = _part_placeholder(p)
+                if placeholder:
+                    texts.append(placeholder)
+    return "\n".join(texts)
+
+def _part_placeholder(part: Dict[str, Any]) -> str:
+    kind = part.get("content_type")
+    if kind == "image_asset_pointer":
+        return f"[Bild: {part.get('asset_pointer', '')}]"
+    if kind in ("audio_asset_pointer", "real_time_user_audio_video_asset_pointer"):
+        return f"[Audio: {part.get('asset_pointer') or (part.get('audio_asset_pointer') or {}).get('asset_pointer', '')}]"
+    return f"[{kind}]" if kind else ""
+
+def _text_field(content: Dict[str, Any], extras: bool) -> str:
+    text = content.get("text")
+    return text if isinstance(text, str) else ""
+
+def _tool_output(content: Dict[str, Any], extras: bool) -> str:
+    return _text_field(content, extras) if extras else ""
+
+def _tether_quote(content: Dict[str, Any], extras: bool) -> str:
+    text = _text_field(content, extras)
+    if extras and (content.get("title") or content.get("url")):
+        text = f"[{content.get('title') or ''} {content.get('url') or ''}]".replace(" ]", "]") + "\n" + text
+    return text
+
+def _browsing_display(content: Dict[str, Any], extras: bool) -> str:
+    result = content.get("result")
+    return result if extras and isinstance(result, str) else ""
+
+def _thoughts(content: Dict[str, Any], extras: bool) -> str:
+    if not extras:
+        return ""
+    if isinstance(content.get("content"), str):  # reasoning_recap
+        return content["content"]
+    return "\n".join(t.get("content", "") for t in content.get("thoughts") or () if isinstance(t, dict))
+
+# Text extractors per content.content_type. Types missing here go through the
+# generic handling below (parts / list / str).
+CONTENT_HANDLERS = {
+    "text": None,  # parts, see _join_parts
+    "multimodal_text": None,
+    "code": _text_field,
+    "reasoning_recap": _thoughts,
+    "execution_output": _tool_output,
+    "system_error": _tool_output,
+    "tether_quote": _tether_quote,
+    "tether_browsing_display": _browsing_display,
+    "thoughts": _thoughts,
+}
+
+def clean_text_from_message_content(content: Any, extras: bool = False) -> str:
+    """Text of a message's content, dispatched on content["content_type"].
 
-def clean_text_from_message_content(content: Any) -> str:
+    extras adds tool output, browsing results, quotes with their source and
+    placeholders for images/audio that plain text mode leaves out.
+    """
     # Export formats vary: sometimes {"parts": ["text"...]}, sometimes arrays of dicts, tools, images, etc.
     if content is None:
         return ""
-    if isinstance(content, dict) and "parts" in content:
-        parts = content.get("parts", [])
-        texts = []
-        for p in parts:
-            if isinstance(p, str):
-                texts.append(p)
-            elif isinstance(p, dict):
-                # OpenAI often uses {"text": "..."} for structured content
-                if "text" in p and isinstance(p["text"], str):
-                    texts.append(p["text"])
-        return "\n".join(texts)
+    if isinstance(content, dict):
+        handler = CONTENT_HANDLERS.get(content.get("content_type"))
+        if handler is None:
+            return _join_parts(content.get("parts"), extras)
+        return handler(content, extras)
     if isinstance(content, list):
-        texts = []
-        for p in content:
-            if isinstance(p, str):
-                texts.append(p)
-            elif isinstance(p, dict):
-                if "text" in p and isinstance(p["text"], str):
-                    texts.append(p["text"])
-        return "\n".join(texts)
+        return _join_parts(content, extras)
     if isinstance(content, str):
         return content
     return ""
 
-def summarize_conversation(conv: Dict[str, Any]) -> Tuple[int, Optional[float], Optional[float]]:
+def message_text(msg: Dict[str, Any], extras: bool = False) -> str:
+    """clean_text_from_message_content() plus, with extras, attachment names
+    and citations from the message metadata."""
+    text = clean_text_from_message_content(msg.get("content"), extras)
+    if not extras:
+        return text
+    metadata = msg.get("metadata") or {}
+    notes = [f"[Anhang: {a.get('name') or a.get('id')}]" for a in metadata.get("attachments") or ()
+             if isinstance(a, dict)]
+    for c in metadata.get("citations") or ():
+        meta = (c or {}).get("metadata") or {}
+        source = " ".join(v for v in (meta.get("title"), meta.get("url")) if v)
+        if source:
+            notes.append(f"[Quelle: {source}]")
+    return "\n".join(([text] if text else []) + notes)
+
+def iter_thread(conv: Dict[str, Any], branches: bool = False) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (branch_id, node) along the active thread of a conversation.
+
+    Follows the parent links from current_node back to the root once, so
+    regenerated/edited alternatives are skipped. The active thread has the
+    branch id "". With branches=True every alternate branch follows the
+    active thread, tagged with the id of its first node; inside a branch the
+    first child continues it, every other child starts a new one.
+    Exports without a usable current_node fall back to mapping order.
+    """
     mapping = conv.get("mapping") or {}
+    node_id = conv.get("current_node")
+    if node_id not in mapping:
+        for node in mapping.values():
+            yield "", node
+        return
+    path, seen = [], set()
+    while node_id in mapping and node_id not in seen:
+        seen.add(node_id)
+        path.append(node_id)
+        node_id = (mapping[node_id] or {}).get("parent")
+    path.reverse()
+    for node_id in path:
+        yield "", mapping[node_id]
+    if not branches:
+        return
+
+    children: Dict[str, List[str]] = {}
+    for node_id, node in mapping.items():
+        parent = (node or {}).get("parent")
+        if "children" in (node or {}):
+            children.setdefault(node_id, []).extend(k for k in node["children"] or () if k in mapping)
+        if parent in mapping and "children" not in (mapping[parent] or {}):
+            children.setdefault(parent, []).append(node_id)  # no children list: derive from parent links
+
+    for node_id in path:
+        for child in children.get(node_id, ()):
+            if child in seen:
+                continue
+            stack = [(child, child)]
+            while stack:
+                branch_id, current = stack.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                yield branch_id, mapping[current]
+                kids = [k for k in children.get(current, ()) if k not in seen]
+                # first child continues the branch; push it last so it comes out first
+                stack.extend((k, k) for k in reversed(kids[1:]))
+                if kids:
+                    stack.append((branch_id, kids[0]))
+
+def summarize_conversation(conv: Dict[str, Any]) -> Tuple[int, Optional[float], Optional[float]]:
     first_ts = last_ts = None
     msg_count = 0
-    for node in mapping.values():
+    for _, node in iter_thread(conv):
         msg = (node or {}).get("message") or {}
         role = (msg.get("author") or {}).get("role")
         if role in ("user", "assistant"):
@@ -159,103 +604,1839 @@ def iso_from_ts(ts: Optional[float]) -> Optional[str]:
     except Exception:
         return None
 
-def write_part(part_idx: int, objs: list, out_dir: str) -> str:
-    fn = os.path.join(out_dir, f"conversations_part_{part_idx:03d}.json")
+def _escape_line_separators(text: str) -> str:
     # Schreibe mit beibehaltener Unicode-Darstellung, ersetze jedoch
     # die seltenen Unicode-Zeilenseparatoren U+2028/U+2029 durch
     # \u-Escapes, damit Editoren keine Warnung zu "unusual line terminators" zeigen.
-    text = json.dumps(objs, ensure_ascii=False)
-    text = text.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
-    with open(fn, "w", encoding="utf-8") as w:
-        w.write(text)
+    return text.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+
+def encode_conversation(conv: Dict[str, Any]) -> bytes:
+    """Serialize one conversation exactly as it is written into a part file."""
+    return _escape_line_separators(json.dumps(conv, ensure_ascii=False)).encode("utf-8")
+
+def write_part(part_idx: int, objs: list, out_dir: str) -> str:
+    fn = os.path.join(out_dir, f"conversations_part_{part_idx:03d}.json")
+    with open(fn, "wb") as w:
+        w.write(b"[")
+        for i, obj in enumerate(objs):
+            if i:
+                w.write(b", ")
+            w.write(encode_conversation(obj))
+        w.write(b"]")
     return fn
 
+class PartWriter:
+    """Streams encoded conversations into conversations_part_XXX.json files.
+
+    Every conversation is written as soon as it arrives, so only the current
+    conversation is held in memory; the part file is finished once the next
+    one would exceed max_convs or max_bytes. fmt="jsonl" writes one
+    conversation per line (conversations_part_XXX.jsonl) instead of an array.
+    """
+
+    def __init__(self, out_dir: str, max_convs: int, max_bytes: int, part_idx: int = 1,
+                 compression: Optional[str] = None, level: Optional[int] = None, compressed_limit: bool = False,
+                 fmt: str = "json"):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.max_convs = max_convs
+        self.max_bytes = max_bytes
+        self.part_idx = part_idx
+        self.compression = compression
+        self.level = level
+        # max_bytes applies to the compressed size, estimated with the
+        # compression ratio of the previous part (1.0 for the first one)
+        self.compressed_limit = compressed_limit and compression is not None
+        self.ratio = 1.0
+        self.count = 0
+        self.cur_bytes = 0
+        # Uncompressed position in the current part; last_offset/last_length
+        # locate the most recently added conversation (recorded in offsets.csv)
+        self.pos = 0
+        self.last_offset = 0
+        self.last_length = 0
+        self._f = None
+
+    @property
+    def part_name(self) -> str:
+        return f"conversations_part_{self.part_idx:03d}.{self.fmt}" + COMPRESSION_EXT.get(self.compression, "")
+
+    def size_estimate(self, n: int) -> float:
+        """Size that n uncompressed bytes count against max_bytes."""
+        return n * self.ratio if self.compressed_limit else n
+
+    def full(self, n: int) -> bool:
+        """True if n more bytes start a new part (the current one is flushed first)."""
+        return bool(self.count) and (self.count >= self.max_convs
+                                     or self.size_estimate(self.cur_bytes + n) > self.max_bytes)
+
+    def add(self, data: bytes) -> str:
+        """Append one encoded conversation; returns the part file it landed in."""
+        # ✅ FIX 1+2: Flush BEFORE adding if would exceed limit (handles edge case: single conv > max_bytes)
+        if self.full(len(data)):
+            self.flush()
+        if self.fmt == "jsonl":
+            if self._f is None:
+                self._f = open_output(os.path.join(self.out_dir, self.part_name), self.compression, self.level)
+            if b"\n" in data or b"\r" in data:
+                # Only whitespace between tokens (raw mode): JSON strings cannot hold raw line breaks
+                data = data.replace(b"\r", b" ").replace(b"\n", b" ")
+            self._f.write(data)
+            self._f.write(b"\n")
+            self.last_offset = self.pos
+            self.pos += len(data) + 1
+        else:
+            if self._f is None:
+                self._f = open_output(os.path.join(self.out_dir, self.part_name), self.compression, self.level)
+                self._f.write(b"[")
+                self.pos = 1
+            else:
+                self._f.write(b", ")
+                self.pos += 2
+            self._f.write(data)
+            self.last_offset = self.pos
+            self.pos += len(data)
+        self.last_length = len(data)
+        self.count += 1
+        self.cur_bytes += len(data)
+        return self.part_name
+
+    def flush(self) -> Optional[str]:
+        """Close the current part; returns its path (None if nothing was written)."""
+        if self._f is None:
+            return None
+        if self.fmt != "jsonl":
+            self._f.write(b"]")
+        self._f.close()
+        self._f = None
+        fn = os.path.join(self.out_dir, self.part_name)
+        if self.compressed_limit and self.cur_bytes:
+            self.ratio = os.path.getsize(fn) / self.cur_bytes
+        self.part_idx += 1
+        self.count = 0
+        self.cur_bytes = 0
+        self.pos = 0
+        return fn
+
+    def close(self) -> Optional[str]:
+        return self.flush()
+
+# --columnar: column types are "str", "time" (epoch seconds, float64, NaN =
+# missing), "int" (int32) and "role" (dictionary-encoded uint8).
+COLUMNAR_SCHEMAS = {
+    "messages": [("conversation_id", "str"), ("time", "time"), ("role", "role"), ("text", "str"),
+                 ("branch", "str")],
+    "index": [("conversation_id", "str"), ("title", "str"), ("messages", "int"),
+              ("first_time", "time"), ("last_time", "time"), ("part_file", "str")],
+}
+COLUMNAR_ROW_GROUP = 65536
+
+def _pyarrow():
+    try:
+        import pyarrow, pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+class _BuiltinColumnarTable:
+    """Pure-Python column store: <name>.columnar/ with one file per column and
+    row group (typed arrays, strings as offsets + UTF-8 blob) and meta.json
+    holding types, row counts and per-group time range / roles for pruning.
+    """
+
+    def __init__(self, path: str, schema: List[Tuple[str, str]], row_group_size: int):
+        self.path = path
+        self.schema = schema
+        self.row_group_size = row_group_size
+        os.makedirs(path, exist_ok=True)
+        self.meta = {"format": "gpt-export-columnar", "version": 1, "byteorder": sys.byteorder,
+                     "schema": schema, "roles": [], "row_groups": []}
+        self._role_codes: Dict[Any, int] = {}
+        self._cols: List[list] = [[] for _ in schema]
+
+    def add(self, row) -> None:
+        for col, value in zip(self._cols, row):
+            col.append(value)
+        if len(self._cols[0]) >= self.row_group_size:
+            self._flush_group()
+
+    def _role_code(self, role) -> int:
+        code = self._role_codes.get(role)
+        if code is None:
+            code = self._role_codes[role] = len(self.meta["roles"])
+            self.meta["roles"].append(role)
+        return code
+
+    def _flush_group(self) -> None:
+        rows = len(self._cols[0])
+        if not rows:
+            return
+        group = {"rows": rows, "stats": {}}
+        prefix = os.path.join(self.path, f"rg{len(self.meta['row_groups']):05d}.")
+        for (name, kind), values in zip(self.schema, self._cols):
+            if kind == "str":
+                encoded = [("" if v is None else str(v)).encode("utf-8", "surrogatepass") for v in values]
+                offsets = array.array("Q", [0])
+                pos = 0
+                for e in encoded:
+                    pos += len(e)
+                    offsets.append(pos)
+                blob = b"".join(encoded)
+                data = offsets.tobytes() + blob
+            elif kind == "time":
+                arr = array.array("d", (math.nan if v is None else float(v) for v in values))
+                known = [v for v in arr if v == v]
+                group["stats"][name] = [min(known), max(known)] if known else None
+                data = arr.tobytes()
+            elif kind == "int":
+                data = array.array("i", (v or 0 for v in values)).tobytes()
+            else:  # role
+                codes = bytes(self._role_code(v) for v in values)
+                group["stats"][name] = sorted({self.meta["roles"][c] for c in set(codes)}, key=str)
+                data = codes
+            with open(prefix + name, "wb") as w:
+                w.write(data)
+        self.meta["row_groups"].append(group)
+        self._cols = [[] for _ in self.schema]
+
+    def close(self) -> None:
+        self._flush_group()
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as w:
+            json.dump(self.meta, w, ensure_ascii=False, indent=1)
+
+class _ParquetTable:
+    """Parquet file written with pyarrow, one row group per row_group_size rows."""
+
+    def __init__(self, path: str, schema: List[Tuple[str, str]], row_group_size: int, pa):
+        self.pa = pa
+        types = {"str": pa.string(), "time": pa.timestamp("us", tz="UTC"), "int": pa.int32(),
+                 "role": pa.dictionary(pa.int8(), pa.string())}
+        self.schema = schema
+        self.pa_schema = pa.schema([(name, types[kind]) for name, kind in schema])
+        self.row_group_size = row_group_size
+        self._writer = pa.parquet.ParquetWriter(path, self.pa_schema)
+        self._cols: List[list] = [[] for _ in schema]
+
+    def add(self, row) -> None:
+        for col, value in zip(self._cols, row):
+            col.append(value)
+        if len(self._cols[0]) >= self.row_group_size:
+            self._flush_group()
+
+    def _flush_group(self) -> None:
+        if not self._cols[0]:
+            return
+        pa, arrays = self.pa, []
+        for (name, kind), values, field in zip(self.schema, self._cols, self.pa_schema):
+            if kind == "time":
+                values = [None if v is None else int(v * 1_000_000) for v in values]
+            if kind == "role":
+                arrays.append(pa.array(values, pa.string()).dictionary_encode().cast(field.type))
+            else:
+                arrays.append(pa.array(values, field.type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.pa_schema))
+        self._cols = [[] for _ in self.schema]
+
+    def close(self) -> None:
+        self._flush_group()
+        self._writer.close()
+
+class ColumnarWriter:
+    """--columnar: messages and index as typed column tables in row groups.
+
+    Writes messages.parquet/index.parquet if pyarrow is installed, otherwise
+    messages.columnar/ and index.columnar/ in the built-in format (see
+    read_columnar).
+    """
+
+    def __init__(self, out_dir: str, fmt: str = "auto", row_group_size: int = COLUMNAR_ROW_GROUP):
+        pa = _pyarrow() if fmt in ("auto", "parquet") else None
+        if fmt == "parquet" and pa is None:
+            raise RuntimeError("Für --columnar-format parquet wird das Paket 'pyarrow' benötigt: pip install pyarrow")
+        self.format = "parquet" if pa is not None else "builtin"
+        self.tables = {}
+        for name, schema in COLUMNAR_SCHEMAS.items():
+            if pa is not None:
+                self.tables[name] = _ParquetTable(os.path.join(out_dir, name + ".parquet"), schema, row_group_size, pa)
+            else:
+                self.tables[name] = _BuiltinColumnarTable(os.path.join(out_dir, name + ".columnar"), schema,
+                                                          row_group_size)
+
+    def add_conversation(self, conv_id, title, msgs, first_ts, last_ts, part_name, messages) -> None:
+        self.tables["index"].add((conv_id, title, msgs, first_ts, last_ts, part_name))
+        table = self.tables["messages"]
+        for ts, role, text, branch in messages or ():
+            table.add((conv_id, ts if isinstance(ts, (int, float)) else None, role, text, branch))
+
+    def close(self) -> None:
+        for table in self.tables.values():
+            table.close()
+
+def iter_columnar_groups(path: str, columns: Optional[List[str]] = None, roles: Optional[List[str]] = None,
+                         since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Read a built-in columnar table (<name>.columnar) row group by row group.
+
+    Only the requested columns (plus those needed for filtering) are read.
+    Row groups whose time range or roles cannot match are skipped entirely.
+    Yields {column: values}: array("d") for times, array("i") for ints,
+    lists of str otherwise.
+    """
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    kinds = dict((name, kind) for name, kind in meta["schema"])
+    columns = list(columns or kinds)
+    time_col = next((n for n, k in meta["schema"] if k == "time"), None)
+    role_col = next((n for n, k in meta["schema"] if k == "role"), None)
+    swap = meta["byteorder"] != sys.byteorder
+    wanted_roles = set(roles) if roles else None
+    needed = list(dict.fromkeys(columns + ([time_col] if since is not None or until is not None else [])
+                                + ([role_col] if wanted_roles else [])))
+
+    def load(prefix, name, rows):
+        with open(prefix + name, "rb") as fh:
+            data = fh.read()
+        kind = kinds[name]
+        if kind == "role":
+            return [meta["roles"][c] for c in data]
+        if kind == "str":
+            offsets = array.array("Q")
+            offsets.frombytes(data[:8 * (rows + 1)])
+            if swap:
+                offsets.byteswap()
+            blob = data[8 * (rows + 1):]
+            return [blob[offsets[i]:offsets[i + 1]].decode("utf-8", "surrogatepass") for i in range(rows)]
+        arr = array.array("d" if kind == "time" else "i")
+        arr.frombytes(data)
+        if swap:
+            arr.byteswap()
+        return arr
+
+    for i, group in enumerate(meta["row_groups"]):
+        stats = group["stats"]
+        if time_col and (since is not None or until is not None):
+            rng = stats.get(time_col)
+            if rng is None or (since is not None and rng[1] < since) or (until is not None and rng[0] > until):
+                continue
+        if wanted_roles and role_col and not wanted_roles.intersection(stats.get(role_col) or ()):
+            continue
+        prefix = os.path.join(path, f"rg{i:05d}.")
+        data = {name: load(prefix, name, group["rows"]) for name in needed}
+        if since is None and until is None and not wanted_roles:
+            yield {name: data[name] for name in columns}
+            continue
+        keep = [j for j in range(group["rows"])
+                if (since is None or data[time_col][j] >= since)
+                and (until is None or data[time_col][j] <= until)
+                and (not wanted_roles or data[role_col][j] in wanted_roles)]
+        out = {}
+        for name in columns:
+            values = data[name]
+            selected = [values[j] for j in keep]
+            out[name] = array.array(values.typecode, selected) if isinstance(values, array.array) else selected
+        yield out
+
+def read_columnar(path: str, columns: Optional[List[str]] = None, roles: Optional[List[str]] = None,
+                  since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, Any]:
+    """Whole table as {column: values}; .parquet files are read with pyarrow."""
+    if path.endswith(".parquet"):
+        pa = _pyarrow()
+        if pa is None:
+            raise RuntimeError("Zum Lesen von Parquet wird das Paket 'pyarrow' benötigt: pip install pyarrow")
+        filters = []
+        if roles:
+            filters.append(("role", "in", list(roles)))
+        if since is not None:
+            filters.append(("time", ">=", dt.datetime.fromtimestamp(since, dt.timezone.utc)))
+        if until is not None:
+            filters.append(("time", "<=", dt.datetime.fromtimestamp(until, dt.timezone.utc)))
+        return pa.parquet.read_table(path, columns=columns, filters=filters or None).to_pydict()
+    result: Dict[str, Any] = {}
+    for group in iter_columnar_groups(path, columns, roles, since, until):
+        for name, values in group.items():
+            if name in result:
+                result[name].extend(values)
+            else:
+                result[name] = values
+    return result
+
+def extract_messages(conv: Dict[str, Any], branches: bool = False,
+                     extras: bool = False) -> List[Tuple[Optional[float], str, str, str]]:
+    """(create_time, role, text, branch_id) of the user/assistant messages in
+    thread order (see iter_thread). extras adds tool messages and the extra
+    text of message_text()."""
+    roles = ("user", "assistant", "tool") if extras else ("user", "assistant")
+    messages = []
+    for branch, node in iter_thread(conv, branches):
+        msg = (node or {}).get("message") or {}
+        role = (msg.get("author") or {}).get("role")
+        if role not in roles:
+            continue
+        ts = msg.get("create_time")
+        txt = message_text(msg, extras) if extras else clean_text_from_message_content((msg.get("content") or {}))
+        messages.append((ts, role, txt, branch))
+    return messages
+
+def message_stats(conv: Dict[str, Any], extras: bool = False) -> List[Tuple[Optional[float], str, int, str]]:
+    """(create_time, role, characters, model_slug) of the active-thread
+    messages that extract_messages() returns for the same extras setting
+    (--stats), so the counts match messages.csv (and index.csv without
+    extras). characters is the length of the messages.csv text; model_slug
+    is "" where the metadata names none."""
+    roles = ("user", "assistant", "tool") if extras else ("user", "assistant")
+    rows = []
+    for _, node in iter_thread(conv):
+        msg = (node or {}).get("message") or {}
+        role = (msg.get("author") or {}).get("role")
+        if role not in roles:
+            continue
+        ts = msg.get("create_time")
+        txt = message_text(msg, extras) if extras else clean_text_from_message_content((msg.get("content") or {}))
+        model = (msg.get("metadata") or {}).get("model_slug") or ""
+        rows.append((ts if isinstance(ts, (int, float)) else None, role, len(txt), str(model)))
+    return rows
+
+def csv_rows(conv_id, title, messages, branches: bool = False) -> Iterator[list]:
+    """messages.csv rows (conversation_id, title, time, role, text[, branch])."""
+    for ts, role, txt, branch in messages:
+        if branches:
+            yield [conv_id, title, iso_from_ts(ts), role, txt, branch]
+        else:
+            yield [conv_id, title, iso_from_ts(ts), role, txt]
+
+def prepare_conversation(conv: Dict[str, Any], with_messages: bool, branches: bool = False,
+                         stages: Optional[Dict[str, float]] = None, extras: bool = False,
+                         stats: bool = False) -> Tuple:
+    """Everything the collector in main() needs for one conversation:
+    (conv_id, title, msgs, first_ts, last_ts, messages, encoded_bytes, stats_rows).
+    The conversation is serialized exactly once; the part size accounting
+    uses the length of those bytes. stages (--profile-out) accumulates the
+    seconds spent per step. stats_rows (message_stats) is None without stats.
+    """
+    if stages is None:
+        msgs, first_ts, last_ts = summarize_conversation(conv)
+        messages = extract_messages(conv, branches, extras) if with_messages else None
+        return (conv.get("id"), conv.get("title"), msgs, first_ts, last_ts, messages, encode_conversation(conv),
+                message_stats(conv, extras) if stats else None)
+    t0 = time.perf_counter()
+    msgs, first_ts, last_ts = summarize_conversation(conv)
+    t1 = time.perf_counter()
+    messages = extract_messages(conv, branches, extras) if with_messages else None
+    stats_rows = message_stats(conv, extras) if stats else None
+    t2 = time.perf_counter()
+    data = encode_conversation(conv)
+    t3 = time.perf_counter()
+    _add_stage(stages, "summarize", t1 - t0)
+    _add_stage(stages, "messages", t2 - t1)
+    _add_stage(stages, "serialize", t3 - t2)
+    return conv.get("id"), conv.get("title"), msgs, first_ts, last_ts, messages, data, stats_rows
+
+# Message bodies: the value of every "parts" key. A literal key can only match
+# structure, since quotes inside JSON strings are always escaped.
+_PARTS_KEY = re.compile(rb'"parts"\s*:\s*\[')
+_SKIP_TO_BRACKET = re.compile(rb'[^"\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]]*)*', re.S)
+
+def strip_message_parts(raw: bytes) -> bytes:
+    """Return raw with every "parts" array emptied.
+
+    Cheap partial parse for --raw: the remaining document still holds ids,
+    titles, authors and timestamps, but decoding it skips the message texts.
+    """
+    out, last = [], 0
+    for m in _PARTS_KEY.finditer(raw):
+        pos = m.end()
+        if pos <= last:
+            continue
+        start, depth = pos, 1
+        while True:
+            pos = _SKIP_TO_BRACKET.match(raw, pos).end()
+            if pos >= len(raw):
+                # Unbalanced, let the decoder report the original bytes
+                return raw
+            if raw[pos] == 0x5B:  # '['
+                depth += 1
+            elif raw[pos] == 0x5D:  # ']'
+                depth -= 1
+                if depth == 0:
+                    break
+            pos += 1
+        out.append(raw[last:start])
+        last = pos
+    if not out:
+        return raw
+    out.append(raw[last:])
+    return b"".join(out)
+
+def prepare_raw(raw: bytes, with_messages: bool, branches: bool = False,
+                stages: Optional[Dict[str, float]] = None, extras: bool = False,
+                stats: bool = False) -> Tuple:
+    """prepare_conversation() for --raw: the original bytes go into the part
+    file unchanged (apart from the U+2028/U+2029 escapes), so nothing is
+    re-serialized. Without messages.csv or stats the message texts are not
+    decoded.
+    """
+    t0 = time.perf_counter() if stages is not None else 0.0
+    conv = decode_object(raw if with_messages or stats else strip_message_parts(raw))
+    t1 = time.perf_counter() if stages is not None else 0.0
+    msgs, first_ts, last_ts = summarize_conversation(conv)
+    messages = extract_messages(conv, branches, extras) if with_messages else None
+    stats_rows = message_stats(conv, extras) if stats else None
+    data = raw.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")  # UTF-8 of U+2028/U+2029
+    if stages is not None:
+        _add_stage(stages, "decode", t1 - t0)
+        _add_stage(stages, "summarize", time.perf_counter() - t1)
+    return conv.get("id"), conv.get("title"), msgs, first_ts, last_ts, messages, data, stats_rows
+
+def _prepare_raw_batch(batch: List[bytes], with_messages: bool, raw_mode: bool,
+                       branches: bool = False, stages: Optional[Dict[str, float]] = None,
+                       extras: bool = False, stats: bool = False) -> List[Tuple]:
+    if raw_mode:
+        return [prepare_raw(raw, with_messages, branches, stages, extras, stats) for raw in batch]
+    if stages is None:
+        return [prepare_conversation(decode_object(raw), with_messages, branches, None, extras, stats)
+                for raw in batch]
+    records = []
+    for raw in batch:
+        t0 = time.perf_counter()
+        conv = decode_object(raw)
+        _add_stage(stages, "decode", time.perf_counter() - t0)
+        records.append(prepare_conversation(conv, with_messages, branches, stages, extras, stats))
+    return records
+
+def _prepare_raw_batch_profiled(batch: List[bytes], with_messages: bool, raw_mode: bool,
+                                branches: bool = False, extras: bool = False,
+                                stats: bool = False) -> Tuple[List[Tuple], Dict[str, float]]:
+    """_prepare_raw_batch() in a worker process; returns the stage timings along."""
+    stages: Dict[str, float] = {}
+    return _prepare_raw_batch(batch, with_messages, raw_mode, branches, stages, extras, stats), stages
+
+def _add_stage(stages: Dict[str, float], name: str, seconds: float) -> None:
+    stages[name] = stages.get(name, 0.0) + seconds
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes (None where unknown, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (peak RSS where the current
+    value is not available; None if neither is)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+class Telemetry:
+    """--progress / --profile-out: stage timings, throughput and ETA.
+
+    Stages: scan (finding object boundaries), decode (json.loads), summarize,
+    messages (text extraction), serialize (encoding; gives the part size),
+    csv (index/messages/columnar rows), write (part files). With --workers
+    decode..serialize are summed over all worker processes. When neither
+    option is given no Telemetry object exists and the hot path only pays a
+    few `is None` checks per conversation.
+    """
+
+    STAGES = ("scan", "decode", "summarize", "messages", "serialize", "csv", "write")
+
+    def __init__(self, path: str, progress: bool = False, interval: float = 0.5, stream=None):
+        self.path = path
+        self.total = _input_size(path)
+        self.progress = progress
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.stages: Dict[str, float] = dict.fromkeys(self.STAGES, 0.0)
+        self.conversations = 0
+        self.offset = 0
+        self.peak_rss = 0
+        self.start = self._last = time.perf_counter()
+
+    def scan(self, raws: Iterable[Tuple[int, bytes]]) -> Iterator[bytes]:
+        """Pass raw objects through, timing the scanner and tracking the input offset."""
+        it = iter(raws)
+        clock = time.perf_counter
+        while True:
+            t0 = clock()
+            item = next(it, None)
+            self.stages["scan"] += clock() - t0
+            if item is None:
+                return
+            self.offset = item[0] + len(item[1])
+            yield item[1]
+
+    def merge(self, stages: Dict[str, float]) -> None:
+        for name, seconds in stages.items():
+            _add_stage(self.stages, name, seconds)
+
+    def tick(self) -> None:
+        self.conversations += 1
+        if self.progress:
+            now = time.perf_counter()
+            if now - self._last >= self.interval:
+                self._last = now
+                self.stream.write("\r" + self.status_line(now))
+                self.stream.flush()
+
+    def status_line(self, now: Optional[float] = None) -> str:
+        elapsed = max((now or time.perf_counter()) - self.start, 1e-9)
+        rss = current_rss()
+        if rss:
+            self.peak_rss = max(self.peak_rss, rss)
+        mb = self.offset / 1024 / 1024
+        line = f"{mb:,.0f} MB"
+        if self.total:
+            line += f" / {self.total / 1024 / 1024:,.0f} MB ({100 * self.offset / self.total:5.1f} %)"
+        line += f" · {mb / elapsed:,.1f} MB/s · {self.conversations / elapsed:,.0f} Unterh./s"
+        if rss:
+            line += f" · RSS {rss / 1024 / 1024:,.0f} MB"
+        if self.total and self.offset:
+            remaining = elapsed * (self.total - self.offset) / self.offset
+            line += f" · noch {int(remaining // 60)}:{int(remaining % 60):02d} min"
+        return line + "   "
+
+    def finish(self) -> Dict[str, Any]:
+        """End the progress line and return the stats dict for --profile-out."""
+        elapsed = time.perf_counter() - self.start
+        if self.progress:
+            self.stream.write("\r" + self.status_line() + "\n")
+            self.stream.flush()
+        self.peak_rss = max(self.peak_rss, current_rss() or 0, peak_rss() or 0)
+        return {
+            "input": self.path,
+            "input_bytes": self.total if self.total is not None else self.offset,
+            "bytes_scanned": self.offset,
+            "conversations": self.conversations,
+            "elapsed_s": round(elapsed, 4),
+            "bytes_per_s": round(self.offset / elapsed, 1) if elapsed else None,
+            "conversations_per_s": round(self.conversations / elapsed, 1) if elapsed else None,
+            "peak_rss_bytes": self.peak_rss or None,
+            "stages_s": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+        }
+
+def _input_size(path: str) -> Optional[int]:
+    """Size of a regular, uncompressed input file (None for stdin/pipes/compressed)."""
+    if path == "-" or not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        if _detect_compression(f.read(8)):
+            return None
+    return os.path.getsize(path)
+
+# Raw bytes handed to a worker per task; small enough to keep the pool busy,
+# large enough to amortize pickling overhead.
+PARALLEL_BATCH_BYTES = 4 * 1024 * 1024
+
+class _BackgroundIterator:
+    """Runs an iterator in a background thread (--pipeline).
+
+    Items are handed over through a queue bounded by the sum of
+    sizeof(item); the producer blocks while the queue holds max_bytes or
+    more (a single larger item is still let through). An exception in the
+    producer is re-raised in the consumer after the items before it.
+    """
+
+    def __init__(self, iterable: Iterable, max_bytes: int, sizeof, name: str):
+        self._iterable = iterable
+        self._max_bytes = max(1, max_bytes)
+        self._sizeof = sizeof
+        self._items: collections.deque = collections.deque()
+        self._used = 0
+        self._done = False
+        self._cancelled = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        cond = self._cond
+        try:
+            for item in self._iterable:
+                size = self._sizeof(item)
+                with cond:
+                    while self._used and self._used + size > self._max_bytes and not self._cancelled:
+                        cond.wait()
+                    if self._cancelled:
+                        return
+                    self._items.append((item, size))
+                    self._used += size
+                    cond.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with cond:
+                self._done = True
+                cond.notify_all()
+
+    def __iter__(self):
+        cond = self._cond
+        try:
+            while True:
+                with cond:
+                    while not self._items and not self._done:
+                        cond.wait()
+                    if not self._items:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    item, size = self._items.popleft()
+                    self._used -= size
+                    cond.notify_all()
+                yield item
+        finally:
+            with cond:
+                self._cancelled = True
+                cond.notify_all()
+            self._thread.join()
+
+def _record_size(record: Tuple) -> int:
+    messages, stats_rows = record[5], record[7]
+    return (len(record[6]) + (sum(len(m[2]) for m in messages) if messages else 0)
+            + (64 * len(stats_rows) if stats_rows else 0) + 200)
+
+# Default for --pipeline-buffer: bytes queued between reader, parser and writer.
+PIPELINE_BUFFER = 64 * 1024 * 1024
+
+class MemoryPlan(NamedTuple):
+    chunk_size: int      # read chunk (the decompression queue holds a few more)
+    batch_bytes: int     # raw bytes per worker task
+    pipeline_bytes: int  # --pipeline hand-over queues
+
+MIN_MEMORY_BUDGET = 4 * 1024 * 1024
+
+def plan_memory(budget: int, workers: int = 1, pipeline: bool = False) -> MemoryPlan:
+    """Split --memory-budget across the buffers of one run.
+
+    Part files are streamed, so what remains are the read buffers (a chunk
+    plus up to 4 queued decompressed chunks: 1/4 of the budget), the worker
+    tasks in flight (2 batches per worker, each held as raw bytes, pickled
+    copy and result: the rest) and, with --pipeline, the hand-over queues
+    (1/4). A single conversation larger than the budget is still processed
+    as a whole.
+    """
+    def clamp(value, lo, hi):
+        return max(lo, min(hi, value))
+
+    chunk_size = clamp(budget // 4 // 6, 64 * 1024, CHUNK_SIZE)
+    worker_share = budget // 2 if pipeline else budget * 3 // 4
+    batch_bytes = clamp(worker_share // (2 * 3 * max(workers, 1)), 64 * 1024, PARALLEL_BATCH_BYTES)
+    return MemoryPlan(chunk_size, batch_bytes, budget // 4 if pipeline else 0)
+
+def iter_prepared_raw(raws: Iterable[bytes], with_messages: bool, workers: int = 1,
+                      raw_mode: bool = False, branches: bool = False,
+                      telemetry: Optional[Telemetry] = None, extras: bool = False,
+                      batch_bytes: int = 0, stats: bool = False) -> Iterator[Tuple]:
+    """Yield prepare_conversation() (or prepare_raw()) records for raw objects in order.
+
+    With workers > 1 decoding, summarizing and serializing run in a process
+    pool. At most 2 batches per worker (of batch_bytes, default
+    PARALLEL_BATCH_BYTES) are in flight, results are collected strictly in
+    submission order.
+    """
+    stages = telemetry.stages if telemetry is not None else None
+    if workers <= 1:
+        for raw in raws:
+            yield from _prepare_raw_batch([raw], with_messages, raw_mode, branches, stages, extras, stats)
+        return
+
+    limit = batch_bytes or PARALLEL_BATCH_BYTES
+
+    def batches():
+        batch, size = [], 0
+        for raw in raws:
+            batch.append(raw)
+            size += len(raw)
+            if size >= limit:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    def results(future):
+        if telemetry is None:
+            return future.result()
+        records, worker_stages = future.result()
+        telemetry.merge(worker_stages)
+        return records
+
+    if telemetry is None:
+        task = functools.partial(_prepare_raw_batch, extras=extras, stats=stats)
+    else:
+        task = functools.partial(_prepare_raw_batch_profiled, extras=extras, stats=stats)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        for batch in batches():
+            pending.append(pool.submit(task, batch, with_messages, raw_mode, branches))
+            if len(pending) >= 2 * workers:
+                yield from results(pending.popleft())
+        while pending:
+            yield from results(pending.popleft())
+
+def iter_prepared(path: str, with_messages: bool, workers: int = 1, use_mmap: bool = False,
+                  raw_mode: bool = False, branches: bool = False,
+                  telemetry: Optional[Telemetry] = None, extras: bool = False,
+                  pipeline_bytes: int = 0, memory: Optional[MemoryPlan] = None,
+                  start: int = 0, offsets: Optional[collections.deque] = None,
+                  stats: bool = False) -> Iterator[Tuple]:
+    """Yield prepare_conversation() records for the export at path in input order.
+
+    With workers > 1 this process only scans object spans (see
+    iter_prepared_raw). raw_mode uses prepare_raw() instead.
+    pipeline_bytes > 0 (--pipeline) runs reading/scanning and parsing in two
+    background threads, each handing over at most half of that many bytes,
+    so the caller's writes overlap with both. memory (--memory-budget)
+    sizes read chunks and worker batches. start skips the input up to that
+    offset; offsets receives the input offset of every record, in order.
+    stats adds the message_stats() rows to every record.
+    """
+    chunk_size = memory.chunk_size if memory else CHUNK_SIZE
+    batch_bytes = memory.batch_bytes if memory else 0
+    if workers <= 1 and not raw_mode and not (pipeline_bytes or telemetry):
+        for conv in iter_top_level_objects(path, chunk_size, use_mmap, start, offsets):
+            yield prepare_conversation(conv, with_messages, branches, None, extras, stats)
+        return
+
+    spans = iter_raw_objects(path, chunk_size, use_mmap, start)
+    if offsets is not None:
+        spans = _track_offsets(spans, offsets)
+    if telemetry is not None:
+        raws: Iterable = telemetry.scan(spans)
+    else:
+        raws = (raw for _, raw in spans)
+    if pipeline_bytes:
+        raws = _BackgroundIterator(raws, pipeline_bytes // 2, len, "read")
+        records = iter_prepared_raw(raws, with_messages, workers, raw_mode, branches, telemetry, extras, batch_bytes,
+                                    stats)
+        yield from _BackgroundIterator(records, pipeline_bytes // 2, _record_size, "parse")
+        return
+    yield from iter_prepared_raw(raws, with_messages, workers, raw_mode, branches, telemetry, extras, batch_bytes,
+                                 stats)
+
+def _track_offsets(spans: Iterable[Tuple[int, bytes]], offsets: collections.deque) -> Iterator[Tuple[int, bytes]]:
+    for span in spans:
+        offsets.append(span[0])
+        yield span
+
+INDEX_HEADER = ["conversation_id","title","messages","first_time","last_time","part_file"]
+MESSAGES_HEADER = ["conversation_id","title","time","role","text"]
+FINGERPRINTS_HEADER = ["conversation_id","fingerprint","part_file"]
+# offsets.csv: position of each conversation in its part (uncompressed bytes);
+# "part" is the part number, so the table is the same with --compress
+OFFSETS_HEADER = ["conversation_id","part","offset","length"]
+
+def conversation_fingerprint(raw: bytes) -> str:
+    """Content hash of a conversation's input bytes (used by --incremental)."""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def _read_csv_rows(path: str) -> List[list]:
+    """All rows of a CSV written by this script, without header ([] if missing)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        r = csv.reader(f)
+        next(r, None)
+        return list(r)
+
+def _write_csv_rows(path: str, header: list, rows) -> None:
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+
+def _iter_csv_records(f) -> Iterator[bytes]:
+    """Raw records of a binary CSV file; a record ends at a newline once its
+    quote count is even (newlines inside texts are always quoted)."""
+    pending, quotes = [], 0
+    for line in f:
+        pending.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2:
+            continue
+        yield b"".join(pending) if len(pending) > 1 else line
+        pending, quotes = [], 0
+
+def _record_conversation_id(record: bytes) -> str:
+    if record[:1] != b'"':
+        return record[:record.find(b",")].decode("utf-8")
+    return next(csv.reader([record.decode("utf-8")]))[0]
+
+def _merge_messages_csv(path: str, drop_ids: set, new_rows_path: str) -> None:
+    """Remove the rows of drop_ids from messages.csv and append new_rows_path.
+
+    Without rows to drop this is a plain append; otherwise the file is
+    copied record by record (raw bytes, no CSV re-encoding).
+    """
+    if not os.path.exists(path):
+        _write_csv_rows(path, MESSAGES_HEADER, [])
+    if drop_ids:
+        tmp_path = path + ".tmp"
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            records = _iter_csv_records(src)
+            dst.write(next(records, b""))  # header
+            for record in records:
+                if _record_conversation_id(record) not in drop_ids:
+                    dst.write(record)
+            with open(new_rows_path, "rb") as new:
+                shutil.copyfileobj(new, dst)
+        os.replace(tmp_path, path)
+    else:
+        with open(path, "ab") as dst, open(new_rows_path, "rb") as new:
+            shutil.copyfileobj(new, dst)
+    os.remove(new_rows_path)
+
+def _compact_part(out_dir: str, part_file: str, keep: List[bool]) -> bool:
+    """Rewrite a part with only the objects flagged in keep (by position).
+
+    Returns False (and removes the file) if nothing is left.
+    """
+    path = os.path.join(out_dir, part_file)
+    if not any(keep):
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as w:
+        w.write(b"[")
+        first = True
+        for (_, raw), k in zip(iter_raw_objects(path), keep):
+            if not k:
+                continue
+            if not first:
+                w.write(b", ")
+            w.write(raw)
+            first = False
+        w.write(b"]")
+    os.replace(tmp_path, path)
+    return True
+
+def part_number(part_file: str) -> Optional[int]:
+    m = re.search(r"_(\d+)\.jsonl?(?:\.\w+)?$", part_file)
+    return int(m.group(1)) if m else None
+
+def part_offsets(path: str) -> List[Tuple[int, int]]:
+    """(offset, length) of every object in an uncompressed part file."""
+    return [(offset, len(raw)) for offset, raw in iter_raw_objects(path)]
+
+def _open_text_input(path: str):
+    """Text stream of a CSV written by this script, compressed or not."""
+    f = open(path, "rb")
+    kind = _detect_compression(f.peek(6)[:6])
+    stream = f if kind is None else _decompressing_stream(f, kind)
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+def _find_output(out_dir: str, name: str) -> Optional[str]:
+    """Path of name in out_dir, also with one of the --compress extensions."""
+    for ext in ("",) + tuple(COMPRESSION_EXT.values()):
+        path = os.path.join(out_dir, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+def _read_span(path: str, offset: int, length: int) -> bytes:
+    """length bytes at offset of a part; compressed parts are decompressed up
+    to offset (sequential, no random access in the compressed stream)."""
+    with open(path, "rb") as f:
+        kind = _detect_compression(f.peek(6)[:6])
+        if kind is None:
+            f.seek(offset)
+            return f.read(length)
+        stream = _decompressing_stream(f, kind)
+        while offset:
+            skipped = len(stream.read(min(offset, CHUNK_SIZE)))
+            if not skipped:
+                return b""
+            offset -= skipped
+        return stream.read(length)
+
+def _csv_stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def build_offsets_index(offsets_path: str) -> str:
+    """offsets.csv as an SQLite table keyed by conversation id
+    (<offsets.csv>.idx.sqlite), stamped with the CSV's size and mtime."""
+    index_path = offsets_path + ".idx.sqlite"
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    size, mtime_ns = _csv_stamp(offsets_path)
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.executescript("""
+            CREATE TABLE meta(key TEXT PRIMARY KEY, value);
+            CREATE TABLE offsets(conversation_id TEXT PRIMARY KEY, part INTEGER, offset INTEGER, length INTEGER)
+                WITHOUT ROWID;
+        """)
+        with _open_text_input(offsets_path) as f:
+            r = csv.reader(f)
+            next(r, None)
+            # First row wins, as in a scan of the CSV
+            con.executemany("INSERT OR IGNORE INTO offsets VALUES (?, ?, ?, ?)",
+                            ((row[0], int(row[1]), int(row[2]), int(row[3])) for row in r))
+        con.executemany("INSERT INTO meta VALUES (?, ?)", [("csv_size", size), ("csv_mtime_ns", mtime_ns)])
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp_path, index_path)
+    return index_path
+
+def lookup_offsets(offsets_path: str, conv_id: str) -> Optional[Tuple[int, int, int]]:
+    """(part, offset, length) of conv_id from offsets.csv (None if unknown).
+
+    Uses the SQLite sidecar of build_offsets_index(), rebuilt when the CSV's
+    size or mtime changed (--incremental, --resume). Where it cannot be
+    written (read-only folder) the CSV is scanned.
+    """
+    index_path = offsets_path + ".idx.sqlite"
+    for attempt in range(2):
+        if os.path.exists(index_path):
+            try:
+                con = sqlite3.connect(index_path)
+                try:
+                    meta = dict(con.execute("SELECT key, value FROM meta"))
+                    if (meta.get("csv_size"), meta.get("csv_mtime_ns")) == _csv_stamp(offsets_path):
+                        row = con.execute("SELECT part, offset, length FROM offsets WHERE conversation_id = ?",
+                                          (conv_id,)).fetchone()
+                        return tuple(row) if row else None
+                finally:
+                    con.close()
+            except sqlite3.Error:
+                pass
+        if attempt == 0:
+            try:
+                build_offsets_index(offsets_path)
+            except (OSError, sqlite3.Error):
+                break
+    with _open_text_input(offsets_path) as f:
+        r = csv.reader(f)
+        next(r, None)
+        for row in r:
+            if row[0] == conv_id:
+                return int(row[1]), int(row[2]), int(row[3])
+    return None
+
+def get_conversation_raw(out_dir: str, conv_id: str) -> Optional[bytes]:
+    """Raw JSON bytes of one conversation of a finished split (None if unknown).
+
+    Looks up part and byte range via offsets.csv (lookup_offsets) and reads
+    just that span, so the cost depends neither on the part size nor on the
+    number of conversations. Splits without offsets.csv (older versions)
+    fall back to scanning the part named in index.csv; --partition-by
+    splits are searched partition by partition.
+    """
+    partitions = read_partitions(out_dir)
+    if partitions is not None:
+        for partition in partitions:
+            raw = get_conversation_raw(os.path.join(out_dir, partition["path"]), conv_id)
+            if raw is not None:
+                return raw
+        return None
+    offsets_path = _find_output(out_dir, "offsets.csv")
+    if offsets_path is not None:
+        found = lookup_offsets(offsets_path, conv_id)
+        if found is None:
+            return None
+        part, offset, length = found
+        name = f"conversations_part_{part:03d}"
+        part_path = _find_output(out_dir, name + ".json") or _find_output(out_dir, name + ".jsonl")
+        return _read_span(part_path, offset, length) if part_path else None
+    index_path = _find_output(out_dir, "index.csv")
+    if index_path is None:
+        return None
+    with _open_text_input(index_path) as f:
+        part_file = next((row[5] for row in csv.reader(f) if row[0] == conv_id), None)
+    if part_file is None:
+        return None
+    for _, raw in iter_raw_objects(os.path.join(out_dir, part_file)):
+        if decode_object(raw).get("id") == conv_id:
+            return bytes(raw)
+    return None
+
+def get_conversation(out_dir: str, conv_id: str) -> Optional[Dict[str, Any]]:
+    """Decoded conversation conv_id of a finished split (None if unknown)."""
+    raw = get_conversation_raw(out_dir, conv_id)
+    return None if raw is None else decode_object(raw)
+
+def _split_outputs() -> Tuple[set, set, re.Pattern]:
+    """Exact file names, folder names and the part name pattern this script
+    writes into an output folder (see _clear_split)."""
+    exts = ("",) + tuple(COMPRESSION_EXT.values())
+    files = {csv_name + ext for csv_name in ("index.csv", "messages.csv", "offsets.csv", "fingerprints.csv")
+             for ext in exts}
+    files |= {csv_name + ext + sidecar for csv_name in ("messages.csv", "offsets.csv") for ext in exts
+              for sidecar in (".idx.sqlite", ".fts.sqlite")}
+    files |= {"index.parquet", "messages.parquet", STATS_FILE, PARTITIONS_FILE, CHECKPOINT_FILE, "manifest.json",
+              "stats_months.csv", "stats_models.csv", "stats_lengths.csv", "stats_longest.csv"}
+    parts = re.compile(r"conversations_part_\d+\.jsonl?(?:%s)?" % "|".join(re.escape(e) for e in exts[1:]))
+    return files, {"index.columnar", "messages.columnar"}, parts
+
+def _has_split(out_dir: str) -> bool:
+    """Whether out_dir holds the index of an earlier split (or its partitions)."""
+    return (_find_output(out_dir, "index.csv") is not None or _find_output(out_dir, "offsets.csv") is not None
+            or read_partitions(out_dir) is not None)
+
+def _clear_split(out_dir: str, keep: Optional[str] = None) -> None:
+    """Remove the outputs of an earlier split in out_dir before a full
+    rebuild: only the names this script writes (CSVs and their sidecars,
+    parts, columnar tables, stats, checkpoint) and the partition folders
+    listed in partitions.json. Other files stay; keep (the input, which may
+    live there) is spared."""
+    for partition in read_partitions(out_dir) or ():
+        path = os.path.join(out_dir, partition["path"])
+        if os.path.isdir(path) and os.path.abspath(keep or "").startswith(os.path.abspath(path) + os.sep):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+    files, dirs, parts = _split_outputs()
+    keep = os.path.abspath(keep) if keep and keep != "-" else None
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if os.path.abspath(path) == keep:
+            continue
+        if os.path.isdir(path):
+            if name in dirs:
+                shutil.rmtree(path)
+        elif name in files or parts.fullmatch(name):
+            os.remove(path)
+
+def split_incremental(args) -> Dict[str, Any]:
+    """--incremental: update a previous split in args.out_dir in place.
+
+    Conversations whose input bytes are unchanged (fingerprints.csv) are
+    neither decoded nor written again. New and changed conversations are
+    appended as new parts; parts holding outdated or deleted conversations
+    are compacted, all other part files stay untouched. manifest.json
+    records what moved.
+    """
+    out_dir = args.out_dir
+    index_path = os.path.join(out_dir, "index.csv")
+    fp_path = os.path.join(out_dir, "fingerprints.csv")
+    offsets_path = os.path.join(out_dir, "offsets.csv")
+    msgs_path = os.path.join(out_dir, "messages.csv")
+
+    old_fps = _read_csv_rows(fp_path)
+    if not old_fps:
+        # No fingerprints (first run, or a split made without --incremental):
+        # rebuild from scratch instead of mixing with the old parts and CSVs
+        if _has_split(out_dir):
+            print("Hinweis: keine fingerprints.csv im Zielordner – vollständiger Neuaufbau "
+                  "(bisherige Teile und CSVs werden ersetzt).", file=sys.stderr)
+            _clear_split(out_dir, keep=args.input)
+    old_index = {row[0]: row for row in _read_csv_rows(index_path)} if old_fps else {}
+    old_offsets = {row[0]: row for row in _read_csv_rows(offsets_path)} if old_fps else {}
+    by_fp = {fp: cid for cid, fp, _ in old_fps}
+
+    with_messages = args.csv or bool(old_fps and os.path.exists(msgs_path))
+    if with_messages and old_fps and not os.path.exists(msgs_path):
+        raise SystemExit("--incremental --csv: der vorherige Lauf hat keine messages.csv erzeugt. "
+                         "Bitte einmal vollständig ohne --incremental aufteilen.")
+
+    part_numbers = [n for n in (part_number(pf) for _, _, pf in old_fps) if n is not None]
+    parts = PartWriter(out_dir, args.max_convs, args.max_bytes, part_idx=max(part_numbers, default=0) + 1)
+
+    seen, pending_fps = set(), collections.deque()
+    memory = plan_memory(args.memory_budget, args.workers) if args.memory_budget else None
+
+    def changed_raws():
+        for _, raw in iter_raw_objects(args.input, memory.chunk_size if memory else CHUNK_SIZE,
+                                       args.mmap and memory is None):
+            fp = conversation_fingerprint(raw)
+            cid = by_fp.get(fp)
+            if cid is not None:
+                seen.add(cid)
+                continue
+            pending_fps.append(fp)
+            yield raw
+
+    new_index, new_fps, new_offsets, parts_written = [], [], [], []
+    new_rows_path = msgs_path + ".new"
+    msg_f = open(new_rows_path, "w", newline="", encoding="utf-8") if with_messages else None
+    msg_writer = csv.writer(msg_f) if msg_f else None
+    for conv_id, title, msgs, first_ts, last_ts, messages, data, _ in iter_prepared_raw(
+            changed_raws(), with_messages, args.workers, args.raw, batch_bytes=memory.batch_bytes if memory else 0):
+        if messages:
+            msg_writer.writerows(csv_rows(conv_id, title, messages))
+        part_name = parts.add(data)
+        if not parts_written or parts_written[-1] != part_name:
+            parts_written.append(part_name)
+        if len(data) > args.max_bytes:
+            print(f"⚠️  Warning: Conversation {conv_id[:8] if conv_id else 'unknown'} "
+                  f"({len(data)/1024/1024:.1f}MB) exceeds max_bytes limit", file=sys.stderr)
+        new_index.append([conv_id, title, msgs, iso_from_ts(first_ts), iso_from_ts(last_ts), part_name])
+        new_fps.append([conv_id, pending_fps.popleft(), part_name])
+        new_offsets.append([conv_id, parts.part_idx, parts.last_offset, parts.last_length])
+    parts.close()
+    if msg_f is not None:
+        msg_f.close()
+
+    # Conversations of the previous run that did not show up unchanged
+    stale = {cid for cid, _, _ in old_fps if cid not in seen}
+    parts_rewritten, parts_removed = [], []
+    by_part: Dict[str, List[str]] = {}
+    for cid, _, part_file in old_fps:
+        by_part.setdefault(part_file, []).append(cid)
+    for part_file, cids in by_part.items():
+        keep = [cid not in stale for cid in cids]
+        if all(keep):
+            continue
+        if _compact_part(out_dir, part_file, keep):
+            parts_rewritten.append(part_file)
+        else:
+            parts_removed.append(part_file)
+
+    # Offsets of untouched parts carry over; rewritten parts (and splits from
+    # before offsets.csv existed) are rescanned
+    kept_offsets = []
+    for part_file, cids in by_part.items():
+        cids = [cid for cid in cids if cid not in stale]
+        if not cids:
+            continue
+        if part_file in parts_rewritten or any(cid not in old_offsets for cid in cids):
+            spans = part_offsets(os.path.join(out_dir, part_file))
+            kept_offsets += [[cid, part_number(part_file), offset, length] for cid, (offset, length) in zip(cids, spans)]
+        else:
+            kept_offsets += [old_offsets[cid] for cid in cids]
+
+    if with_messages:
+        _merge_messages_csv(msgs_path, stale, new_rows_path)
+
+    kept = [row for row in old_fps if row[0] not in stale]
+    _write_csv_rows(index_path, INDEX_HEADER, [old_index[cid] for cid, _, _ in kept if cid in old_index] + new_index)
+    _write_csv_rows(fp_path, FINGERPRINTS_HEADER, kept + new_fps)
+    _write_csv_rows(offsets_path, OFFSETS_HEADER, kept_offsets + new_offsets)
+
+    new_ids = [row[0] for row in new_index]
+    manifest = {
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        "input": os.path.abspath(args.input) if args.input != "-" else "-",
+        "unchanged": len(kept),
+        "added": [cid for cid in new_ids if cid not in stale],
+        "changed": [cid for cid in new_ids if cid in stale],
+        "removed": sorted(stale.difference(new_ids)),
+        "parts_written": parts_written,
+        "parts_rewritten": parts_rewritten,
+        "parts_removed": parts_removed,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as w:
+        json.dump(manifest, w, ensure_ascii=False, indent=2)
+    return manifest
+
+class SplitOutput:
+    """Part files, index.csv, offsets.csv and the optional messages.csv and
+    columnar tables of one output directory (the split, or one partition).
+
+    With a --resume checkpoint the CSVs are appended to (the caller has
+    truncated them) and part numbering continues at its part_idx.
+    """
+
+    def __init__(self, out_dir: str, args, state: Optional[Dict[str, Any]] = None):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self._args = args
+        self._state = state
+        self._ext = COMPRESSION_EXT.get(args.compress, "")
+        self.files: Dict[str, Any] = {}
+        self.idx_writer = self._open_csv("index.csv", INDEX_HEADER)
+        self.msg_writer = None
+        if args.csv:
+            self.msg_writer = self._open_csv("messages.csv", MESSAGES_HEADER + (["branch"] if args.branches else []))
+        self.off_writer = self._open_csv("offsets.csv", OFFSETS_HEADER)
+        self.columnar = ColumnarWriter(out_dir, args.columnar_format) if args.columnar else None
+        self.parts = PartWriter(out_dir, args.max_convs, args.max_bytes, part_idx=state["part_idx"] if state else 1,
+                                compression=args.compress, level=args.compress_level,
+                                compressed_limit=args.max_bytes_compressed, fmt=args.format)
+        self.conversations = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+
+    def _open_csv(self, name: str, header: list):
+        # UTF-8 mit BOM (utf-8-sig), damit Excel unter Windows Umlaute sicher korrekt erkennt;
+        # beim Fortsetzen wird angehängt (ohne zweites BOM/Kopfzeile)
+        path = os.path.join(self.out_dir, name + self._ext)
+        if self._state is not None:
+            f = open(path, "a", newline="", encoding="utf-8-sig")
+        else:
+            f = open_text_output(path, self._args.compress, self._args.compress_level)
+        self.files[name] = f
+        w = csv.writer(f)
+        if self._state is None:
+            w.writerow(header)
+        return w
+
+    def add_index(self, conv_id, title, msgs, first_ts, last_ts, part_name: str, messages) -> None:
+        """index.csv/offsets.csv rows (and columnar rows) of the conversation just added to parts."""
+        self.idx_writer.writerow([conv_id, title, msgs, iso_from_ts(first_ts), iso_from_ts(last_ts), part_name])
+        self.off_writer.writerow([conv_id, self.parts.part_idx, self.parts.last_offset, self.parts.last_length])
+        if self.columnar is not None:
+            self.columnar.add_conversation(conv_id, title, msgs, first_ts, last_ts, part_name, messages)
+        self.conversations += 1
+        if first_ts is not None and (self.first_ts is None or first_ts < self.first_ts):
+            self.first_ts = first_ts
+        if last_ts is not None and (self.last_ts is None or last_ts > self.last_ts):
+            self.last_ts = last_ts
+
+    def positions(self) -> Dict[str, int]:
+        """Current byte size of every CSV (for checkpoints)."""
+        return {name: f.tell() for name, f in self.files.items()}
+
+    def close(self) -> None:
+        self.parts.close()
+        if self.columnar is not None:
+            self.columnar.close()
+        for f in self.files.values():
+            f.close()
+
+# --partition-by: one subdirectory per period of a conversation's first
+# message (local time, like the times in index.csv); partitions.json lists
+# them with their time range so readers can skip the others.
+PARTITION_FORMATS = {"month": "%Y-%m", "year": "%Y"}
+UNDATED_PARTITION = "undatiert"
+PARTITIONS_FILE = "partitions.json"
+
+def partition_of(ts: Optional[float], partition_by: str) -> str:
+    if ts is None:
+        return UNDATED_PARTITION
+    try:
+        return dt.datetime.fromtimestamp(ts).strftime(PARTITION_FORMATS[partition_by])
+    except (OverflowError, OSError, ValueError):
+        return UNDATED_PARTITION
+
+def write_partitions(out_dir: str, partition_by: str, outputs: Dict[str, SplitOutput]) -> None:
+    partitions = [{"name": name, "path": name, "conversations": out.conversations,
+                   "first_time": iso_from_ts(out.first_ts), "last_time": iso_from_ts(out.last_ts)}
+                  for name, out in sorted(outputs.items())]
+    with open(os.path.join(out_dir, PARTITIONS_FILE), "w", encoding="utf-8") as w:
+        json.dump({"partition_by": partition_by, "partitions": partitions}, w, ensure_ascii=False, indent=2)
+
+def read_partitions(out_dir: str) -> Optional[List[Dict[str, Any]]]:
+    """Partitions of a --partition-by split (None for a plain split)."""
+    path = os.path.join(out_dir, PARTITIONS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["partitions"]
+
+# --stats: the message columns (time, role, characters, model, conversation)
+# are gathered in typed arrays of STATS_BLOCK messages and reduced block by
+# block, with NumPy group-bys if it is installed and plain loops over the
+# arrays otherwise. Memory is one block plus the group totals and id, title
+# and two counters per conversation. Months are UTC so both backends agree.
+STATS_BLOCK = 1 << 18
+STATS_FILE = "stats.json"
+STATS_LENGTH_EDGES = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+STATS_LONGEST = 20
+STATS_TIME_RANGE = (0.0, 253402300800.0)  # 1970 … 9999-12-31 UTC
+_EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def _month_label(month: int) -> str:
+    """"YYYY-MM" of a month number (months since 1970-01); -1 is undated."""
+    if month < 0:
+        return UNDATED_PARTITION
+    return f"{1970 + month // 12:04d}-{month % 12 + 1:02d}"
+
+def _length_bucket(i: int) -> str:
+    edges = STATS_LENGTH_EDGES
+    if i == 0:
+        return f"0-{edges[0] - 1}" if edges[0] > 1 else "0"
+    if i == len(edges):
+        return f"{edges[-1]}+"
+    lo, hi = edges[i - 1], edges[i] - 1
+    return str(lo) if lo == hi else f"{lo}-{hi}"
+
+class StatsCollector:
+    """--stats: usage statistics over the message columns of a split.
+
+    add() appends one conversation's message_stats() rows; result() returns
+    messages/characters per month and role, characters per model, the
+    distribution of conversation lengths and the longest conversations.
+    backend "auto" uses NumPy if available ("numpy" requires it, "array"
+    never uses it); both give the same result.
+    """
+
+    def __init__(self, backend: str = "auto", block: int = STATS_BLOCK):
+        np = _numpy() if backend in ("auto", "numpy") else None
+        if backend == "numpy" and np is None:
+            raise RuntimeError("Für das Backend 'numpy' wird das Paket 'numpy' benötigt: pip install numpy")
+        self.np = np
+        self.backend = "numpy" if np is not None else "array"
+        self.block = block
+        self.roles: List[str] = []
+        self.models: List[str] = []
+        self._codes: Tuple[Dict[str, int], Dict[str, int]] = ({}, {})
+        self.ids: List[Any] = []
+        self.titles: List[Any] = []
+        self.conv_messages = array.array("I")
+        self.conv_chars = array.array("Q")
+        self.by_month: Dict[Tuple[int, str], List[int]] = {}  # (month, role) -> [messages, characters]
+        self.by_model: Dict[str, List[int]] = {}  # model -> [messages, characters, conversations]
+        self.first_ts: Optional[float] = None
+        self.last_ts: Optional[float] = None
+        self._new_block()
+
+    def _new_block(self) -> None:
+        self._ts = array.array("d")
+        self._role = array.array("B")
+        self._chars = array.array("I")
+        self._model = array.array("H")
+        self._conv = array.array("I")
+
+    def _code(self, kind: int, value: str) -> int:
+        codes = self._codes[kind]
+        code = codes.get(value)
+        if code is None:
+            names = self.roles if kind == 0 else self.models
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def _encode(self, kind: int, values: Tuple[str, ...]) -> List[int]:
+        try:
+            return list(map(self._codes[kind].__getitem__, values))
+        except KeyError:
+            return [self._code(kind, v) for v in values]
+
+    def add(self, conv_id, title, rows: List[Tuple[Optional[float], str, int, str]]) -> None:
+        conv = len(self.ids)
+        self.ids.append(conv_id)
+        self.titles.append(title)
+        self.conv_messages.append(len(rows))
+        if not rows:
+            self.conv_chars.append(0)
+            return
+        times, roles, chars, models = zip(*rows)
+        self._ts.extend([math.nan if ts is None else ts for ts in times] if None in times else times)
+        self._role.extend(self._encode(0, roles))
+        self._chars.extend(chars)
+        self._model.extend(self._encode(1, models))
+        self._conv.extend(array.array("I", [conv]) * len(rows))
+        self.conv_chars.append(sum(chars))
+        # Blocks end between conversations, so per-conversation counts
+        # (conversations per model) never straddle two blocks
+        if len(self._ts) >= self.block:
+            self._reduce()
+
+    def _add_totals(self, months, month_roles, month_counts, month_chars, model_counts, model_chars,
+                    model_convs, first, last) -> None:
+        for month, role, count, chars in zip(months, month_roles, month_counts, month_chars):
+            totals = self.by_month.setdefault((int(month), self.roles[int(role)]), [0, 0])
+            totals[0] += int(count)
+            totals[1] += int(chars)
+        for model, count in enumerate(model_counts):
+            if count:
+                totals = self.by_model.setdefault(self.models[model], [0, 0, 0])
+                totals[0] += int(count)
+                totals[1] += int(model_chars[model])
+                totals[2] += int(model_convs[model])
+        if first is not None:
+            self.first_ts = first if self.first_ts is None else min(self.first_ts, first)
+            self.last_ts = last if self.last_ts is None else max(self.last_ts, last)
+
+    def _reduce(self) -> None:
+        if len(self._ts):
+            (self._reduce_numpy if self.np is not None else self._reduce_array)()
+        self._new_block()
+
+    def _reduce_numpy(self) -> None:
+        np = self.np
+        ts = np.frombuffer(self._ts, dtype=self._ts.typecode)
+        role = np.frombuffer(self._role, dtype=self._role.typecode).astype(np.int64)
+        chars = np.frombuffer(self._chars, dtype=self._chars.typecode).astype(np.int64)
+        model = np.frombuffer(self._model, dtype=self._model.typecode).astype(np.int64)
+        conv = np.frombuffer(self._conv, dtype=self._conv.typecode).astype(np.int64)
+        valid = (ts >= STATS_TIME_RANGE[0]) & (ts < STATS_TIME_RANGE[1])
+        month = np.full(len(ts), -1, dtype=np.int64)
+        dated = ts[valid]
+        if len(dated):
+            # Month of every day in the block's range as a lookup table
+            # (much cheaper than converting each timestamp to datetime64[M])
+            days = (dated // 86400).astype(np.int64)
+            first_day = int(days.min())
+            table = np.arange(first_day, int(days.max()) + 1).astype("datetime64[D]").astype("datetime64[M]")
+            month[valid] = table.astype(np.int64)[days - first_day]
+        n_roles, n_models = len(self.roles), len(self.models)
+        # Dense group keys: (month - first month) * roles + role
+        base = int(month.min())
+        key = (month - base) * n_roles + role
+        counts = np.bincount(key)
+        keys = np.flatnonzero(counts)
+        sums = np.bincount(key, weights=chars)[keys]
+        # Conversations per model: distinct (conversation, model) pairs; the
+        # conversation column ascends, so block-local numbers stay small
+        pair = (conv - int(conv[0])) * n_models + model
+        size = -(-(int(pair.max()) + 1) // n_models) * n_models  # whole rows of n_models
+        if size <= 4 * len(pair):
+            model_convs = (np.bincount(pair, minlength=size) > 0).reshape(-1, n_models).sum(axis=0)
+        else:
+            model_convs = np.bincount(np.unique(pair) % n_models, minlength=n_models)
+        self._add_totals(keys // n_roles + base, keys % n_roles, counts[keys], sums,
+                         np.bincount(model, minlength=n_models), np.bincount(model, weights=chars, minlength=n_models),
+                         model_convs,
+                         float(dated.min()) if len(dated) else None, float(dated.max()) if len(dated) else None)
+
+    def _reduce_array(self) -> None:
+        lo, hi = STATS_TIME_RANGE
+        n_models = len(self.models)
+        groups: Dict[Tuple[int, int], List[int]] = {}
+        model_counts, model_chars, model_convs = [0] * n_models, [0] * n_models, [0] * n_models
+        day_months: Dict[int, int] = {}
+        first = last = None
+        seen = set()
+        for ts, role, chars, model, conv in zip(self._ts, self._role, self._chars, self._model, self._conv):
+            if lo <= ts < hi:
+                day = int(ts // 86400)
+                month = day_months.get(day)
+                if month is None:
+                    date = dt.date.fromordinal(_EPOCH_ORDINAL + day)
+                    month = day_months[day] = (date.year - 1970) * 12 + date.month - 1
+                if first is None or ts < first:
+                    first = ts
+                if last is None or ts > last:
+                    last = ts
+            else:
+                month = -1
+            totals = groups.get((month, role))
+            if totals is None:
+                totals = groups[(month, role)] = [0, 0]
+            totals[0] += 1
+            totals[1] += chars
+            model_counts[model] += 1
+            model_chars[model] += chars
+            if (conv, model) not in seen:
+                seen.add((conv, model))
+                model_convs[model] += 1
+        keys = sorted(groups)
+        self._add_totals([k[0] for k in keys], [k[1] for k in keys], [groups[k][0] for k in keys],
+                         [groups[k][1] for k in keys], model_counts, model_chars, model_convs, first, last)
+
+    def _lengths(self) -> Tuple[List[int], List[int], List[int]]:
+        """Bucket counts, sorted message counts and the indexes of the longest conversations."""
+        n = len(self.conv_messages)
+        edges = STATS_LENGTH_EDGES
+        if self.np is not None:
+            np = self.np
+            msgs = np.frombuffer(self.conv_messages, dtype=self.conv_messages.typecode).astype(np.int64)
+            chars = np.frombuffer(self.conv_chars, dtype=self.conv_chars.typecode).astype(np.int64)
+            buckets = np.bincount(np.searchsorted(edges, msgs, side="right"), minlength=len(edges) + 1)
+            longest = np.lexsort((np.arange(n), -chars, -msgs))[:STATS_LONGEST]
+            return buckets.tolist(), np.sort(msgs).tolist(), longest.tolist()
+        buckets = [0] * (len(edges) + 1)
+        for count in self.conv_messages:
+            buckets[bisect.bisect_right(edges, count)] += 1
+        msgs, chars = self.conv_messages, self.conv_chars
+        longest = heapq.nsmallest(STATS_LONGEST, range(n), key=lambda i: (-msgs[i], -chars[i], i))
+        return buckets, sorted(msgs), longest
+
+    def result(self) -> Dict[str, Any]:
+        self._reduce()
+        buckets, ordered, longest = self._lengths()
+
+        def rank(p):  # nearest-rank percentile
+            return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)] if ordered else 0
+
+        messages = sum(self.conv_messages)
+        return {
+            "backend": self.backend,
+            "conversations": len(self.ids),
+            "messages": messages,
+            "characters": sum(self.conv_chars),
+            "first_time": iso_from_ts(self.first_ts),
+            "last_time": iso_from_ts(self.last_ts),
+            "month_timezone": "UTC",
+            "by_month_role": [{"month": _month_label(month), "role": role, "messages": m, "characters": c}
+                              for (month, role), (m, c) in sorted(self.by_month.items(),
+                                                                  key=lambda kv: (kv[0][0] < 0, kv[0]))],
+            "by_model": [{"model": model, "messages": m, "characters": c, "conversations": k}
+                         for model, (m, c, k) in sorted(self.by_model.items(), key=lambda kv: (-kv[1][1], kv[0]))
+                         if model],
+            "conversation_lengths": {
+                "buckets": [{"messages": _length_bucket(i), "conversations": count} for i, count in enumerate(buckets)],
+                "mean": round(messages / len(ordered), 2) if ordered else 0,
+                "p50": rank(50), "p90": rank(90), "p99": rank(99), "max": ordered[-1] if ordered else 0,
+            },
+            "longest": [{"conversation_id": self.ids[i], "title": self.titles[i], "messages": self.conv_messages[i],
+                         "characters": self.conv_chars[i]} for i in longest],
+        }
+
+def write_stats(out_dir: str, stats: Dict[str, Any]) -> None:
+    """stats.json plus one CSV per table (stats_months/models/lengths/longest.csv)."""
+    with open(os.path.join(out_dir, STATS_FILE), "w", encoding="utf-8") as w:
+        json.dump(stats, w, ensure_ascii=False, indent=2)
+    tables = [("stats_months.csv", "by_month_role", ["month", "role", "messages", "characters"]),
+              ("stats_models.csv", "by_model", ["model", "messages", "characters", "conversations"]),
+              ("stats_lengths.csv", None, ["messages", "conversations"]),
+              ("stats_longest.csv", "longest", ["conversation_id", "title", "messages", "characters"])]
+    for name, key, header in tables:
+        rows = stats[key] if key else stats["conversation_lengths"]["buckets"]
+        _write_csv_rows(os.path.join(out_dir, name), header, ([row[h] for h in header] for row in rows))
+
+def split_part_files(path: str) -> List[str]:
+    """Part files of an earlier split in order (all partitions), or [path] for a file."""
+    if not os.path.isdir(path):
+        return [path]
+    partitions = read_partitions(path)
+    dirs = [os.path.join(path, p["path"]) for p in partitions] if partitions is not None else [path]
+    files = []
+    for d in dirs:
+        names = [name for name in os.listdir(d) if name.startswith("conversations_part_") and part_number(name) is not None]
+        files += [os.path.join(d, name) for name in sorted(names, key=part_number)]
+    return files
+
+# --resume: written after every finished part (plain output only)
+CHECKPOINT_FILE = "checkpoint.json"
+
+def checkpoint_options(args) -> Dict[str, Any]:
+    """Input and settings a resumed run must share with the interrupted one."""
+    return {"input": os.path.abspath(args.input) if args.input != "-" else "-",
+            "input_size": os.path.getsize(args.input) if args.input != "-" else None,
+            "max_convs": args.max_convs, "max_bytes": args.max_bytes, "format": args.format, "csv": args.csv,
+            "raw": args.raw, "branches": args.branches, "extras": args.extras,
+            "max_bytes_compressed": args.max_bytes_compressed}
+
+def write_checkpoint(out_dir: str, state: Dict[str, Any]) -> None:
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as w:
+        json.dump(state, w, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+def load_checkpoint(out_dir: str, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Checkpoint of an interrupted run in out_dir (None if there is none).
+
+    Exits if it was written for other input/settings or if the outputs are
+    shorter than recorded.
+    """
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("options") != options:
+        raise SystemExit("--resume: der Checkpoint gehört zu einer anderen Eingabe oder anderen Optionen "
+                         f"({path}). Bitte mit denselben Optionen fortsetzen oder ohne --resume neu starten.")
+    for name, size in state["files"].items():
+        fn = os.path.join(out_dir, name)
+        if not os.path.exists(fn) or os.path.getsize(fn) < size:
+            raise SystemExit(f"--resume: {fn} ist kürzer als im Checkpoint – bitte ohne --resume neu starten.")
+    return state
+
+def rollback_to_checkpoint(out_dir: str, state: Dict[str, Any]) -> None:
+    """Truncate the CSVs to the checkpoint and remove parts begun after it."""
+    for name, size in state["files"].items():
+        with open(os.path.join(out_dir, name), "r+b") as f:
+            f.truncate(size)
+    for name in os.listdir(out_dir):
+        n = part_number(name)
+        if name.startswith("conversations_part_") and n is not None and n >= state["part_idx"]:
+            os.remove(os.path.join(out_dir, name))
+
 def main():
     ap = argparse.ArgumentParser(description="Split ChatGPT conversations.json in Teile.")
-    ap.add_argument("-i", "--input", default="conversations.json", help="Pfad zu conversations.json")
+    ap.add_argument("-i", "--input", default="conversations.json", help="Pfad zu conversations.json ('-' = stdin)")
     ap.add_argument("-o", "--out-dir", default="parts", help="Zielordner")
     ap.add_argument("--max-convs", type=int, default=200, help="max. Unterhaltungen pro Teil")
     ap.add_argument("--max-bytes", type=parse_size, default=parse_size("50MB"), help="max. Dateigröße pro Teil, z.B. 50MB")
     ap.add_argument("--csv", action="store_true", help="auch eine messages.csv erzeugen")
+    ap.add_argument("--mmap", action="store_true", help="Eingabe per Memory-Mapping lesen (schnell auf SSD/NVMe; Fallback: Streaming)")
+    ap.add_argument("--format", choices=["json", "jsonl"], default="json", help="Format der Teile: json (ein Array je Datei) oder jsonl (eine Unterhaltung pro Zeile, Zeilenpositionen in offsets.csv)")
+    ap.add_argument("--raw", action="store_true", help="Unterhaltungen unverändert (Originalbytes) in die Teile kopieren, ohne neu zu serialisieren")
+    ap.add_argument("--compress", choices=sorted(COMPRESSION_EXT), help="Teile und CSVs komprimiert schreiben (zstd benötigt 'zstandard')")
+    ap.add_argument("--compress-level", type=int, default=None, help="Kompressionsstufe (Standard je Verfahren)")
+    ap.add_argument("--max-bytes-compressed", action="store_true", help="--max-bytes gilt für die komprimierte Größe (Schätzung über die bisherige Rate)")
+    ap.add_argument("--branches", action="store_true", help="messages.csv: auch alternative Zweige (neu generierte/bearbeitete Antworten) mit Spalte 'branch' ausgeben; sonst nur der aktive Verlauf")
+    ap.add_argument("--extras", action="store_true", help="messages.csv: auch Tool-Ausgaben, Code-Ergebnisse, Anhangsnamen, Bild-Platzhalter und Quellen aufnehmen")
+    ap.add_argument("--columnar", action="store_true", help="Nachrichten und Index zusätzlich spaltenweise schreiben (Parquet mit pyarrow, sonst eingebautes Format)")
+    ap.add_argument("--columnar-format", choices=["auto", "parquet", "builtin"], default="auto", help="Format für --columnar")
+    ap.add_argument("--incremental", action="store_true", help="vorherigen Lauf im Zielordner fortschreiben: nur neue/geänderte Unterhaltungen schreiben")
+    ap.add_argument("--workers", type=int, default=1, help="Anzahl Prozesse für Parsen/Serialisieren (Ausgabe identisch zum Einzelprozess)")
+    ap.add_argument("--pipeline", action="store_true", help="Lesen, Parsen und Schreiben in eigenen Threads überlappen (Ausgabe identisch)")
+    ap.add_argument("--pipeline-buffer", type=parse_size, default=PIPELINE_BUFFER, help="max. gepufferte Daten zwischen den Pipeline-Stufen, z.B. 64MB")
+    ap.add_argument("--memory-budget", type=parse_size, default=None, help="obere Grenze für Puffer (Lesen, Worker, Pipeline), z.B. 64MB; für mehrere Läufe parallel")
+    ap.add_argument("--progress", action="store_true", help="Fortschritt laufend anzeigen (MB/s, Unterhaltungen/s, RSS, Restzeit)")
+    ap.add_argument("--profile-out", metavar="DATEI", help="Zeiten je Verarbeitungsschritt und Durchsatz am Ende als JSON speichern")
+    ap.add_argument("--partition-by", choices=sorted(PARTITION_FORMATS), help="Teile, Index und messages.csv je Monat/Jahr (Beginn der Unterhaltung) in eigene Unterordner schreiben")
+    ap.add_argument("--resume", action="store_true", help="abgebrochenen Lauf im Zielordner ab dem letzten fertigen Teil fortsetzen (checkpoint.json)")
+    ap.add_argument("--get", metavar="ID", help="nur eine Unterhaltung (Original-JSON) aus einem früheren Lauf in --out-dir ausgeben")
+    ap.add_argument("--stats", action="store_true", help="Nutzungsstatistik (Nachrichten je Monat/Rolle, Längenverteilung, Zeichen je Modell, längste Unterhaltungen) als stats.json und stats_*.csv in den Zielordner schreiben; zählt dieselben Nachrichten wie messages.csv (mit --extras auch Tool-Nachrichten); nutzt NumPy, falls installiert")
+    ap.add_argument("--stats-only", action="store_true", help="nur die Statistik erstellen, ohne aufzuteilen; -i darf auch der Ordner eines früheren Laufs sein")
     args = ap.parse_args()
+    if args.memory_budget is not None and args.memory_budget < MIN_MEMORY_BUDGET:
+        ap.error(f"--memory-budget muss mindestens {MIN_MEMORY_BUDGET // 1024 // 1024}MB sein")
+
+    if args.get is not None:
+        raw = get_conversation_raw(args.out_dir, args.get)
+        if raw is None:
+            raise SystemExit(f"Unterhaltung {args.get!r} nicht gefunden in {args.out_dir}")
+        sys.stdout.buffer.write(raw + b"\n")
+        return
+
+    if args.stats_only:
+        collector = StatsCollector()
+        memory = plan_memory(args.memory_budget, args.workers) if args.memory_budget else None
+        for path in split_part_files(args.input):
+            for record in iter_prepared(path, False, workers=args.workers, use_mmap=args.mmap and not memory,
+                                        raw_mode=True, extras=args.extras, memory=memory, stats=True):
+                collector.add(record[0], record[1], record[7])
+        os.makedirs(args.out_dir, exist_ok=True)
+        stats = collector.result()
+        write_stats(args.out_dir, stats)
+        print(f"Statistik ({stats['backend']}): {stats['conversations']} Unterhaltungen, "
+              f"{stats['messages']} Nachrichten -> {os.path.join(args.out_dir, STATS_FILE)}")
+        return
 
     os.makedirs(args.out_dir, exist_ok=True)
 
-    index_path = os.path.join(args.out_dir, "index.csv")
-    # UTF-8 mit BOM (utf-8-sig), damit Excel unter Windows Umlaute sicher korrekt erkennt
-    idx_f = open(index_path, "w", newline="", encoding="utf-8-sig")
-    idx_writer = csv.writer(idx_f)
-    idx_writer.writerow(["conversation_id","title","messages","first_time","last_time","part_file"])
+    if args.incremental:
+        if (args.compress or args.columnar or args.branches or args.extras or args.progress or args.profile_out
+                or args.resume or args.partition_by or args.format != "json" or args.stats):
+            ap.error("--incremental kann (noch) nicht mit --compress/--columnar/--branches/--extras/--progress/"
+                     "--profile-out/--resume/--partition-by/--format jsonl/--stats kombiniert werden")
+        manifest = split_incremental(args)
+        print(f"Inkrementell: {len(manifest['added'])} neu, {len(manifest['changed'])} geändert, "
+              f"{len(manifest['removed'])} entfernt, {manifest['unchanged']} unverändert (siehe manifest.json)")
+        print_summary(args.out_dir)
+        return
 
-    msg_writer = None
-    if args.csv:
-        # Auch hier utf-8-sig für bessere Excel-Kompatibilität
-        msg_f = open(os.path.join(args.out_dir, "messages.csv"), "w", newline="", encoding="utf-8-sig")
-        msg_writer = csv.writer(msg_f)
-        msg_writer.writerow(["conversation_id","title","time","role","text"])
+    # Checkpoints need a single output that can be truncated, i.e. no
+    # compression, no columnar row groups and no partitions; --stats totals
+    # are not part of the checkpoint
+    if args.resume and (args.compress or args.columnar or args.partition_by or args.stats):
+        ap.error("--resume kann (noch) nicht mit --compress/--columnar/--partition-by/--stats kombiniert werden")
+    checkpoints = not (args.compress or args.columnar or args.partition_by)
+    state = None
+    if args.resume:
+        state = load_checkpoint(args.out_dir, checkpoint_options(args))
+        if state is None:
+            print("Hinweis: keine checkpoint.json im Zielordner – vollständiger Lauf.", file=sys.stderr)
+        else:
+            rollback_to_checkpoint(args.out_dir, state)
+            print(f"Setze fort ab Teil {state['part_idx']} ({state['conversations']} Unterhaltungen bereits fertig).")
 
-    buf, part_idx, cur_bytes = [], 1, 0
+    outputs: Dict[str, SplitOutput] = {}
 
-    def flush():
-        nonlocal buf, part_idx, cur_bytes
-        if not buf:
-            return None
-        fn = write_part(part_idx, buf, args.out_dir)
-        part_idx += 1
-        cur_bytes = 0
-        buf = []
-        return fn
+    def output_for(first_ts: Optional[float], last_ts: Optional[float]) -> SplitOutput:
+        key = partition_of(first_ts if first_ts is not None else last_ts, args.partition_by) \
+            if args.partition_by else ""
+        out = outputs.get(key)
+        if out is None:
+            out = outputs[key] = SplitOutput(os.path.join(args.out_dir, key) if key else args.out_dir, args, state)
+        return out
 
-    for conv in iter_top_level_objects(args.input):
-        # Prepare stats for index
-        conv_id = conv.get("id")
-        title = conv.get("title")
-        msgs, first_ts, last_ts = summarize_conversation(conv)
+    if not args.partition_by:
+        output_for(None, None)
 
+    memory, pipeline_bytes = None, (args.pipeline_buffer if args.pipeline else 0)
+    if args.memory_budget:
+        memory = plan_memory(args.memory_budget, args.workers, args.pipeline)
+        pipeline_bytes = memory.pipeline_bytes
+        if args.mmap:
+            print("Hinweis: --mmap wird mit --memory-budget ignoriert (gemappte Seiten zählen zum RSS).",
+                  file=sys.stderr)
+            args.mmap = False
+    telemetry = Telemetry(args.input, args.progress) if args.progress or args.profile_out else None
+    clock = time.perf_counter
+    input_offsets = collections.deque() if checkpoints else None
+    options = checkpoint_options(args) if checkpoints else None
+    done = state["conversations"] if state else 0
+    collector = StatsCollector() if args.stats else None
+    records = iter_prepared(args.input, args.csv or args.columnar, workers=args.workers,
+                            use_mmap=args.mmap, raw_mode=args.raw, branches=args.branches, telemetry=telemetry,
+                            extras=args.extras, pipeline_bytes=pipeline_bytes, memory=memory,
+                            start=state["input_offset"] if state else 0, offsets=input_offsets,
+                            stats=args.stats)
+    for conv_id, title, msgs, first_ts, last_ts, messages, data, stats_rows in records:
+        out = output_for(first_ts, last_ts)
+        parts = out.parts
+        if input_offsets is not None:
+            # Finish the part before this conversation's rows are written, so
+            # the checkpoint covers exactly the conversations before it
+            offset = input_offsets.popleft()
+            if parts.full(len(data)):
+                parts.flush()
+                write_checkpoint(args.out_dir, {
+                    "options": options, "input_offset": offset, "part_idx": parts.part_idx,
+                    "conversations": done, "files": out.positions()})
+            done += 1
+        t0 = clock() if telemetry is not None else 0.0
         # If CSV requested, stream messages out
-        if msg_writer is not None:
-            mapping = conv.get("mapping") or {}
-            for node in mapping.values():
-                msg = (node or {}).get("message") or {}
-                role = (msg.get("author") or {}).get("role")
-                if role not in ("user","assistant"):
-                    continue
-                ts = msg.get("create_time")
-                txt = clean_text_from_message_content((msg.get("content") or {}))
-                msg_writer.writerow([conv_id, title, iso_from_ts(ts), role, txt])
+        if messages and out.msg_writer is not None:
+            out.msg_writer.writerows(csv_rows(conv_id, title, messages, args.branches))
+
+        # ✅ FIX 4: part_file is returned AFTER a potential flush (ensures correct part index)
+        if telemetry is not None:
+            t1 = clock()
+            part_name = parts.add(data)
+            t2 = clock()
+        else:
+            part_name = parts.add(data)
 
-        # Calculate conversation size
-        conv_bytes = len(json.dumps(conv, ensure_ascii=False).encode("utf-8"))
-        
-        # ✅ FIX 1+2: Flush BEFORE adding if would exceed limit (handles edge case: single conv > max_bytes)
-        if buf and (len(buf) >= args.max_convs or cur_bytes + conv_bytes > args.max_bytes):
-            flush()
-        
-        # Add to buffer
-        buf.append(conv)
-        cur_bytes += conv_bytes
-        
         # ✅ FIX 3: Warn if single conversation exceeds max_bytes
+        conv_bytes = parts.size_estimate(len(data))
         if conv_bytes > args.max_bytes:
             print(f"⚠️  Warning: Conversation {conv_id[:8] if conv_id else 'unknown'} "
                   f"({conv_bytes/1024/1024:.1f}MB) exceeds max_bytes limit", file=sys.stderr)
+        if args.memory_budget and len(data) > args.memory_budget:
+            print(f"⚠️  Warning: Conversation {conv_id[:8] if conv_id else 'unknown'} "
+                  f"({len(data)/1024/1024:.1f}MB) exceeds --memory-budget", file=sys.stderr)
 
-        # ✅ FIX 4: Determine part_file AFTER potential flush (ensures correct part index)
-        part_name = f"conversations_part_{part_idx:03d}.json"
-        idx_writer.writerow([conv_id, title, msgs, iso_from_ts(first_ts), iso_from_ts(last_ts), part_name])
+        out.add_index(conv_id, title, msgs, first_ts, last_ts, part_name, messages)
+        if collector is not None:
+            collector.add(conv_id, title, stats_rows)
+        if telemetry is not None:
+            telemetry.stages["csv"] += clock() - t2 + t1 - t0
+            telemetry.stages["write"] += t2 - t1
+            telemetry.tick()
 
     # flush remainder
-    flushed = flush()
-    if msg_writer is not None:
-        msg_f.close()
-    idx_f.close()
-
-    print("Fertig. Teile liegen in:", os.path.abspath(args.out_dir))
-    print("  - index.csv (Übersicht)")
-    if os.path.exists(os.path.join(args.out_dir, "messages.csv")):
-        print("  - messages.csv (alle Nachrichten tabellarisch)")
-    for name in sorted(os.listdir(args.out_dir)):
-        if name.startswith("conversations_part_") and name.endswith(".json"):
+    t0 = clock()
+    for out in outputs.values():
+        out.parts.close()
+    if telemetry is not None:
+        telemetry.stages["write"] += clock() - t0
+    for out in outputs.values():
+        out.close()
+    if args.partition_by:
+        write_partitions(args.out_dir, args.partition_by, outputs)
+    if collector is not None:
+        write_stats(args.out_dir, collector.result())
+    if checkpoints:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(args.out_dir, CHECKPOINT_FILE))
+
+    if telemetry is not None:
+        stats = telemetry.finish()
+        if args.profile_out:
+            stats["workers"] = args.workers
+            with open(args.profile_out, "w", encoding="utf-8") as w:
+                json.dump(stats, w, ensure_ascii=False, indent=2)
+    print_summary(args.out_dir)
+
+def print_summary(out_dir: str) -> None:
+    print("Fertig. Teile liegen in:", os.path.abspath(out_dir))
+    names = sorted(os.listdir(out_dir))
+    if STATS_FILE in names:
+        print(f"  - {STATS_FILE} (Statistik; Tabellen in stats_*.csv)")
+    partitions = read_partitions(out_dir)
+    if partitions is not None:
+        for partition in partitions:
+            print(f"  - {partition['path']}/ ({partition['conversations']} Unterhaltungen)")
+        return
+    for name in names:
+        if name.startswith("index.csv"):
+            print(f"  - {name} (Übersicht)")
+    for name in names:
+        if name.startswith("messages.csv") and not name.endswith(".sqlite"):
+            print(f"  - {name} (alle Nachrichten tabellarisch)")
+    for name in names:
+        if name.startswith("conversations_part_"):
             print("  -", name)
 
 if __name__ == "__main__":